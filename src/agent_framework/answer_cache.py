@@ -0,0 +1,126 @@
+"""
+Semantic answer cache for the Research Agent (opt-in, ANSWER_CACHE_ENABLED=true).
+
+Paraphrased questions ("surfing beaches" / "where can I surf") get the same
+grounded answer, so a full search + generation can be skipped when a previously
+answered question is close enough in embedding space. Question embeddings are
+kept L2-normalized in one preallocated float32 matrix; a lookup is a single
+matrix-vector product over the live slots.
+
+- bounded: ANSWER_CACHE_SIZE slots, least recently used slot is reused
+- time-limited: ANSWER_CACHE_TTL_SECONDS
+- invalidated on index change (same index version as retrieval_cache)
+- ANSWER_CACHE_THRESHOLD: minimum cosine similarity for a hit
+
+The best similarity of every lookup is bucketed into a histogram so the
+threshold can be tuned from observed traffic.
+"""
+
+import os
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+SIMILARITY_BUCKETS = 20  # 0.05-wide buckets over [0, 1]
+
+
+class SemanticAnswerCache:
+    """Nearest-neighbour lookup over previously answered questions."""
+
+    def __init__(
+        self,
+        dimensions: int,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600.0,
+        threshold: float = 0.95
+    ):
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.version: Optional[str] = None
+
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)  # 0 = empty slot
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._answers: Dict[int, str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.similarity_histogram = np.zeros(SIMILARITY_BUCKETS, dtype=np.int64)
+
+    @classmethod
+    def from_env(cls, dimensions: int) -> Optional["SemanticAnswerCache"]:
+        """Build from ANSWER_CACHE_* variables; None unless ANSWER_CACHE_ENABLED is set."""
+        if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() not in ["1", "true", "yes"]:
+            return None
+        return cls(
+            dimensions=dimensions,
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        )
+
+    def set_version(self, version: Optional[str]) -> bool:
+        """Record the current index version; clears all answers if it changed."""
+        if version == self.version:
+            return False
+        self._expires_at[:] = 0
+        self._answers.clear()
+        self.version = version
+        return True
+
+    def _normalize(self, vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        if array.shape != (self.dimensions,):
+            raise ValueError(f"Expected embedding of shape ({self.dimensions},), got {array.shape}")
+        return array / (np.linalg.norm(array) or 1.0)
+
+    def lookup(self, query_vector: Sequence[float]) -> Tuple[Optional[str], float]:
+        """
+        Find the closest live question.
+
+        Returns:
+            (answer or None, best cosine similarity - 0.0 when the cache is empty)
+        """
+        now = time.time()
+        live = np.flatnonzero(self._expires_at > now)
+        best_similarity = 0.0
+        answer = None
+
+        if len(live):
+            scores = self._vectors[live] @ self._normalize(query_vector)
+            best = int(np.argmax(scores))
+            best_similarity = float(scores[best])
+            if best_similarity >= self.threshold:
+                slot = int(live[best])
+                self._last_used[slot] = now
+                answer = self._answers[slot]
+
+        bucket = min(int(max(best_similarity, 0.0) * SIMILARITY_BUCKETS), SIMILARITY_BUCKETS - 1)
+        self.similarity_histogram[bucket] += 1
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer, best_similarity
+
+    def put(self, query_vector: Sequence[float], answer: str) -> None:
+        """Store an answer, reusing an empty/expired slot or else the least recently used one."""
+        now = time.time()
+        free = np.flatnonzero(self._expires_at <= now)
+        slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+
+        self._vectors[slot] = self._normalize(query_vector)
+        self._expires_at[slot] = now + self.ttl_seconds
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires_at > time.time()))
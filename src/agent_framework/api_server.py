@@ -10,6 +10,7 @@ from typing import Optional
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 # OpenTelemetry imports for tracing
@@ -18,8 +19,9 @@ from azure.monitor.opentelemetry import configure_azure_monitor
 from azure.ai.inference.tracing import AIInferenceInstrumentor
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
-from main_agent_workflow import MainAgentWorkflow
+from main_agent_workflow import MainAgentWorkflow, get_research_agent, get_tool_agent, warm_up_agents
 from masking import mask_content
+from local_index import index_path_from_env, missing_index_files
 
 # Load environment variables
 load_dotenv()
@@ -42,6 +44,7 @@ app = FastAPI(title="Agent Framework API", version="1.0.0")
 
 # Global variables
 main_agent: Optional[MainAgentWorkflow] = None
+warmup_report: Optional[dict] = None
 
 # Request/Response models
 class AgentRequest(BaseModel):
@@ -71,7 +74,7 @@ async def shutdown_event():
 @app.on_event("startup")
 async def startup_event():
     """Initialize agents on startup"""
-    global main_agent
+    global main_agent, warmup_report
     
     try:
         logger.info("Initializing Agent Framework Service...")
@@ -98,6 +101,16 @@ async def startup_event():
         search_endpoint = os.getenv("SEARCH_ENDPOINT")
         search_index = os.getenv("SEARCH_INDEX")
         
+        # The local retriever has no fallback - refuse to start without its index
+        if os.getenv("RESEARCH_RETRIEVER", "azure_search").lower() == "local":
+            index_path = index_path_from_env()
+            missing = missing_index_files(index_path)
+            if missing:
+                raise RuntimeError(
+                    f"RESEARCH_RETRIEVER=local but {index_path} is missing {', '.join(missing)} - "
+                    f"build it with local_index.py before building the image"
+                )
+        
         # Create main agent with workflow orchestration
         main_agent = MainAgentWorkflow()
         
@@ -106,6 +119,12 @@ async def startup_event():
         logger.info(f"Research Agent (RAG): {'Enabled' if search_index else 'Disabled'}")
         logger.info(f"Orchestrator: Enabled")
         
+        # Warm every agent concurrently so the first request doesn't pay for
+        # credentials, client creation and the MCP handshake
+        if os.getenv("AGENT_WARMUP_ENABLED", "true").lower() in ["1", "true", "yes"]:
+            warmup_report = await warm_up_agents()
+            logger.info(f"Agent warm-up completed in {warmup_report['total_ms']}ms")
+        
     except Exception as e:
         logger.error(f"Startup failed: {e}", exc_info=True)
         raise
@@ -133,7 +152,8 @@ async def health():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "service": "Agent Framework API Server"
+        "service": "Agent Framework API Server",
+        "warmup": warmup_report
     }
 
 
@@ -171,6 +191,48 @@ async def chat_with_main_agent(request: AgentRequest):
             raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/tool-agent/chat/stream")
+async def stream_tool_agent(request: AgentRequest):
+    """Chat with the tool agent directly, streaming the answer as plain-text deltas"""
+    tool_agent = await get_tool_agent()
+    if not tool_agent:
+        raise HTTPException(status_code=503, detail="Tool agent not initialized")
+    
+    logger.info(f"Tool Agent (stream): {mask_content(request.message)[:100]}...")
+    
+    async def stream_deltas():
+        try:
+            async for delta in tool_agent.run_stream(request.message):
+                yield delta
+        except Exception as e:
+            # Headers are already sent - report the error in-band
+            logger.error(f"Streaming error: {e}")
+            yield f"\n⚠️ Tool Agent error: {str(e)}"
+    
+    return StreamingResponse(stream_deltas(), media_type="text/plain; charset=utf-8")
+
+
+@app.post("/research-agent/chat/stream")
+async def stream_research_agent(request: AgentRequest):
+    """Chat with the research agent directly, streaming the answer (with citations) as plain-text deltas"""
+    research_agent = await get_research_agent()
+    if not research_agent:
+        raise HTTPException(status_code=503, detail="Research agent not initialized")
+    
+    logger.info(f"Research Agent (stream): {mask_content(request.message)[:100]}...")
+    
+    async def stream_deltas():
+        try:
+            async for delta in research_agent.run_stream(request.message):
+                yield delta
+        except Exception as e:
+            # Headers are already sent - report the error in-band
+            logger.error(f"Streaming error: {e}")
+            yield f"\n⚠️ Research Agent error: {str(e)}"
+    
+    return StreamingResponse(stream_deltas(), media_type="text/plain; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,84 @@
+"""
+Lab 3 style citation injection for Research Agent answers.
+
+Every second sentence gets the next 【N:0†source】 marker (up to the number of
+documents in the prompt), matching what ResearchAgent produced before. The
+injector is single pass and incremental: feed() accepts text as it streams from
+the model and returns what can be emitted safely; only a trailing sentence
+terminal (whose following character is not known yet) is held back.
+
+Usage:
+    injector = CitationInjector(num_sources=3)
+    for chunk in stream:
+        yield injector.feed(chunk)
+    yield injector.close()
+"""
+
+import re
+from typing import List
+
+# Sentence terminal followed by whitespace (only the last of "..." / "?!" matches)
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s)")
+_TERMINALS = ".!?"
+
+
+def citation_marker(index: int) -> str:
+    return f"【{index}:0†source】"
+
+
+class CitationInjector:
+    """Incremental citation injector (one instance per answer)."""
+
+    def __init__(self, num_sources: int, every: int = 2):
+        """
+        Args:
+            num_sources: Number of documents given to the model (citations 1..num_sources)
+            every: Cite every Nth sentence
+        """
+        self.num_sources = num_sources
+        self.every = every
+        self.citations_added = 0
+        self._sentence_count = 0
+        self._pending = ""
+
+    def _process(self, text: str) -> str:
+        parts: List[str] = []
+        last = 0
+        for match in _SENTENCE_END_RE.finditer(text):
+            end = match.end()
+            parts.append(text[last:end])
+            last = end
+            self._sentence_count += 1
+            if self._sentence_count % self.every == 0 and self.citations_added < self.num_sources:
+                self.citations_added += 1
+                parts.append(citation_marker(self.citations_added))
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def feed(self, chunk: str) -> str:
+        """Add streamed text; returns the text (with citations) that is final."""
+        if self.num_sources <= 0:
+            return chunk
+
+        text = self._pending + chunk
+        # A terminal at the very end may or may not be followed by whitespace - wait
+        hold = len(text)
+        while hold > 0 and text[hold - 1] in _TERMINALS:
+            hold -= 1
+        self._pending = text[hold:]
+        return self._process(text[:hold]) if hold else ""
+
+    def close(self) -> str:
+        """Flush held-back text at the end of the answer."""
+        text, self._pending = self._pending, ""
+        # End of answer counts as no following whitespace (same as before)
+        return text
+
+
+def add_citations(response: str, num_sources: int, every: int = 2) -> str:
+    """Inject citations into a complete response."""
+    if num_sources <= 0:
+        return response
+    injector = CitationInjector(num_sources, every)
+    return (injector.feed(response) + injector.close()).strip()
+
@@ -0,0 +1,144 @@
+"""
+Token-budgeted context packing for the Research Agent prompt.
+
+Replaces the fixed content[:500] cut. Given ranked search results, the packer:
+1. drops documents scoring below CONTEXT_MIN_SCORE_RATIO x the best score
+2. splits CONTEXT_TOKEN_BUDGET across the rest in proportion to their scores
+   (budget a short document does not use rolls over to the next one)
+3. cuts each document at a sentence boundary inside its share (the kept prefix
+   is the original text, so newlines and list formatting survive); a document
+   whose first sentence does not fit is dropped rather than sent as a fragment
+
+Tokens are counted with tiktoken for the chat model. If the encoding cannot be
+loaded (e.g. no network to fetch the BPE file), a character-based estimate is
+used instead so retrieval keeps working.
+"""
+
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends: Latin/CJK terminal punctuation followed by whitespace, or a newline
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+
+# Tokens for the per-document header/footer lines in ResearchAgent._format_search_results
+DOCUMENT_OVERHEAD_TOKENS = 30
+
+
+def load_token_counter(model: Optional[str]) -> Callable[[str], int]:
+    """tiktoken counter for model, falling back to ~4 characters per token."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable - estimating tokens from length: {e}")
+        return lambda text: (len(text) + 3) // 4
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the sentences in text (terminal punctuation kept, separators excluded)."""
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        if text[start:match.start()].strip():
+            spans.append((start, match.start()))
+        start = match.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences (terminal punctuation kept)."""
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+class ContextPacker:
+    """Fits ranked documents into a prompt token budget."""
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        token_budget: int = 1500,
+        min_score_ratio: float = 0.4
+    ):
+        """
+        Args:
+            model: Chat model deployment name (selects the tiktoken encoding)
+            token_budget: Total tokens for document content + headers
+            min_score_ratio: Documents below this fraction of the best score are dropped
+        """
+        self.token_budget = token_budget
+        self.min_score_ratio = min_score_ratio
+        self.count_tokens = load_token_counter(model)
+
+    @classmethod
+    def from_env(cls, model: Optional[str] = None) -> "ContextPacker":
+        """Build from CONTEXT_TOKEN_BUDGET / CONTEXT_MIN_SCORE_RATIO."""
+        return cls(
+            model=model,
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+            min_score_ratio=float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.4")),
+        )
+
+    def _fit(self, text: str, budget: int) -> Tuple[str, int]:
+        """Longest sentence prefix of text within budget tokens (cut in the original text)."""
+        kept_end = 0
+        used = 0
+        for _, end in sentence_spans(text):
+            # The separator before the sentence (space, newline, list marker line break) counts too
+            tokens = self.count_tokens(text[kept_end:end])
+            if used + tokens > budget:
+                break
+            kept_end = end
+            used += tokens
+        return text[:kept_end].strip(), used
+
+    def pack(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Select and trim results for the prompt.
+
+        Args:
+            results: Search results, best first, each with "content" and "score"
+
+        Returns:
+            Kept results (same order) with "content" trimmed and a "tokens" count
+        """
+        if not results:
+            return []
+
+        top_score = max(result.get("score", 0.0) for result in results)
+        candidates = [
+            result for result in results
+            if top_score <= 0 or result.get("score", 0.0) >= self.min_score_ratio * top_score
+        ]
+
+        packed: List[Dict[str, Any]] = []
+        remaining_budget = self.token_budget
+        remaining_weight = sum(max(result.get("score", 0.0), 0.0) for result in candidates)
+
+        for position, result in enumerate(candidates):
+            weight = max(result.get("score", 0.0), 0.0)
+            share = (
+                remaining_budget * weight / remaining_weight
+                if remaining_weight > 0
+                else remaining_budget / (len(candidates) - position)
+            )
+            remaining_weight -= weight
+
+            content_budget = int(share) - DOCUMENT_OVERHEAD_TOKENS
+            content, used = self._fit(result.get("content", ""), content_budget) if content_budget > 0 else ("", 0)
+            if not content:
+                continue
+
+            packed.append({**result, "content": content, "tokens": used + DOCUMENT_OVERHEAD_TOKENS})
+            remaining_budget -= used + DOCUMENT_OVERHEAD_TOKENS
+
+        return packed
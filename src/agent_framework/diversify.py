@@ -0,0 +1,103 @@
+"""
+Post-retrieval diversification for the Research Agent.
+
+- adaptive_top_k: how many documents the query deserves, from the shape of the
+  score curve - cut at a pronounced score gap instead of always keeping 5
+- mmr: maximal marginal relevance over document embeddings, so similar
+  documents (several Jeju nature spots with similar text) move to the end,
+  where the context packer's token budget trims them first; near-duplicates
+  above a similarity threshold are dropped so only distinct documents reach
+  the prompt
+
+Both are pure NumPy over at most a few dozen candidates.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+
+
+def adaptive_top_k(scores: Sequence[float], max_k: int, min_k: int = 1, gap_factor: float = 2.0) -> int:
+    """
+    Number of results to keep from a best-first score list.
+
+    Cuts after the largest drop between consecutive scores that leaves at least
+    min_k results, when that drop is at least gap_factor x the mean drop (a clear
+    "elbow"). If the only elbow comes before min_k (one or two strong hits, then
+    a flat tail), keeps min_k. Without an elbow keeps max_k.
+
+    Args:
+        scores: Relevance scores, best first
+        max_k: Upper bound
+        min_k: Lower bound (at least 1)
+        gap_factor: Elbow strength required to cut (<= 0 disables the cut)
+    """
+    min_k = max(1, min_k)
+    scores = np.asarray(scores[:max_k], dtype=np.float64)
+    if len(scores) <= min_k or gap_factor <= 0:
+        return min(len(scores), max_k)
+
+    gaps = scores[:-1] - scores[1:]
+    mean_gap = gaps.mean()
+    if mean_gap <= 0:
+        return len(scores)
+    threshold = gap_factor * mean_gap
+
+    # Only cut points that leave at least min_k results are eligible
+    eligible = gaps[min_k - 1:]
+    cut = int(np.argmax(eligible))
+    if eligible[cut] >= threshold:
+        return min_k + cut
+    if gaps[:min_k - 1].max(initial=0.0) >= threshold:
+        return min_k
+    return len(scores)
+
+
+def mmr(
+    query_vector: Sequence[float],
+    doc_vectors: np.ndarray,
+    k: int,
+    lambda_: float = 0.7,
+    max_similarity: float = 1.0,
+) -> List[int]:
+    """
+    Maximal marginal relevance selection.
+
+    score(d) = lambda * sim(query, d) - (1 - lambda) * max(sim(d, selected))
+
+    Args:
+        query_vector: Query embedding
+        doc_vectors: (N, D) candidate embeddings
+        k: Number of documents to select
+        lambda_: 1.0 = pure relevance, 0.0 = pure diversity
+        max_similarity: Candidates more similar than this to an already selected
+            document are dropped as near-duplicates (1.0 keeps every candidate)
+
+    Returns:
+        Selected row indices in selection order (fewer than k if near-duplicates were dropped)
+    """
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    docs = docs / np.maximum(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = docs @ query
+    pairwise = docs @ docs.T
+    k = min(k, len(docs))
+
+    selected: List[int] = []
+    # Highest similarity of each candidate to anything already selected
+    redundancy = np.full(len(docs), -np.inf, dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    for _ in range(k):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * penalty, -np.inf)
+        if not np.isfinite(scores).any():
+            break
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        if max_similarity < 1.0:
+            available &= redundancy <= max_similarity
+    return selected
@@ -0,0 +1,219 @@
+"""Query-embedding cache for the research path.
+
+Repeated and near-identical questions ("Jeju family trip", the eval queries)
+would otherwise re-embed the same text on every request. Entries are keyed by
+normalized text + embedding model + dimensions and kept as float32 arrays:
+
+- memory: bounded LRU (EMBEDDING_CACHE_SIZE entries)
+- disk (optional): memory-mapped float32 matrix + append-only key log under
+  EMBEDDING_CACHE_PATH, reloaded on restart. Rows are reused ring-buffer style
+  once EMBEDDING_CACHE_DISK_CAPACITY is reached.
+
+Usage:
+    cache = EmbeddingCache.from_env(model="text-embedding-3-large", dimensions=3072)
+    vector = cache.get(query)
+    if vector is None:
+        vector = await embed(query)
+        cache.put(query, vector)
+
+The disk store is per-process; do not share one path between workers.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize, lowercase and collapse whitespace."""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+class _DiskStore:
+    """Memory-mapped float32 rows plus a `key\\trow` log compacted on load and on wrap-around."""
+
+    def __init__(self, path: str, dimensions: int, capacity: int, namespace: str):
+        os.makedirs(path, exist_ok=True)
+        self.dimensions = dimensions
+        self.capacity = capacity
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.log")
+        meta_path = os.path.join(path, "meta.json")
+        meta = {"namespace": namespace, "dimensions": dimensions, "capacity": capacity}
+
+        # Start fresh if the store was written for another model/shape
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) != meta:
+                    logger.warning(f"Embedding store at {path} does not match {meta} - resetting")
+                    for stale in (self._vectors_path, self._keys_path):
+                        if os.path.exists(stale):
+                            os.remove(stale)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, dimensions))
+
+        # Replay key log; later lines win and evict older keys on the same row
+        self._rows: Dict[str, int] = {}
+        self._row_keys: List[Optional[str]] = [None] * capacity
+        self._next_row = 0
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    key, _, row = line.rstrip("\n").partition("\t")
+                    if row.isdigit() and int(row) < capacity:
+                        self._assign(key, int(row))
+        self._keys_log = None
+        self._compact()
+
+    def _assign(self, key: str, row: int) -> None:
+        previous = self._row_keys[row]
+        if previous is not None:
+            self._rows.pop(previous, None)
+        self._row_keys[row] = key
+        self._rows[key] = row
+        self._next_row = (row + 1) % self.capacity
+
+    def _compact(self) -> None:
+        """Rewrite the key log with one line per live row, oldest first.
+
+        Rows are written starting at `_next_row` so that replaying the log
+        restores the same write position.
+        """
+        if self._keys_log is not None:
+            self._keys_log.close()
+        tmp_path = f"{self._keys_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for offset in range(self.capacity):
+                row = (self._next_row + offset) % self.capacity
+                key = self._row_keys[row]
+                if key is not None:
+                    f.write(f"{key}\t{row}\n")
+        os.replace(tmp_path, self._keys_path)
+        self._keys_log = open(self._keys_path, "a", encoding="utf-8")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._rows.get(key)
+        return None if row is None else np.array(self._vectors[row])
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        if key in self._rows:
+            return
+        row = self._next_row
+        self._vectors[row] = vector
+        self._vectors.flush()
+        self._assign(key, row)
+        self._keys_log.write(f"{key}\t{row}\n")
+        self._keys_log.flush()
+        # Every row has been rewritten once; drop the superseded lines
+        if self._next_row == 0:
+            self._compact()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def close(self) -> None:
+        self._vectors.flush()
+        self._keys_log.close()
+
+
+class EmbeddingCache:
+    """Bounded LRU of float32 embeddings with an optional memory-mapped disk tier."""
+
+    def __init__(
+        self,
+        model: str,
+        dimensions: int,
+        max_entries: int = 1024,
+        disk_path: Optional[str] = None,
+        disk_capacity: int = 4096,
+    ):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._disk = _DiskStore(disk_path, dimensions, disk_capacity, model) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, model: str, dimensions: int) -> Optional["EmbeddingCache"]:
+        """Build from EMBEDDING_CACHE_* variables; None when EMBEDDING_CACHE_SIZE=0."""
+        max_entries = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            model=model,
+            dimensions=dimensions,
+            max_entries=max_entries,
+            disk_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            disk_capacity=int(os.getenv("EMBEDDING_CACHE_DISK_CAPACITY", "4096")),
+        )
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model}\x1f{self.dimensions}\x1f{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.hits += 1
+                self.disk_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        if array.shape != (self.dimensions,):
+            raise ValueError(f"Expected embedding of shape ({self.dimensions},), got {array.shape}")
+
+        key = self.key(text)
+        self._remember(key, array)
+        if self._disk is not None:
+            self._disk.put(key, array)
+        return array
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
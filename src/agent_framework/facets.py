@@ -0,0 +1,186 @@
+"""
+Query facet extraction and search filters for the Research Agent.
+
+A question that names a place ("Jeju", "Gangwon-do", "경주"), a season ("fall",
+"단풍") or a difficulty ("easy hike") is turned into facets that narrow retrieval
+before scoring:
+- Azure AI Search: an OData $filter over the regions/seasons/difficulty fields
+  created in notebook 02 (and by passage_chunker.py)
+- Local index: a row mask applied to both BM25 and vector scoring
+
+Documents get the same facets from their title/tags (regions), metadata.season
+and metadata.difficulty, using the gazetteer in the "facets" section of
+intent_keywords.json. A document tagged with a place (e.g. Gangneung) is also in
+its province (Gangwon), so both "Gangneung" and "Gangwon" questions match it.
+
+This module only needs the standard library so notebook 02 can import it for
+the index upload.
+
+Usage:
+    facets = extract_facets("Fall foliage hikes in Gangwon-do")
+    facets.regions        # ("Gangwon",)
+    facets.seasons        # ("fall",)
+    facets.to_odata()     # "regions/any(r: search.in(r, 'Gangwon', '|')) and ..."
+"""
+from __future__ import annotations
+import json, os, re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from intent_matcher import IntentMatcher
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_keywords.json")
+
+SEASONS = ("spring", "summer", "fall", "winter")
+
+# "hot springs" is a place type, not a season
+_HOT_SPRING_RE = re.compile(r"hot\s+springs?|온천", re.IGNORECASE)
+
+FACET_FIELDS = ("regions", "seasons", "difficulty")
+
+# Azure AI Search 400s for an index without (filterable) facet fields:
+# "Could not find a property named 'regions' on type 'search.document'."
+# "The field 'regions' is not filterable. Only filterable fields can be used in filter expressions."
+_FACET_FIELD_ERROR_RE = re.compile(
+    r"(?:could not find a property named|field) '(?:%s)'(?: on type [^.]*| is not filterable)" % "|".join(FACET_FIELDS),
+    re.IGNORECASE,
+)
+
+
+def _odata_in(variable: str, field: str, values: Tuple[str, ...]) -> str:
+    joined = "|".join(value.replace("'", "''") for value in values)
+    if variable:
+        return f"{field}/any({variable}: search.in({variable}, '{joined}', '|'))"
+    return f"search.in({field}, '{joined}', '|')"
+
+
+@dataclass(frozen=True)
+class QueryFacets:
+    """Facets found in a question; an empty facet does not filter."""
+    regions: Tuple[str, ...] = ()
+    seasons: Tuple[str, ...] = ()
+    difficulty: Tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.regions or self.seasons or self.difficulty)
+
+    def as_dict(self) -> Dict[str, List[str]]:
+        """Non-empty facets (cache key / span attributes)."""
+        return {
+            name: list(values)
+            for name, values in (("regions", self.regions), ("seasons", self.seasons), ("difficulty", self.difficulty))
+            if values
+        }
+
+    def to_odata(self) -> str | None:
+        """Azure AI Search filter expression (None if there is nothing to filter on)."""
+        clauses = []
+        if self.regions:
+            clauses.append(_odata_in("r", "regions", self.regions))
+        if self.seasons:
+            clauses.append(_odata_in("s", "seasons", self.seasons))
+        if self.difficulty:
+            clauses.append(_odata_in("", "difficulty", self.difficulty))
+        return " and ".join(clauses) or None
+
+    def matches(self, doc_facets: Dict[str, Any]) -> bool:
+        """Same semantics as to_odata(), for documents facetted with document_facets()."""
+        if self.regions and not set(self.regions) & set(doc_facets.get("regions", ())):
+            return False
+        if self.seasons and not set(self.seasons) & set(doc_facets.get("seasons", ())):
+            return False
+        if self.difficulty and doc_facets.get("difficulty") not in self.difficulty:
+            return False
+        return True
+
+
+class FacetExtractor:
+    """Region/season/difficulty matcher over the intent_keywords.json facet gazetteer."""
+
+    def __init__(self, gazetteer: Dict[str, Any]):
+        regions: Dict[str, List[str]] = dict(gazetteer.get("regions", {}))
+        self._place_region: Dict[str, str] = {}
+        for region, places in gazetteer.get("places", {}).items():
+            for place, aliases in places.items():
+                regions[place] = aliases
+                self._place_region[place] = region
+
+        categories: Dict[str, List[str]] = {}
+        for season, terms in gazetteer.get("seasons", {}).items():
+            categories[f"season:{season}"] = terms
+        for level, terms in gazetteer.get("difficulty", {}).items():
+            categories[f"difficulty:{level}"] = terms
+
+        # Regions and places ride on the matcher's city gazetteer - one regex pass per text
+        self._matcher = IntentMatcher(categories, regions)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FacetExtractor":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("facets", {}))
+
+    def _match(self, text: str | None) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+        match = self._matcher.match(_HOT_SPRING_RE.sub(" ", text or ""))
+        seasons = {c.split(":", 1)[1] for c in match.categories if c.startswith("season:")}
+        if "all" in seasons:
+            seasons = set(SEASONS)
+        difficulty = tuple(sorted(c.split(":", 1)[1] for c in match.categories if c.startswith("difficulty:")))
+        return match.cities, tuple(s for s in SEASONS if s in seasons), difficulty
+
+    def extract(self, text: str | None) -> QueryFacets:
+        """Facets named in a question."""
+        regions, seasons, difficulty = self._match(text)
+        # "any season" / all four seasons does not narrow anything
+        if len(seasons) == len(SEASONS):
+            seasons = ()
+        return QueryFacets(regions=regions, seasons=seasons, difficulty=difficulty)
+
+    def document_facets(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Filterable facet fields for a knowledge base document (or passage).
+
+        Returns:
+            {"regions": [...], "seasons": [...], "difficulty": str | None}
+            A document without season metadata is treated as all-season.
+        """
+        metadata = doc.get("metadata") or {}
+        places, _, _ = self._match(" | ".join([doc.get("title", ""), *metadata.get("tags", [])]))
+        regions: Dict[str, None] = {}
+        for place in places:
+            regions.setdefault(place, None)
+            if place in self._place_region:
+                regions.setdefault(self._place_region[place], None)
+
+        _, seasons, _ = self._match(metadata.get("season"))
+        return {
+            "regions": list(regions),
+            "seasons": list(seasons or SEASONS),
+            "difficulty": metadata.get("difficulty"),
+        }
+
+
+# Built once at import and shared by all call sites
+_EXTRACTOR = FacetExtractor.from_file(os.getenv("INTENT_KEYWORDS_PATH", _DEFAULT_PATH))
+
+
+def is_facet_field_error(message: str | None) -> bool:
+    """True if a search error says a facet field is missing from the index or not filterable."""
+    return bool(message and _FACET_FIELD_ERROR_RE.search(message))
+
+
+def extract_facets(text: str | None) -> QueryFacets:
+    """Return the region/season/difficulty facets named in a question."""
+    return _EXTRACTOR.extract(text)
+
+
+def document_facets(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the filterable facet fields for a knowledge base document."""
+    return _EXTRACTOR.document_facets(doc)
+
+
+if __name__ == "__main__":  # quick manual test
+    for sample in ("Fall foliage hikes in Gangwon-do", "제주 봄 여행 추천", "Easy day trip near Gyeongju",
+                   "Hot springs in winter", "Year-round beaches in Busan"):
+        facets = extract_facets(sample)
+        print(sample, "=>", facets.as_dict(), "|", facets.to_odata())
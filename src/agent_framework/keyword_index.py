@@ -0,0 +1,149 @@
+"""
+Local BM25 keyword index over the knowledge base.
+
+The keyword half of local hybrid search (RESEARCH_RETRIEVER=local); the vector
+half is local_index.LocalVectorIndex and the two rankings are merged with
+reciprocal rank fusion, the same fusion Azure AI Search uses for hybrid queries.
+
+Tokenization handles mixed Korean/English text without a morphological analyzer:
+- Hangul runs -> overlapping character bigrams ("제주도" -> "제주", "주도"),
+  so particles and compounds still share terms with the query
+- Latin/digit runs -> lowercase words with plural suffixes folded
+  ("beaches" -> "beach", "temples" -> "temple"), like intent_matcher
+
+Postings are stored CSR-style in NumPy arrays (term offsets, doc ids, term
+frequencies) and scored with one vectorized accumulate per query term.
+"""
+
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[가-힣]+|[a-z0-9]+")
+_PLURAL_ES_RE = re.compile(r"(?:ch|sh|x|ss)es$")
+
+
+def _fold_plural(word: str) -> str:
+    if len(word) <= 3 or not word.endswith("s") or word.endswith("ss"):
+        return word
+    return word[:-2] if _PLURAL_ES_RE.search(word) else word[:-1]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split mixed Korean/English text into index terms."""
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if "가" <= run[0] <= "힣":
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(_fold_plural(run))
+    return tokens
+
+
+def document_terms(doc: Dict[str, Any], title_weight: int = 2) -> List[str]:
+    """Index terms for a document: title (boosted by repetition), content and tags."""
+    tags = " ".join((doc.get("metadata") or {}).get("tags", []))
+    return (
+        tokenize(doc.get("title", "")) * title_weight
+        + tokenize(doc.get("content", ""))
+        + tokenize(tags)
+    )
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]],
+    weights: Optional[Sequence[float]] = None,
+    k: int = 60
+) -> List[Tuple[int, float]]:
+    """
+    Merge ranked row lists: score(row) = sum(weight / (k + rank)).
+
+    Returns:
+        [(row, fused_score), ...] best first
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, row in enumerate(ranking, 1):
+            fused[row] = fused.get(row, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory document list with array-backed postings."""
+
+    def __init__(self, documents: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        """
+        Build the inverted index.
+
+        Args:
+            documents: Knowledge base documents (row order is kept)
+            k1: Term-frequency saturation
+            b: Length normalization
+        """
+        self.k1 = k1
+        self.b = b
+
+        per_doc = [Counter(document_terms(doc)) for doc in documents]
+        self.vocabulary: Dict[str, int] = {}
+        for counts in per_doc:
+            for term in counts:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+
+        # Group (term, doc, tf) triples by term -> CSR arrays
+        triples = [
+            (self.vocabulary[term], row, tf)
+            for row, counts in enumerate(per_doc)
+            for term, tf in counts.items()
+        ]
+        triples.sort()
+        term_ids = np.fromiter((t for t, _, _ in triples), dtype=np.int32, count=len(triples))
+        self.doc_ids = np.fromiter((d for _, d, _ in triples), dtype=np.int32, count=len(triples))
+        self.term_freqs = np.fromiter((f for _, _, f in triples), dtype=np.float32, count=len(triples))
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocabulary)), out=self.offsets[1:])
+
+        self.doc_count = len(documents)
+        self.doc_lengths = np.array([sum(counts.values()) for counts in per_doc], dtype=np.float32)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.doc_count else 0.0
+        doc_freqs = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log1p((self.doc_count - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        # Per-document length factor, precomputed once
+        self._length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / (self.avg_doc_length or 1.0))
+
+    def search_rows(self, query: str, top_k: int = 5, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Score documents against a query.
+
+        Args:
+            query: Query text
+            top_k: Number of rows to return
+            allowed: Optional boolean row mask (facet filter); other rows are never returned
+
+        Returns:
+            [(row, bm25_score), ...] best first, only rows matching at least one term
+        """
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[rows] += query_tf * self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._length_norm[rows])
+
+        if allowed is not None:
+            scores[~allowed] = 0.0
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(top_k, len(matched))
+        best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return [(int(row), float(scores[row])) for row in best]
@@ -0,0 +1,325 @@
+"""
+In-process vector index over data/knowledge-base.json.
+
+An embedded alternative to Azure AI Search for the Research Agent
+(RESEARCH_RETRIEVER=local). The corpus is small, so document embeddings are
+stored as one L2-normalized float32 matrix that is memory-mapped at load time
+and scored with a single matrix-vector product.
+
+Modes (LOCAL_INDEX_MODE):
+- exact: cosine similarity against every document
+- approximate: IVF - documents are bucketed by spherical k-means at build time,
+  queries scan only the LOCAL_INDEX_NPROBE closest buckets
+
+Index directory layout:
+    meta.json     model, dimensions, document count, source hash
+    docs.json     document fields (id, title, content, category, section, metadata;
+                  passages also carry parent_id / passage_index)
+    vectors.npy   (N, D) float32, L2-normalized
+    ivf.npz       centroids + bucket offsets/rows for approximate mode
+
+Build once (uses the same embedding text as Lab 2: "title\\n\\ncontent"):
+    python local_index.py --kb ../../data/knowledge-base.json --out local_index
+    # or index overlapping passages instead of whole documents (see passage_chunker.py)
+    python local_index.py --passages --out local_index
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_MODES = ("exact", "approximate")
+INDEX_FILES = ("meta.json", "docs.json", "vectors.npy", "ivf.npz")
+
+
+def index_path_from_env() -> str:
+    """LOCAL_INDEX_PATH, or local_index/ next to this module."""
+    return os.getenv("LOCAL_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_index"))
+
+
+def missing_index_files(path: str) -> List[str]:
+    """Index files not present in an index directory (empty list = complete)."""
+    return [name for name in INDEX_FILES if not os.path.isfile(os.path.join(path, name))]
+
+
+def load_documents(kb_path: str) -> List[Dict[str, Any]]:
+    """Load knowledge base documents (list of dicts) from JSON."""
+    with open(kb_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def document_text(doc: Dict[str, Any]) -> str:
+    """Text embedded per document - matches the contentVector built in Lab 2."""
+    return f"{doc['title']}\n\n{doc['content']}"
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int = 20, seed: int = 0):
+    """Cluster unit vectors by cosine similarity; returns (centroids, bucket id per row)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    assignments = None
+    for _ in range(iterations):
+        new_assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        if assignments is not None and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+        for bucket in range(nlist):
+            members = vectors[assignments == bucket]
+            if len(members):
+                centroids[bucket] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids, assignments
+
+
+def build_index(
+    documents: List[Dict[str, Any]],
+    embeddings: Sequence[Sequence[float]],
+    path: str,
+    model: str,
+    nlist: Optional[int] = None,
+    source_hash: Optional[str] = None,
+    granularity: str = "document"
+) -> None:
+    """
+    Write an index directory from documents and their precomputed embeddings.
+
+    Args:
+        documents: Knowledge base documents (same order as embeddings)
+        embeddings: One embedding per document
+        path: Output directory
+        model: Embedding deployment name (recorded for compatibility checks)
+        nlist: IVF bucket count (default: ~sqrt(N))
+        source_hash: Hash of the source file, used to detect a stale index
+        granularity: "document" or "passage" (rows are passage_chunker passages)
+    """
+    if len(documents) != len(embeddings):
+        raise ValueError(f"{len(documents)} documents but {len(embeddings)} embeddings")
+
+    os.makedirs(path, exist_ok=True)
+    vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+
+    # IVF buckets stored CSR-style: rows of bucket b are rows[offsets[b]:offsets[b+1]]
+    nlist = max(1, min(nlist or int(np.sqrt(len(vectors))), len(vectors)))
+    centroids, assignments = _spherical_kmeans(vectors, nlist)
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    offsets = np.zeros(nlist + 1, dtype=np.int32)
+    np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+    np.savez(os.path.join(path, "ivf.npz"), centroids=centroids, offsets=offsets, rows=order)
+
+    with open(os.path.join(path, "docs.json"), "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model,
+            "dimensions": int(vectors.shape[1]),
+            "count": int(vectors.shape[0]),
+            "nlist": nlist,
+            "source_hash": source_hash,
+            "granularity": granularity,
+        }, f, indent=2)
+
+    logger.info(f"Local index written to {path} - {len(documents)} documents, {nlist} IVF buckets")
+
+
+class LocalVectorIndex:
+    """Memory-mapped cosine top-k over the knowledge base."""
+
+    def __init__(self, path: str, mode: str = "exact", nprobe: int = 2):
+        """
+        Load an index directory written by build_index.
+
+        Args:
+            path: Index directory
+            mode: "exact" or "approximate"
+            nprobe: IVF buckets scanned per query in approximate mode
+        """
+        if mode not in INDEX_MODES:
+            raise ValueError(f"Unknown local index mode '{mode}' (expected one of {INDEX_MODES})")
+
+        self.path = path
+        self.mode = mode
+        self.nprobe = nprobe
+
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        with open(os.path.join(path, "docs.json"), "r", encoding="utf-8") as f:
+            self.documents: List[Dict[str, Any]] = json.load(f)
+
+        self.vectors: np.ndarray = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        ivf = np.load(os.path.join(path, "ivf.npz"))
+        self._centroids: np.ndarray = ivf["centroids"]
+        self._offsets: np.ndarray = ivf["offsets"]
+        self._rows: np.ndarray = ivf["rows"]
+
+    @classmethod
+    def from_env(cls) -> "LocalVectorIndex":
+        """Load using LOCAL_INDEX_PATH / LOCAL_INDEX_MODE / LOCAL_INDEX_NPROBE."""
+        return cls(
+            path=index_path_from_env(),
+            mode=os.getenv("LOCAL_INDEX_MODE", "exact").lower(),
+            nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "2")),
+        )
+
+    @property
+    def version(self) -> str:
+        """Identifies the indexed corpus (changes whenever the index is rebuilt from new data)."""
+        return self.meta.get("source_hash") or f"{self.meta['model']}:{self.meta['count']}"
+
+    @property
+    def is_passage_index(self) -> bool:
+        return self.meta.get("granularity") == "passage"
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows to score in approximate mode (None = all rows)."""
+        if self.mode != "approximate" or len(self._centroids) <= self.nprobe:
+            return None
+        probe = np.argpartition(-(self._centroids @ query), self.nprobe - 1)[:self.nprobe]
+        return np.concatenate([self._rows[self._offsets[b]:self._offsets[b + 1]] for b in probe])
+
+    def search_rows(
+        self,
+        query_vector: Sequence[float],
+        top_k: int = 5,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[tuple]:
+        """
+        Score documents against a query embedding.
+
+        Args:
+            query_vector: Query embedding
+            top_k: Number of rows to return
+            allowed: Optional boolean row mask (facet filter); other rows are never returned
+
+        Returns:
+            [(row, cosine_score), ...] best first
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape != (self.vectors.shape[1],):
+            raise ValueError(f"Query has {query.shape[0]} dimensions, index has {self.vectors.shape[1]}")
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        # A facet filter already shrinks the candidate set - score it exactly instead of probing IVF buckets
+        rows = self._candidates(query) if allowed is None else np.flatnonzero(allowed)
+        scores = (self.vectors if rows is None else self.vectors[rows]) @ query
+
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        if rows is not None:
+            return [(int(rows[i]), float(scores[i])) for i in best]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def result(self, row: int, score: float) -> Dict[str, Any]:
+        """Document at row in the shape returned by ResearchAgent._search_knowledge_base."""
+        doc = self.documents[row]
+        result = {
+            "id": doc.get("id", "unknown"),
+            "title": doc.get("title", "Untitled"),
+            "content": doc.get("content", ""),
+            "category": doc.get("category", "general"),
+            "score": score,
+        }
+        if "parent_id" in doc:
+            result["parent_id"] = doc["parent_id"]
+            result["passage_index"] = doc.get("passage_index", 0)
+        return result
+
+    def search(self, query_vector: Sequence[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        """Top-k documents by cosine similarity."""
+        return [self.result(row, score) for row, score in self.search_rows(query_vector, top_k)]
+
+
+def create_embedding_client():
+    """Sync Azure OpenAI client for offline index builds (same auth as Lab 2)."""
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+    from openai import AzureOpenAI
+
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    if not endpoint:
+        from research_agent import _derive_openai_endpoint
+        endpoint = _derive_openai_endpoint(os.getenv("AZURE_AI_PROJECT_ENDPOINT"))
+    if not endpoint:
+        raise SystemExit("Set AZURE_OPENAI_ENDPOINT or AZURE_AI_PROJECT_ENDPOINT")
+
+    return AzureOpenAI(
+        azure_endpoint=endpoint,
+        azure_ad_token_provider=get_bearer_token_provider(
+            DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
+        ),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+    )
+
+
+def embed_texts(client, texts: List[str], model: str, dimensions: int, batch_size: int = 16) -> List[List[float]]:
+    """Embed texts in batches (one request per batch_size inputs), preserving order."""
+    embeddings: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        response = client.embeddings.create(
+            input=texts[start:start + batch_size],
+            model=model,
+            dimensions=dimensions
+        )
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+        print(f"  embedded {min(start + batch_size, len(texts))}/{len(texts)}")
+    return embeddings
+
+
+def _main():
+    """Embed the knowledge base with Azure OpenAI and write a local index."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build the Research Agent's local vector index")
+    parser.add_argument("--kb", default=os.path.join("..", "..", "data", "knowledge-base.json"))
+    parser.add_argument("--out", default="local_index")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--passages", action="store_true", help="index overlapping passages instead of documents")
+    parser.add_argument("--max-tokens", type=int, default=80)
+    parser.add_argument("--overlap", type=int, default=1)
+    args = parser.parse_args()
+
+    model = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
+    dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "3072"))
+
+    with open(args.kb, "rb") as f:
+        source_hash = hashlib.sha1(f.read()).hexdigest()
+    documents = load_documents(args.kb)
+    if args.passages:
+        from passage_chunker import chunk_documents
+        documents = chunk_documents(documents, args.max_tokens, args.overlap)
+        source_hash = f"{source_hash}:passages-{args.max_tokens}-{args.overlap}"
+
+    embeddings = embed_texts(
+        create_embedding_client(), [document_text(doc) for doc in documents], model, dimensions, args.batch_size
+    )
+    build_index(
+        documents, embeddings, args.out, model=model, nlist=args.nlist, source_hash=source_hash,
+        granularity="passage" if args.passages else "document"
+    )
+    print(f"✅ Local index written to {args.out}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _main()
@@ -6,8 +6,10 @@ Multi-agent orchestration using workflow executors and handoff pattern
 import asyncio
 import logging
 import os
+import time
+import uuid
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 
 from azure.identity.aio import AzureCliCredential, ManagedIdentityCredential, ChainedTokenCredential
@@ -26,6 +28,9 @@ from research_agent import ResearchAgent
 # Import masking utility
 from masking import mask_content
 
+# Import shared keyword / city matcher
+from intent_matcher import match_intent
+
 # Load environment
 load_dotenv()
 
@@ -41,7 +46,7 @@ class UserMessage:
 
 
 # ---- Agent Creation Helper ----
-def create_agent_client() -> AzureAIAgentClient:
+def create_agent_client(credential: Optional[ChainedTokenCredential] = None) -> AzureAIAgentClient:
     """Create Azure AI Agent client with appropriate credential."""
     project_endpoint = os.getenv("AZURE_AI_PROJECT_ENDPOINT")
     # Priority: Environment variable > Default fallback
@@ -63,7 +68,7 @@ def create_agent_client() -> AzureAIAgentClient:
     
     # 1. Try Managed Identity (for Container Apps deployment)
     # 2. Fall back to Azure CLI (for local development)
-    credential = ChainedTokenCredential(
+    credential = credential or ChainedTokenCredential(
         ManagedIdentityCredential(),
         AzureCliCredential()
     )
@@ -77,6 +82,7 @@ def create_agent_client() -> AzureAIAgentClient:
 
 # ---- Global Agent Instances (Lazy Initialization) ----
 agent_client = None
+agent_credential = None
 router_agent = None
 general_agent = None
 tool_agent_instance = None
@@ -85,7 +91,7 @@ research_agent_instance = None
 
 def _initialize_agents():
     """Initialize all agents (called on first use)."""
-    global agent_client, router_agent, general_agent, tool_agent_instance, research_agent_instance
+    global agent_client, agent_credential, router_agent, general_agent, tool_agent_instance, research_agent_instance
     
     if agent_client is not None:
         return  # Already initialized
@@ -107,7 +113,12 @@ def _initialize_agents():
         logger.warning(f"Failed to configure observability: {e}")
     
     # Create agent client WITH logging enabled for tracing
-    agent_client = create_agent_client()
+    # (credential kept so warm_up_agents can pre-fetch its token)
+    agent_credential = ChainedTokenCredential(
+        ManagedIdentityCredential(),
+        AzureCliCredential()
+    )
+    agent_client = create_agent_client(agent_credential)
     
     # Router Agent - Intelligent intent classifier with detailed agent capabilities
     router_agent = agent_client.create_agent(
@@ -166,10 +177,11 @@ def _initialize_agents():
     else:
         logger.warning("MCP_ENDPOINT not set - Tool Agent disabled")
     
-    # Research Agent - Create for RAG operations  
-    if os.getenv("SEARCH_ENDPOINT") and os.getenv("SEARCH_INDEX"):
+    # Research Agent - Create for RAG operations (Azure AI Search or the local index)
+    local_retriever = os.getenv("RESEARCH_RETRIEVER", "azure_search").lower() == "local"
+    if local_retriever or (os.getenv("SEARCH_ENDPOINT") and os.getenv("SEARCH_INDEX")):
         search_key = os.getenv("SEARCH_KEY")
-        if not search_key:
+        if not search_key and not local_retriever:
             logger.warning("SEARCH_KEY not set - Research Agent will have limited functionality")
         
         research_agent_instance = ResearchAgent(
@@ -184,6 +196,130 @@ def _initialize_agents():
     logger.info("All agents initialized")
 
 
+async def warm_up_agents() -> Dict[str, Any]:
+    """
+    Initialize every agent concurrently at service startup instead of on first use.
+    
+    Pre-fetches tokens, opens connections (MCP session, search, embeddings) and runs
+    a canary query per agent. Failures are reported per component and never raised,
+    so the lazy paths in the executors still apply.
+    
+    Returns:
+        {"total_ms": ..., "components": {name: {"status", "duration_ms", ...stage timings}}}
+    """
+    _initialize_agents()
+    
+    tracer = trace.get_tracer(__name__)
+    
+    async def warm_router():
+        await agent_credential.get_token("https://ai.azure.com/.default")
+        return {}
+    
+    components = {"router": warm_router()}
+    if tool_agent_instance:
+        components["tool_agent"] = tool_agent_instance.warm_up()
+    if research_agent_instance:
+        components["research_agent"] = research_agent_instance.warm_up()
+    
+    async def timed(name: str, coro) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            stages = await coro
+            status = "error" if stages.get("errors") else "ok"
+            result = {"status": status, **stages}
+        except Exception as e:
+            logger.error(f"Warm-up failed for {name}: {e}")
+            result = {"status": "error", "errors": {"initialize": str(e)}}
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+    
+    with tracer.start_as_current_span("agent_framework.warmup") as span:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(timed(name, coro) for name, coro in components.items()))
+        report = {
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "components": dict(zip(components, results)),
+        }
+        
+        span.set_attribute("warmup.total_ms", report["total_ms"])
+        for name, result in report["components"].items():
+            span.set_attribute(f"warmup.{name}.status", result["status"])
+            span.set_attribute(f"warmup.{name}.duration_ms", result["duration_ms"])
+            logger.info(f"Warm-up {name}: {result['status']} in {result['duration_ms']}ms")
+    
+    return report
+
+
+async def get_tool_agent() -> Optional[ToolAgent]:
+    """Return the initialized Tool Agent (None if MCP is not configured)."""
+    _initialize_agents()  # Ensure agents are initialized
+    
+    if tool_agent_instance and not tool_agent_instance.agent:
+        await tool_agent_instance.initialize()
+    
+    return tool_agent_instance
+
+
+async def get_research_agent() -> Optional[ResearchAgent]:
+    """Return the initialized Research Agent."""
+    _initialize_agents()  # Ensure agents are initialized
+    
+    if research_agent_instance and not research_agent_instance.agent:
+        await research_agent_instance.initialize()
+    
+    return research_agent_instance
+
+
+# ---- Weather Prefetch (opt-in) ----
+# When the router's keyword pass sees weather intent and a known city (see
+# intent_keywords.json), get_weather starts in the background;
+# tool_node/orchestrator_node pick up the running call.
+WEATHER_PREFETCH_ENABLED = os.getenv("WEATHER_PREFETCH_ENABLED", "false").lower() in ["1", "true", "yes"]
+
+# Prefetched MCP calls by prefetch id (carried in UserMessage.metadata)
+_prefetch_tasks: dict = {}
+
+
+def _start_weather_prefetch(msg: UserMessage, cities: tuple) -> int:
+    """Start get_weather for every known city in the message; returns calls started."""
+    if not (WEATHER_PREFETCH_ENABLED and tool_agent_instance and tool_agent_instance.agent):
+        # Prefetch needs an initialized MCP session (see warm_up_agents)
+        return 0
+    
+    if not cities:
+        return 0
+    
+    tasks = tool_agent_instance.prefetch([
+        {"tool": "get_weather", "arguments": {"location": city}} for city in cities
+    ])
+    prefetch_id = uuid.uuid4().hex
+    _prefetch_tasks[prefetch_id] = tasks
+    msg.metadata = {**(msg.metadata or {}), "prefetch_id": prefetch_id}
+    return len(tasks)
+
+
+def _claim_prefetch(msg: UserMessage) -> Optional[dict]:
+    """Take ownership of the prefetched MCP calls for this message, if any."""
+    prefetch_id = (msg.metadata or {}).get("prefetch_id")
+    return _prefetch_tasks.pop(prefetch_id, None) if prefetch_id else None
+
+
+def _discard_prefetch(msg: UserMessage) -> None:
+    """Cancel prefetched MCP calls when the message is not routed to a tool path."""
+    tasks = _claim_prefetch(msg)
+    if tasks:
+        for task in tasks.values():
+            task.cancel()
+        tool_agent_instance.speculation_stats["wasted"] += len(tasks)
+
+
+async def _route(msg: UserMessage, ctx: WorkflowContext[UserMessage], target_id: str) -> None:
+    """Send the message to its executor, dropping prefetches that won't be used."""
+    if target_id not in ("tool", "orchestrator"):
+        _discard_prefetch(msg)
+    await ctx.send_message(msg, target_id=target_id)
+
+
 # ---- Workflow Executors (Nodes) ----
 
 @executor(id="router")
@@ -203,45 +339,24 @@ async def router_node(msg: UserMessage, ctx: WorkflowContext[UserMessage]) -> No
         span.set_attribute("workflow.stage", "routing")
         
         try:
-            text_lower = msg.text.lower()
+            # Weather / travel / connector keywords and city entities in one pass
+            intent = match_intent(msg.text)
+            has_tool = intent.has("weather")
+            has_research = intent.has("travel")
+            has_connector = intent.has("connector")
+            span.set_attribute("router.keyword_categories", sorted(intent.categories))
             
-            # Weather-focused keywords (nouns only)
-            tool_keywords = [
-                "weather", "temperature", "temp", "forecast", "climate",
-                "rain", "snow", "sun", "cloud", "wind", "humidity",
-                "storm", "thunder", "fog", "degree", "celsius", "fahrenheit"
-            ]
-            
-            
-            # Travel/Tourism-focused keywords (nouns only)
-            research_keywords = [
-                # Travel destinations and attractions
-                "travel", "trip", "destination", "tour", "tourism", "visit",
-                "attraction", "sightseeing", "landmark", "spot", "place",
-                
-                # Korean destinations
-                "jeju", "busan", "seoul", "gangwon",
-                "udo", "seongsan", "seopjikoji", "hallasan", "hyeopjae", "aewol",
-                
-                # Travel activities
-                "beach", "mountain", "hiking", "surfing", "healing", "nature",
-                "culture", "history", "museum", "festival", "food", "market",
-                "restaurant", "activities", "recommend", "recommendation"
-            ]
-            
-            orchestrator_keywords = [" and ", " also ", " plus ", " additionally ", " moreover "]
-            
-            # Check for keywords
-            has_tool = any(kw in text_lower for kw in tool_keywords)
-            has_research = any(kw in text_lower for kw in research_keywords)
-            has_connector = any(kw in text_lower for kw in orchestrator_keywords)
+            # Hide get_weather latency behind routing (opt-in)
+            if has_tool:
+                prefetched = _start_weather_prefetch(msg, intent.cities)
+                span.set_attribute("router.weather_prefetch", prefetched)
             
             # Enhanced rule: If has both intentions with connecting words → orchestrator
             if has_tool and has_research and has_connector:
                 span.set_attribute("router.method", "rule_based")
                 span.set_attribute("router.intent", "orchestrator")
                 span.set_attribute("router.reason", "multi_intent_with_connector")
-                await ctx.send_message(msg, target_id="orchestrator")
+                await _route(msg, ctx, "orchestrator")
                 return
             
             # If clearly only tool keywords (no research keywords)
@@ -249,7 +364,7 @@ async def router_node(msg: UserMessage, ctx: WorkflowContext[UserMessage]) -> No
                 span.set_attribute("router.method", "rule_based")
                 span.set_attribute("router.intent", "tool")
                 span.set_attribute("router.reason", "pure_tool_request")
-                await ctx.send_message(msg, target_id="tool")
+                await _route(msg, ctx, "tool")
                 return
             
             # Otherwise, ask AI router with enhanced context
@@ -263,18 +378,19 @@ async def router_node(msg: UserMessage, ctx: WorkflowContext[UserMessage]) -> No
             span.set_attribute("router.query_length", len(msg.text))
             
             if "orchestrator" in intent:
-                await ctx.send_message(msg, target_id="orchestrator")
+                await _route(msg, ctx, "orchestrator")
             elif "tool" in intent:
-                await ctx.send_message(msg, target_id="tool")
+                await _route(msg, ctx, "tool")
             elif "research" in intent:
-                await ctx.send_message(msg, target_id="research")
+                await _route(msg, ctx, "research")
             else:
-                await ctx.send_message(msg, target_id="general")
+                await _route(msg, ctx, "general")
             
             span.set_attribute("router.status", "success")
         
         except Exception as e:
             logger.error(f"❌ Router error: {e}")
+            _discard_prefetch(msg)
             span.set_attribute("router.status", "error")
             span.set_attribute("error.message", str(e))
             span.record_exception(e)
@@ -302,7 +418,9 @@ async def tool_node(msg: UserMessage, ctx: WorkflowContext[UserMessage]) -> None
                 
                 # Create a new thread for this conversation
                 thread = tool_agent_instance.get_new_thread()
-                actual_result = await tool_agent_instance.run(msg.text, thread=thread)
+                actual_result = await tool_agent_instance.run(
+                    msg.text, thread=thread, prefetched=_claim_prefetch(msg)
+                )
                 span.set_attribute("executor.result_length", len(actual_result))
                 span.set_attribute("executor.status", "success")
                 await ctx.yield_output(f"🔧 [Tool Agent]\n{actual_result}")
@@ -321,6 +439,9 @@ async def tool_node(msg: UserMessage, ctx: WorkflowContext[UserMessage]) -> None
                 await ctx.yield_output(f"⚠️ Tool Agent: MCP server connection failed.\nVerify MCP endpoint is running: {os.getenv('MCP_ENDPOINT')}")
             else:
                 await ctx.yield_output(f"⚠️ Tool Agent error: {error_detail}")
+        finally:
+            # No-op once run() claimed the prefetch; cancels it if we failed before that
+            _discard_prefetch(msg)
 
 
 @executor(id="research")
@@ -342,9 +463,8 @@ async def research_node(msg: UserMessage, ctx: WorkflowContext[UserMessage]) ->
                 if not research_agent_instance.agent:
                     await research_agent_instance.initialize()
                 
-                # Create a new thread for this conversation
-                thread = research_agent_instance.get_new_thread()
-                actual_result = await research_agent_instance.run(msg.text, thread=thread)
+                # No thread up front - run() creates it concurrently with retrieval
+                actual_result = await research_agent_instance.run(msg.text)
                 span.set_attribute("executor.result_length", len(actual_result))
                 span.set_attribute("executor.status", "success")
                 await ctx.yield_output(f"{actual_result}")
@@ -444,11 +564,15 @@ async def orchestrator_node(msg: UserMessage, ctx: WorkflowContext[UserMessage])
                         await tool_agent_instance.initialize()
                     # Create a new thread for this conversation
                     thread = tool_agent_instance.get_new_thread()
-                    result = await tool_agent_instance.run(msg.text, thread=thread)
+                    result = await tool_agent_instance.run(
+                        msg.text, thread=thread, prefetched=_claim_prefetch(msg)
+                    )
                     return f"🔧 [Tool Agent]\n{result}"
                 except Exception as e:
                     logger.error(f"Tool agent error: {e}")
                     return f"⚠️ Tool Agent error: {str(e)}"
+                finally:
+                    _discard_prefetch(msg)
             
             async def run_research():
                 if not research_agent_instance:
@@ -456,9 +580,8 @@ async def orchestrator_node(msg: UserMessage, ctx: WorkflowContext[UserMessage])
                 try:
                     if not research_agent_instance.agent:
                         await research_agent_instance.initialize()
-                    # Create a new thread for this conversation
-                    thread = research_agent_instance.get_new_thread()
-                    result = await research_agent_instance.run(msg.text, thread=thread)
+                    # No thread up front - run() creates it concurrently with retrieval
+                    result = await research_agent_instance.run(msg.text)
                     return result
                 except Exception as e:
                     logger.error(f"Research agent error: {e}")
@@ -529,6 +652,8 @@ async def cleanup_all_agents():
     # Cleanup agent_client (manages router_agent and general_agent)
     try:
         await agent_client.close()
+        if agent_credential:
+            await agent_credential.close()
     except Exception as e:
         logger.error(f"Agent client cleanup error: {e}")
     
@@ -0,0 +1,225 @@
+"""
+Passage-level ingestion for the knowledge base.
+
+Documents are split into overlapping passages (whole sentences, up to
+--max-tokens each, consecutive passages sharing --overlap sentences) so
+retrieval can return just the relevant part of a document. Passage ids are
+stable - "<doc id>-p<n>" - and every passage keeps parent_id plus the parent's
+title/category/section/metadata.
+
+At query time ResearchAgent retrieves passages and collapse_passages() merges
+them back into one result per parent document (best passage score, passages in
+document order, overlapping sentences de-duplicated).
+
+Build a passage index:
+    # Local index (RESEARCH_RETRIEVER=local)
+    python local_index.py --passages --out local_index
+    # Azure AI Search index (set SEARCH_INDEX to it and SEARCH_INDEX_PASSAGES=true)
+    python passage_chunker.py --search-index ai-agent-knowledge-base-passages
+"""
+
+import argparse
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from context_packer import load_token_counter, split_sentences
+from facets import document_facets
+
+logger = logging.getLogger(__name__)
+
+# Parent fields copied onto every passage
+PARENT_FIELDS = ("title", "category", "section", "subsection", "metadata")
+
+
+def chunk_document(
+    doc: Dict[str, Any],
+    count_tokens: Callable[[str], int],
+    max_tokens: int = 80,
+    overlap_sentences: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    Split one document into overlapping sentence windows.
+
+    Args:
+        doc: Knowledge base document
+        count_tokens: Token counter (see context_packer.load_token_counter)
+        max_tokens: Passage size limit (a single longer sentence becomes its own passage)
+        overlap_sentences: Sentences repeated at the start of the next passage
+
+    Returns:
+        Passages with id, parent_id, passage_index, content and the parent fields
+    """
+    sentences = split_sentences(doc.get("content", ""))
+    sizes = [count_tokens(sentence) for sentence in sentences]
+    windows = []
+    start = 0
+    while start < len(sentences):
+        end, used = start, 0
+        while end < len(sentences) and (end == start or used + sizes[end] <= max_tokens):
+            used += sizes[end]
+            end += 1
+        windows.append(sentences[start:end])
+        if end >= len(sentences):
+            break
+        start = max(end - overlap_sentences, start + 1)
+
+    parent = {field: doc[field] for field in PARENT_FIELDS if field in doc}
+    return [
+        {
+            **parent,
+            "id": f"{doc['id']}-p{index}",
+            "parent_id": doc["id"],
+            "passage_index": index,
+            "content": " ".join(window),
+        }
+        for index, window in enumerate(windows)
+    ]
+
+
+def chunk_documents(
+    documents: List[Dict[str, Any]],
+    max_tokens: int = 80,
+    overlap_sentences: int = 1,
+    model: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Chunk every document; passages of one document stay contiguous and in order."""
+    count_tokens = load_token_counter(model)
+    return [
+        passage
+        for doc in documents
+        for passage in chunk_document(doc, count_tokens, max_tokens, overlap_sentences)
+    ]
+
+
+def collapse_passages(results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Merge passage hits into one result per parent document.
+
+    Args:
+        results: Passage results, best first (results without parent_id pass through)
+        top_k: Number of documents to return
+
+    Returns:
+        Document results ordered by their best passage, content limited to the hit passages
+    """
+    groups: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for result in results:
+        groups.setdefault(result.get("parent_id") or result["id"], []).append(result)
+
+    collapsed = []
+    for parent_id, passages in list(groups.items())[:top_k]:
+        seen = set()
+        sentences = []
+        for passage in sorted(passages, key=lambda p: p.get("passage_index", 0)):
+            for sentence in split_sentences(passage.get("content", "")):
+                if sentence not in seen:
+                    seen.add(sentence)
+                    sentences.append(sentence)
+
+        best = passages[0]
+        merged = {key: value for key, value in best.items() if key not in ("parent_id", "passage_index")}
+        merged.update({"id": parent_id, "content": " ".join(sentences), "passages": len(passages)})
+        collapsed.append(merged)
+    return collapsed
+
+
+def _upload_to_search(passages: List[Dict[str, Any]], embeddings: List[List[float]], index_name: str, dimensions: int):
+    """Create (or recreate) a passage index with the Lab 2 schema + parent_id and upload."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+    from azure.search.documents.indexes import SearchIndexClient
+    from azure.search.documents.indexes.models import (
+        HnswAlgorithmConfiguration,
+        SearchableField,
+        SearchField,
+        SearchFieldDataType,
+        SearchIndex,
+        SimpleField,
+        VectorSearch,
+        VectorSearchProfile,
+    )
+
+    endpoint, key = os.getenv("SEARCH_ENDPOINT"), os.getenv("SEARCH_KEY")
+    if not endpoint or not key:
+        raise SystemExit("Set SEARCH_ENDPOINT and SEARCH_KEY")
+    credential = AzureKeyCredential(key)
+
+    index_client = SearchIndexClient(endpoint=endpoint, credential=credential)
+    if index_name in index_client.list_index_names():
+        index_client.delete_index(index_name)
+    index_client.create_index(SearchIndex(
+        name=index_name,
+        fields=[
+            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+            SimpleField(name="parent_id", type=SearchFieldDataType.String, filterable=True),
+            SimpleField(name="passage_index", type=SearchFieldDataType.Int32, sortable=True),
+            SearchableField(name="title", type=SearchFieldDataType.String, filterable=True, sortable=True),
+            SearchableField(name="content", type=SearchFieldDataType.String, analyzer_name="ko.microsoft"),
+            SimpleField(name="category", type=SearchFieldDataType.String, filterable=True, sortable=True, facetable=True),
+            SimpleField(name="section", type=SearchFieldDataType.String, filterable=True),
+            # Facet filter fields (see facets.py)
+            SimpleField(name="regions", type=SearchFieldDataType.Collection(SearchFieldDataType.String), filterable=True, facetable=True),
+            SimpleField(name="seasons", type=SearchFieldDataType.Collection(SearchFieldDataType.String), filterable=True, facetable=True),
+            SimpleField(name="difficulty", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            SearchableField(name="tags", collection=True, filterable=True, facetable=True),
+            SearchField(
+                name="contentVector",
+                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                searchable=True,
+                vector_search_dimensions=dimensions,
+                vector_search_profile_name="vector-profile"
+            ),
+        ],
+        vector_search=VectorSearch(
+            algorithms=[HnswAlgorithmConfiguration(name="hnsw-algorithm")],
+            profiles=[VectorSearchProfile(name="vector-profile", algorithm_configuration_name="hnsw-algorithm")]
+        ),
+    ))
+
+    fields = ("id", "parent_id", "passage_index", "title", "content", "category", "section")
+    documents = [
+        {
+            **{field: passage.get(field) for field in fields},
+            **document_facets(passage),
+            "tags": (passage.get("metadata") or {}).get("tags", []),
+            "contentVector": embedding,
+        }
+        for passage, embedding in zip(passages, embeddings)
+    ]
+    search_client = SearchClient(endpoint=endpoint, index_name=index_name, credential=credential)
+    for start in range(0, len(documents), 100):
+        search_client.upload_documents(documents=documents[start:start + 100])
+    print(f"✅ Uploaded {len(documents)} passages to {index_name}")
+
+
+def _main():
+    """Chunk + batch-embed the knowledge base and upload passages to Azure AI Search."""
+    from dotenv import load_dotenv
+    from local_index import create_embedding_client, document_text, embed_texts, load_documents
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build a passage-level Azure AI Search index")
+    parser.add_argument("--kb", default=os.path.join("..", "..", "data", "knowledge-base.json"))
+    parser.add_argument("--search-index", required=True)
+    parser.add_argument("--max-tokens", type=int, default=80)
+    parser.add_argument("--overlap", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    model = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
+    dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "3072"))
+
+    passages = chunk_documents(load_documents(args.kb), args.max_tokens, args.overlap)
+    print(f"📄 {len(passages)} passages")
+    embeddings = embed_texts(
+        create_embedding_client(), [document_text(p) for p in passages], model, dimensions, args.batch_size
+    )
+    _upload_to_search(passages, embeddings, args.search_index, dimensions)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _main()
@@ -6,22 +6,58 @@ Searches knowledge base using Azure AI Search with RAG
 import asyncio
 import logging
 import os
-from typing import Optional, List, Dict, Any
+import re
+import time
+from typing import Optional, List, Dict, Any, AsyncIterator, Set, Tuple
 
+import numpy as np
 from agent_framework import ChatAgent
 from agent_framework.azure import AzureAIAgentClient
-from azure.identity.aio import AzureCliCredential, ManagedIdentityCredential, ChainedTokenCredential
+from azure.identity.aio import (
+    AzureCliCredential,
+    ManagedIdentityCredential,
+    ChainedTokenCredential,
+    get_bearer_token_provider,
+)
 from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.search.documents.models import VectorizedQuery
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
+from openai import AsyncAzureOpenAI
 
 # OpenTelemetry imports for tracing
 from opentelemetry import trace
 
 # Import masking utility
 from masking import mask_content
+from embedding_cache import EmbeddingCache
+from local_index import LocalVectorIndex
+from keyword_index import BM25Index, reciprocal_rank_fusion
+from retrieval_cache import RetrievalCache
+from answer_cache import SemanticAnswerCache
+from context_packer import ContextPacker
+from passage_chunker import collapse_passages
+from diversify import adaptive_top_k, mmr
+from citations import CitationInjector
+from facets import QueryFacets, document_facets, extract_facets, is_facet_field_error
 
 logger = logging.getLogger(__name__)
 
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+AI_PROJECT_SCOPE = "https://ai.azure.com/.default"
+
+# Canary query used by warm_up() to open search/embedding connections
+WARMUP_QUERY = "Jeju travel"
+
+
+def _derive_openai_endpoint(project_endpoint: Optional[str]) -> Optional[str]:
+    """Derive the Azure OpenAI endpoint from the AI project endpoint (same rule as Lab 2)."""
+    if not project_endpoint:
+        return None
+    match = re.match(r"https://([^.]+)\.", project_endpoint)
+    return f"https://{match.group(1)}.openai.azure.com/" if match else None
+
 
 class ResearchAgent:
     """
@@ -35,7 +71,9 @@ class ResearchAgent:
         model_deployment_name: Optional[str] = None,
         search_endpoint: Optional[str] = None,
         search_index: Optional[str] = None,
-        search_key: Optional[str] = None
+        search_key: Optional[str] = None,
+        openai_endpoint: Optional[str] = None,
+        embedding_deployment_name: Optional[str] = None
     ):
         """
         Initialize the Research Agent.
@@ -46,6 +84,10 @@ class ResearchAgent:
             search_endpoint: Azure AI Search endpoint
             search_index: Name of the search index
             search_key: Azure AI Search admin key
+            openai_endpoint: Azure OpenAI endpoint for query embeddings
+                (default: AZURE_OPENAI_ENDPOINT or derived from project_endpoint)
+            embedding_deployment_name: Embedding model deployment
+                (default: AZURE_OPENAI_EMBEDDING_DEPLOYMENT or text-embedding-3-large)
         """
         self.project_endpoint = project_endpoint
         # Priority: Parameter > Environment variable > Default fallback
@@ -63,11 +105,62 @@ class ResearchAgent:
         self.search_endpoint = search_endpoint
         self.search_index = search_index
         self.search_key = search_key
+        # Retriever backend - Options: azure_search (default) or local (in-process index, see local_index.py)
+        self.retriever = os.getenv("RESEARCH_RETRIEVER", "azure_search").lower()
+        
+        # Hybrid search configuration (vector query against contentVector built in Lab 2)
+        self.openai_endpoint = (
+            openai_endpoint
+            or os.getenv("AZURE_OPENAI_ENDPOINT")
+            or _derive_openai_endpoint(project_endpoint)
+        )
+        self.embedding_deployment_name = (
+            embedding_deployment_name
+            or os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
+        )
+        self.embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "3072"))
+        self.vector_search_enabled = os.getenv("SEARCH_VECTOR_ENABLED", "true").lower() in ["1", "true", "yes"]
+        self.vector_k = int(os.getenv("SEARCH_VECTOR_K", "10"))
+        self.vector_weight = float(os.getenv("SEARCH_VECTOR_WEIGHT", "1.0"))
+        # Passage-level index (see passage_chunker.py): hits are collapsed per parent document
+        self.search_index_passages = os.getenv("SEARCH_INDEX_PASSAGES", "false").lower() in ["1", "true", "yes"]
+        self.passages_per_document = int(os.getenv("SEARCH_PASSAGES_PER_DOCUMENT", "3"))
+        # Post-retrieval MMR diversification + adaptive top-k cut-off
+        self.mmr_enabled = os.getenv("RETRIEVAL_MMR_ENABLED", "true").lower() in ["1", "true", "yes"]
+        self.mmr_lambda = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+        self.mmr_max_similarity = float(os.getenv("RETRIEVAL_MMR_MAX_SIMILARITY", "0.95"))
+        self.min_results = int(os.getenv("RETRIEVAL_MIN_RESULTS", "2"))
+        self.score_gap_factor = float(os.getenv("RETRIEVAL_SCORE_GAP_FACTOR", "2.0"))
+        # Region/season/difficulty facets from the question become search filters (see facets.py)
+        self.facet_filters_enabled = os.getenv("SEARCH_FACET_FILTERS", "true").lower() in ["1", "true", "yes"]
+        # Query-embedding cache (in-memory LRU, optional on-disk store)
+        self.embedding_cache: Optional[EmbeddingCache] = EmbeddingCache.from_env(
+            model=self.embedding_deployment_name,
+            dimensions=self.embedding_dimensions
+        )
+        # Search result cache, invalidated when the index version changes
+        self.retrieval_cache: Optional[RetrievalCache] = RetrievalCache.from_env()
+        # Opt-in semantic answer cache for paraphrased questions (same invalidation)
+        self.answer_cache: Optional[SemanticAnswerCache] = SemanticAnswerCache.from_env(
+            dimensions=self.embedding_dimensions
+        )
+        # Prompt token budget for retrieved documents
+        self.context_packer = ContextPacker.from_env(model=self.model_deployment_name)
+        self.index_version_check_seconds = float(os.getenv("SEARCH_CACHE_VERSION_CHECK_SECONDS", "60"))
+        self._index_version: Optional[str] = None
+        self._index_version_checked_at = 0.0
         
         self.agent: Optional[ChatAgent] = None
         self.credential: Optional[ChainedTokenCredential] = None
         self.chat_client: Optional[AzureAIAgentClient] = None
+        # Background deletions of per-run service threads
+        self._thread_releases: Set[asyncio.Task] = set()
         self.search_client: Optional[SearchClient] = None
+        self.index_client: Optional[SearchIndexClient] = None
+        self.local_index: Optional[LocalVectorIndex] = None
+        self.keyword_index: Optional[BM25Index] = None
+        self._row_facets: List[Dict[str, Any]] = []
+        self.embedding_client: Optional[AsyncAzureOpenAI] = None
         
         self.name = "Research Agent"
         self.instructions = f"""You are a specialized research agent with access to a travel destination knowledge base via Azure AI Search.
@@ -126,17 +219,61 @@ Always ground your responses in retrieved information and cite your sources (pla
             AzureCliCredential()
         )
         
+        if self.retriever == "local":
+            # In-process index over the knowledge base (no per-query network hop)
+            try:
+                self.local_index = LocalVectorIndex.from_env()
+                self.keyword_index = BM25Index(self.local_index.documents)
+                self._row_facets = [document_facets(doc) for doc in self.local_index.documents]
+                logger.info(
+                    f"Local index loaded - Path: {self.local_index.path}, "
+                    f"Documents: {len(self.local_index)}, Mode: {self.local_index.mode}"
+                )
+                if (self.local_index.meta.get("model") != self.embedding_deployment_name
+                        or self.local_index.meta.get("dimensions") != self.embedding_dimensions):
+                    logger.warning(
+                        f"Local index was built with {self.local_index.meta.get('model')}/"
+                        f"{self.local_index.meta.get('dimensions')} but queries use "
+                        f"{self.embedding_deployment_name}/{self.embedding_dimensions}"
+                    )
+            except (OSError, ValueError, KeyError) as e:
+                # Selected explicitly - answering from general knowledge instead would hide the misconfiguration
+                raise RuntimeError(
+                    f"RESEARCH_RETRIEVER=local but the local index could not be loaded: {e} "
+                    f"(build it with local_index.py and ship it with the service, see Dockerfile)"
+                ) from e
         # Initialize Azure AI Search client if endpoint and key are provided
-        if self.search_endpoint and self.search_index and self.search_key:
+        elif self.search_endpoint and self.search_index and self.search_key:
             self.search_client = SearchClient(
                 endpoint=self.search_endpoint,
                 index_name=self.search_index,
                 credential=AzureKeyCredential(self.search_key)
             )
             logger.info(f"Azure AI Search client initialized - Endpoint: {self.search_endpoint}, Index: {self.search_index}")
+            
+            # Index client only reads the index ETag for cache invalidation
+            if self.retrieval_cache or self.answer_cache:
+                self.index_client = SearchIndexClient(
+                    endpoint=self.search_endpoint,
+                    credential=AzureKeyCredential(self.search_key)
+                )
         else:
             logger.warning(f"Azure AI Search not configured (missing endpoint/index/key) - using general knowledge only")
         
+        # Embedding client for the vector half of hybrid search
+        if self.search_available:
+            if self.vector_search_enabled and self.openai_endpoint:
+                self.embedding_client = AsyncAzureOpenAI(
+                    azure_endpoint=self.openai_endpoint,
+                    azure_ad_token_provider=get_bearer_token_provider(
+                        self.credential, COGNITIVE_SERVICES_SCOPE
+                    ),
+                    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+                )
+                logger.info(f"Query embeddings enabled - Deployment: {self.embedding_deployment_name}")
+            else:
+                logger.warning("Vector search disabled - using keyword search only")
+        
         # Create Azure AI Agent Client
         self.chat_client = AzureAIAgentClient(
             project_endpoint=self.project_endpoint,
@@ -150,7 +287,73 @@ Always ground your responses in retrieved information and cite your sources (pla
             instructions=self.instructions
         )
         
-        logger.info(f"{self.name} initialized - RAG: {'Enabled' if self.search_client else 'Disabled'}")
+        logger.info(f"{self.name} initialized - RAG: {'Enabled' if self.search_available else 'Disabled'}")
+    
+    async def warm_up(self) -> Dict[str, Any]:
+        """
+        Initialize, pre-fetch tokens and open connections with a canary query.
+        
+        Stages run concurrently; a failing stage is logged and reported, not raised.
+        
+        Returns:
+            {"<stage>_ms": duration, ..., "errors": {stage: message}}
+        """
+        if not self.agent:
+            started = time.perf_counter()
+            await self.initialize()
+            report: Dict[str, Any] = {"initialize_ms": round((time.perf_counter() - started) * 1000, 1)}
+        else:
+            report = {}
+        report["errors"] = {}
+        
+        async def timed(stage: str, coro):
+            started = time.perf_counter()
+            try:
+                await coro
+            except Exception as e:
+                logger.warning(f"{self.name} warm-up stage '{stage}' failed: {e}")
+                report["errors"][stage] = str(e)
+            finally:
+                report[f"{stage}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        
+        async def canary_search():
+            # Direct calls (not through the caches) so the connections are really opened
+            query_vector = None
+            if self.embedding_client:
+                response = await self.embedding_client.embeddings.create(
+                    input=WARMUP_QUERY,
+                    model=self.embedding_deployment_name,
+                    dimensions=self.embedding_dimensions
+                )
+                query_vector = response.data[0].embedding
+            # Filtered, so an index without the facet fields is detected before the first request
+            facets = extract_facets(WARMUP_QUERY) if self.facet_filters_enabled else None
+            await asyncio.gather(
+                self._search_knowledge_base(WARMUP_QUERY, top_k=1, query_vector=query_vector, facets=facets),
+                self._current_index_version()
+            )
+        
+        stages = [
+            timed("agent_token", self.credential.get_token(AI_PROJECT_SCOPE)),
+        ]
+        if self.embedding_client:
+            stages.append(timed("embedding_token", self.credential.get_token(COGNITIVE_SERVICES_SCOPE)))
+        if self.search_available:
+            stages.append(timed("canary_search", canary_search()))
+        await asyncio.gather(*stages)
+        return report
+    
+    @property
+    def passage_retrieval(self) -> bool:
+        """True when the active index holds passages rather than whole documents."""
+        if self.local_index:
+            return self.local_index.is_passage_index
+        return self.search_index_passages
+    
+    @property
+    def search_available(self) -> bool:
+        """True when a retriever backend (Azure AI Search or local index) is ready."""
+        return self.search_client is not None or self.local_index is not None
     
     async def cleanup(self):
         """Clean up resources."""
@@ -161,6 +364,23 @@ Always ground your responses in retrieved information and cite your sources (pla
             await self.search_client.close()
             self.search_client = None
         
+        if self.index_client:
+            await self.index_client.close()
+            self.index_client = None
+        
+        self.local_index = None
+        self.keyword_index = None
+        
+        if self.embedding_client:
+            await self.embedding_client.close()
+            self.embedding_client = None
+        
+        if self.embedding_cache:
+            self.embedding_cache.close()
+        
+        if self._thread_releases:
+            await asyncio.gather(*self._thread_releases, return_exceptions=True)
+        
         if self.chat_client:
             await self.chat_client.close()
             self.chat_client = None
@@ -172,48 +392,405 @@ Always ground your responses in retrieved information and cite your sources (pla
         # Give time for connections to close properly
         await asyncio.sleep(0.1)
     
-    async def _search_knowledge_base(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def _embed_query(self, query: str) -> Optional[List[float]]:
         """
-        Search the knowledge base using Azure AI Search.
+        Generate the query embedding for vector search.
+        
+        Args:
+            query: Search query
+            
+        Returns:
+            Embedding vector, or None if embeddings are disabled or fail
+            (search then falls back to keyword only)
+        """
+        if not self.embedding_client:
+            return None
+        
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("research.embed") as span:
+            span.set_attribute("embedding.model", self.embedding_deployment_name)
+            if self.embedding_cache:
+                cached = self.embedding_cache.get(query)
+                span.set_attribute("embedding.cache_hit", cached is not None)
+                span.set_attribute("embedding.cache_hit_rate", self.embedding_cache.hit_rate)
+                if cached is not None:
+                    return cached.tolist()
+            
+            try:
+                response = await self.embedding_client.embeddings.create(
+                    input=query,
+                    model=self.embedding_deployment_name,
+                    dimensions=self.embedding_dimensions
+                )
+                embedding = response.data[0].embedding
+                if self.embedding_cache:
+                    self.embedding_cache.put(query, embedding)
+                return embedding
+            except Exception as e:
+                logger.warning(f"Query embedding failed - falling back to keyword search: {e}")
+                span.set_attribute("embedding.status", "error")
+                return None
+    
+    async def _prepare_thread(self, thread=None) -> Tuple[Any, Optional[str]]:
+        """
+        Conversation thread for this run, created on the service while retrieval runs.
+        
+        Args:
+            thread: Caller's thread (returned as is)
+            
+        Returns:
+            (thread, created_thread_id): a thread bound to a service-side thread id
+            created for this run (deleted by _release_thread afterwards), or a local
+            thread that the agent creates lazily if pre-creation is unavailable
+        """
+        if thread is not None:
+            return thread, None
+        
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("research.thread") as span:
+            project_client = getattr(self.chat_client, "project_client", None)
+            if project_client is None:
+                span.set_attribute("thread.precreated", False)
+                return self.agent.get_new_thread(), None
+            try:
+                service_thread = await project_client.agents.threads.create()
+                span.set_attribute("thread.precreated", True)
+                return self.agent.get_new_thread(service_thread_id=service_thread.id), service_thread.id
+            except Exception as e:
+                logger.warning(f"Thread pre-creation failed - thread will be created with the run: {e}")
+                span.set_attribute("thread.precreated", False)
+                return self.agent.get_new_thread(), None
+    
+    def _release_thread(self, thread_task: asyncio.Task):
+        """Delete the service thread pre-created for a run, in the background."""
+        async def release():
+            try:
+                _, created_thread_id = await thread_task
+            except (asyncio.CancelledError, Exception):
+                return
+            if created_thread_id is None:
+                return
+            try:
+                await self.chat_client.project_client.agents.threads.delete(created_thread_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete thread {created_thread_id}: {e}")
+        
+        task = asyncio.create_task(release())
+        self._thread_releases.add(task)
+        task.add_done_callback(self._thread_releases.discard)
+    
+    async def _current_index_version(self) -> Optional[str]:
+        """
+        Current version of the searched index, for result/answer cache invalidation.
+        
+        Azure AI Search: index ETag + document count (Lab 2 recreates the index on reindex),
+        re-read at most every SEARCH_CACHE_VERSION_CHECK_SECONDS.
+        Local index: hash of the knowledge base file it was built from.
+        
+        Returns:
+            Version string, or None if it has never been read (cache is bypassed)
+        """
+        if self.local_index:
+            return self.local_index.version
+        if not self.index_client:
+            return None
+        
+        now = time.monotonic()
+        known = self._index_version
+        if known is not None and now - self._index_version_checked_at < self.index_version_check_seconds:
+            return known
+        
+        try:
+            index, document_count = await asyncio.gather(
+                self.index_client.get_index(self.search_index),
+                self.search_client.get_document_count()
+            )
+            version = f"{index.e_tag}:{document_count}"
+        except Exception as e:
+            logger.warning(f"Index version check failed - keeping previous version: {e}")
+            version = known
+        
+        self._index_version = version
+        self._index_version_checked_at = now
+        return version
+    
+    async def _lookup_answer(self, embedding_task: asyncio.Task, span) -> Optional[str]:
+        """
+        Semantic answer cache lookup for the current question.
+        
+        Args:
+            embedding_task: In-flight query embedding (awaited here)
+            span: Answer cache span for hit/similarity attributes
+            
+        Returns:
+            Cached answer to a near-duplicate question, or None
+        """
+        version = await self._current_index_version()
+        if version is None:
+            span.set_attribute("answer_cache.status", "no_index_version")
+            return None
+        self.answer_cache.set_version(version)
+        
+        query_vector = await embedding_task
+        if not query_vector:
+            span.set_attribute("answer_cache.status", "no_embedding")
+            return None
+        
+        answer, similarity = self.answer_cache.lookup(query_vector)
+        span.set_attribute("answer_cache.status", "hit" if answer is not None else "miss")
+        span.set_attribute("answer_cache.similarity", similarity)
+        span.set_attribute("answer_cache.threshold", self.answer_cache.threshold)
+        span.set_attribute("answer_cache.hit_rate", self.answer_cache.hit_rate)
+        span.set_attribute("answer_cache.similarity_histogram", self.answer_cache.similarity_histogram.tolist())
+        return answer
+    
+    async def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        embedding_task: Optional[asyncio.Task],
+        span
+    ) -> List[Dict[str, Any]]:
+        """
+        Search through the result cache; the query embedding is only awaited on a miss.
+        
+        Facets named in the query (region, season, difficulty) filter the search; if
+        nothing matches the filter, the search is repeated without it.
+        
+        Args:
+            query: Search query
+            top_k: Number of results to return
+            embedding_task: In-flight query embedding (cancelled on a cache hit)
+            span: Search span for cache/mode attributes
+            
+        Returns:
+            List of search results with content and metadata
+        """
+        facets = extract_facets(query) if self.facet_filters_enabled else QueryFacets()
+        for name, values in facets.as_dict().items():
+            span.set_attribute(f"search.facets.{name}", values)
+        
+        cache_key = None
+        if self.retrieval_cache:
+            version = await self._current_index_version()
+            if version is not None:
+                span.set_attribute("search.cache_invalidated", self.retrieval_cache.set_version(version))
+                span.set_attribute("search.index_version", version)
+                cache_key = RetrievalCache.key(query, top_k, facets.as_dict() or None)
+                cached = self.retrieval_cache.get(cache_key)
+                span.set_attribute("search.cache_hit", cached is not None)
+                span.set_attribute("search.cache_hit_rate", self.retrieval_cache.hit_rate)
+                if cached is not None:
+                    if embedding_task and not embedding_task.done():
+                        embedding_task.cancel()
+                    span.set_attribute("search.mode", "cache")
+                    return cached
+        
+        query_vector = await embedding_task if embedding_task else None
+        if self.local_index:
+            span.set_attribute(
+                "search.mode",
+                f"local_hybrid_{self.local_index.mode}" if query_vector else "local_keyword"
+            )
+        else:
+            span.set_attribute("search.mode", "hybrid" if query_vector else "keyword")
+        span.set_attribute("search.vector_k", self.vector_k if query_vector else 0)
+        if facets and self.facet_filters_enabled:
+            span.set_attribute("search.filter", facets.to_odata())
+        
+        results = await self._search_knowledge_base(query, top_k=top_k, query_vector=query_vector, facets=facets)
+        if facets and not results:
+            span.set_attribute("search.filter_fallback", True)
+            results = await self._search_knowledge_base(query, top_k=top_k, query_vector=query_vector)
+        
+        # Empty results may be a transient failure - don't pin them
+        if cache_key and results:
+            self.retrieval_cache.put(cache_key, results)
+        return results
+    
+    async def _search_knowledge_base(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_vector: Optional[List[float]] = None,
+        facets: Optional[QueryFacets] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search the knowledge base using Azure AI Search or the local index.
         
         Args:
             query: Search query
             top_k: Number of results to return
+            query_vector: Optional query embedding; enables hybrid (vector + keyword) search
+            facets: Optional query facets, pushed down as a filter (OData or local row mask)
             
         Returns:
             List of search results with content and metadata
         """
+        # MMR only reorders the top_k candidates, so vectors are fetched for those hits alone;
+        # passage indexes need several passages per document
+        with_vectors = self.mmr_enabled and bool(query_vector)
+        candidate_k = top_k
+        fetch_k = candidate_k * self.passages_per_document if self.passage_retrieval else candidate_k
+        
+        if self.local_index:
+            allowed = None
+            if facets:
+                allowed = np.fromiter((facets.matches(row) for row in self._row_facets), dtype=bool, count=len(self._row_facets))
+                trace.get_current_span().set_attribute("search.filtered_rows", int(allowed.sum()))
+            search_results = self._search_local_index(query, fetch_k, query_vector, with_vectors, allowed)
+            if self.passage_retrieval:
+                search_results = collapse_passages(search_results, candidate_k)
+            return self._diversify(search_results, query_vector, top_k)
+        
         if not self.search_client:
             logger.warning("Search client not initialized - returning empty results")
             return []
         
+        filter_expression = facets.to_odata() if facets else None
         try:
-            # Perform hybrid search (vector + keyword)
+            # Perform hybrid search (vector + keyword) when an embedding is available
+            vector_queries = None
+            if query_vector:
+                vector_queries = [
+                    VectorizedQuery(
+                        vector=query_vector,
+                        k_nearest_neighbors=max(self.vector_k, fetch_k),
+                        fields="contentVector",
+                        weight=self.vector_weight
+                    )
+                ]
+            
+            select = ["id", "title", "content", "category"]
+            if self.passage_retrieval:
+                select += ["parent_id", "passage_index"]
+            if with_vectors:
+                select.append("contentVector")
+            
             results = await self.search_client.search(
                 search_text=query,
-                top=top_k,
-                select=["id", "title", "content", "category"]
+                vector_queries=vector_queries,
+                filter=filter_expression,
+                # Filter before the k-NN pass so every neighbour satisfies it
+                vector_filter_mode="preFilter" if filter_expression else None,
+                top=fetch_k,
+                select=select
             )
             
             # Collect results
             search_results = []
             async for result in results:
-                search_results.append({
+                search_result = {
                     "id": result.get("id", "unknown"),
                     "title": result.get("title", "Untitled"),
                     "content": result.get("content", ""),
                     "category": result.get("category", "general"),
                     "score": result.get("@search.score", 0.0)
-                })
+                }
+                if self.passage_retrieval:
+                    search_result["parent_id"] = result.get("parent_id")
+                    search_result["passage_index"] = result.get("passage_index", 0)
+                if with_vectors:
+                    search_result["vector"] = result.get("contentVector")
+                search_results.append(search_result)
             
-            return search_results
+            if self.passage_retrieval:
+                search_results = collapse_passages(search_results, candidate_k)
+            return self._diversify(search_results, query_vector, top_k)
             
+        except HttpResponseError as e:
+            if filter_expression and e.status_code == 400 and is_facet_field_error(e.message):
+                # Index predates the facet fields (notebook 02 / passage_chunker.py create them)
+                logger.warning(f"Facet filter rejected by index '{self.search_index}' - disabling facet filters: {e.message}")
+                self.facet_filters_enabled = False
+            elif filter_expression:
+                # Anything else (e.g. a bad value in this query) - only this request searches unfiltered
+                logger.warning(f"Filtered search failed - retrying without facet filters: {e}")
+            else:
+                logger.error(f"Search failed: {e}")
+            return []
         except Exception as e:
             logger.error(f"Search failed: {e}")
             return []
     
+    def _search_local_index(
+        self,
+        query: str,
+        top_k: int,
+        query_vector: Optional[List[float]],
+        with_vectors: bool = False,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """Local hybrid search: BM25 + cosine top-k merged with reciprocal rank fusion (allowed = facet row mask)."""
+        candidates = max(self.vector_k, top_k)
+        rankings = [[row for row, _ in self.keyword_index.search_rows(query, top_k=candidates, allowed=allowed)]]
+        weights = [1.0]
+        
+        if query_vector:
+            try:
+                rankings.append([row for row, _ in self.local_index.search_rows(query_vector, top_k=candidates, allowed=allowed)])
+                weights.append(self.vector_weight)
+            except ValueError as e:
+                logger.error(f"Local vector search failed - using keyword results only: {e}")
+        
+        fused = reciprocal_rank_fusion(rankings, weights)[:top_k]
+        results = [self.local_index.result(row, score) for row, score in fused]
+        if with_vectors:
+            for result, (row, _) in zip(results, fused):
+                result["vector"] = self.local_index.vectors[row]
+        return results
+    
+    def _diversify(
+        self,
+        results: List[Dict[str, Any]],
+        query_vector: Optional[List[float]],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Adaptive top-k cut-off on the score curve, then MMR over document embeddings.
+        
+        MMR only reorders the documents above the cut-off (it never pulls in a
+        document below it) and drops near-duplicates (RETRIEVAL_MMR_MAX_SIMILARITY);
+        the context packer trims from the end, so redundant documents are the
+        first to go when the token budget is tight.
+        
+        Args:
+            results: Candidates, best first (may carry a "vector" key, removed here)
+            query_vector: Query embedding (MMR is skipped without it)
+            top_k: Maximum number of results
+            
+        Returns:
+            Up to top_k relevant results (at least RETRIEVAL_MIN_RESULTS unless near-duplicates
+            were dropped), most distinct first
+        """
+        vectors = [result.pop("vector", None) for result in results]
+        if not results:
+            return results
+        
+        k = adaptive_top_k(
+            [result["score"] for result in results],
+            max_k=top_k,
+            min_k=self.min_results,
+            gap_factor=self.score_gap_factor
+        )
+        
+        span = trace.get_current_span()
+        span.set_attribute("search.candidates", len(results))
+        span.set_attribute("search.adaptive_k", k)
+        
+        vectors = vectors[:k]
+        if self.mmr_enabled and query_vector and k > 1 and all(v is not None for v in vectors):
+            order = mmr(
+                query_vector, np.asarray(vectors, dtype=np.float32), k, self.mmr_lambda, self.mmr_max_similarity
+            )
+            span.set_attribute("search.mmr_reordered", order != list(range(len(order))))
+            span.set_attribute("search.mmr_duplicates_dropped", k - len(order))
+            return [results[i] for i in order]
+        
+        return results[:k]
+    
     def _format_search_results(self, results: List[Dict[str, Any]]) -> str:
-        """Format search results for LLM context."""
+        """Format search results (already trimmed by the context packer) for LLM context."""
         if not results:
             return "No relevant information found in the knowledge base."
         
@@ -223,60 +800,41 @@ Always ground your responses in retrieved information and cite your sources (pla
             formatted += f"[Document {i}] {result['title']}\n"
             formatted += f"Category: {result['category']}\n"
             formatted += f"Document ID: {result['id']}\n"
-            formatted += f"Content: {result['content'][:500]}...\n"  # Limit content length
+            formatted += f"Content: {result['content']}\n"
             formatted += f"(Relevance Score: {result['score']:.2f})\n\n"
         
         return formatted
     
-    def _add_citations_to_response(self, response: str, num_sources: int) -> str:
+    async def run(self, message: str, thread=None) -> str:
         """
-        Automatically add citations to response in Lab 3 style.
+        Run the research agent with a message.
         
         Args:
-            response: LLM response text
-            num_sources: Number of source documents used
+            message: User message
+            thread: Optional thread for conversation continuity
+                (default: a new thread, created concurrently with retrieval)
             
         Returns:
-            Response with citations inserted
+            Agent response text
         """
-        if num_sources == 0:
-            return response
-        
-        # Split response into sentences
-        import re
-        sentences = re.split(r'([.!?]\s+)', response)
-        
-        # Add citations to key sentences (every 2-3 sentences get a citation)
-        result = ""
-        citation_idx = 1
-        sentence_count = 0
-        
-        for i, part in enumerate(sentences):
-            result += part
-            
-            # If this is a sentence ending punctuation
-            if re.match(r'[.!?]\s+', part):
-                sentence_count += 1
-                
-                # Add citation every 2-3 sentences
-                if sentence_count % 2 == 0 and citation_idx <= num_sources:
-                    # Insert citation before the space
-                    citation = f"【{citation_idx}:0†source】"
-                    result = result.rstrip() + citation + " "
-                    citation_idx += 1
-        
-        return result.strip()
+        parts = [delta async for delta in self.run_stream(message, thread=thread)]
+        return "".join(parts).strip()
     
-    async def run(self, message: str, thread=None) -> str:
+    async def run_stream(self, message: str, thread=None) -> AsyncIterator[str]:
         """
-        Run the research agent with a message.
+        Run the research agent and stream the answer as text deltas.
+        
+        Retrieval runs exactly as before; the generation call is streamed and
+        citations are injected as sentences complete, so the caller sees the
+        first tokens while the answer is generated.
         
         Args:
             message: User message
             thread: Optional thread for conversation continuity
+                (default: a new thread, created concurrently with retrieval)
             
-        Returns:
-            Agent response text
+        Yields:
+            Text deltas of the answer (a cached answer is yielded at once)
         """
         if not self.agent:
             raise RuntimeError("Agent not initialized")
@@ -287,24 +845,62 @@ Always ground your responses in retrieved information and cite your sources (pla
         tracer = trace.get_tracer(__name__)
         
         with tracer.start_as_current_span("research_agent.execute") as span:
+            started = time.perf_counter()
+            # Independent setup runs concurrently (each stage has its own child span):
+            # embedding and thread creation start right away and overlap with the
+            # answer cache lookup and retrieval; only generation waits for them.
+            # On an answer cache hit the unused thread is deleted in the background
+            embedding_task = (
+                asyncio.create_task(self._embed_query(message))
+                if self.search_available and self.embedding_client
+                else None
+            )
+            thread_task = asyncio.create_task(self._prepare_thread(thread))
+            
             span.set_attribute("agent.type", "research")
             span.set_attribute("agent.message", mask_content(message))
-            span.set_attribute("research.search_enabled", self.search_client is not None)
-            span.set_attribute("research.index", self.search_index or "not_configured")
+            span.set_attribute("research.search_enabled", self.search_available)
+            span.set_attribute("research.retriever", self.retriever)
+            span.set_attribute(
+                "research.index",
+                self.local_index.path if self.local_index else (self.search_index or "not_configured")
+            )
             
             try:
+                # Near-duplicate of an already answered question? (opt-in)
+                if self.answer_cache and embedding_task:
+                    with tracer.start_as_current_span("research.answer_cache") as cache_span:
+                        cached_answer = await self._lookup_answer(embedding_task, cache_span)
+                    if cached_answer is not None:
+                        span.set_attribute("research.mode", "answer_cache")
+                        span.set_attribute("research.status", "success")
+                        span.set_attribute("research.response_length", len(cached_answer))
+                        yield cached_answer
+                        return
+                
                 # If search is available, perform RAG
-                if self.search_client:
+                if self.search_available:
                     # Search knowledge base with tracing
                     with tracer.start_as_current_span("research.search") as search_span:
                         search_span.set_attribute("search.query", mask_content(message))
                         search_span.set_attribute("search.top_k", 5)
                         
-                        search_results = await self._search_knowledge_base(message, top_k=5)
+                        search_results = await self._retrieve(
+                            message, top_k=5, embedding_task=embedding_task, span=search_span
+                        )
                         
                         search_span.set_attribute("search.results_count", len(search_results))
                         search_span.set_attribute("search.status", "success" if search_results else "no_results")
                     
+                    if search_results:
+                        # Fit the most relevant text into the prompt budget
+                        with tracer.start_as_current_span("research.pack_context") as pack_span:
+                            pack_span.set_attribute("context.documents_retrieved", len(search_results))
+                            search_results = self.context_packer.pack(search_results)
+                            pack_span.set_attribute("context.documents_packed", len(search_results))
+                            pack_span.set_attribute("context.tokens", sum(r["tokens"] for r in search_results))
+                            pack_span.set_attribute("context.token_budget", self.context_packer.token_budget)
+                    
                     if search_results:
                         # Format search results
                         context = self._format_search_results(search_results)
@@ -331,61 +927,74 @@ Please answer using your general knowledge and indicate that the information is
                     logger.warning("Search not available - using general knowledge")
                     span.set_attribute("research.mode", "general_no_search")
                 
+                # Generation needs the thread; it was created during retrieval
+                thread, _ = await thread_task
+                
                 # Run the agent with enhanced message and tracing
                 with tracer.start_as_current_span("research.generate") as gen_span:
                     gen_span.set_attribute("gen_ai.system", "azure_ai_agent_framework")
                     gen_span.set_attribute("gen_ai.request.model", self.model_deployment_name)
                     gen_span.set_attribute("gen_ai.prompt", mask_content(enhanced_message))
                     
-                    result = await self.agent.run(enhanced_message, thread=thread)
+                    # Citations are injected while streaming (RAG answers only)
+                    injector = (
+                        CitationInjector(len(search_results))
+                        if self.search_available and search_results
+                        else None
+                    )
+                    response_parts = []
                     
-                    # Extract response from messages (ChatMessage has 'contents')
-                    response_text = None
+                    async for update in self.agent.run_stream(enhanced_message, thread=thread):
+                        text = getattr(update, "text", None)
+                        if text and injector:
+                            text = injector.feed(text)
+                        if not text:
+                            continue
+                        if not response_parts:
+                            gen_span.set_attribute(
+                                "gen_ai.response.time_to_first_token_ms",
+                                (time.perf_counter() - started) * 1000
+                            )
+                        response_parts.append(text)
+                        yield text
                     
-                    if hasattr(result, 'messages') and result.messages:
-                        last_message = result.messages[-1]
-                        
-                        # Try to get from 'contents' attribute
-                        if hasattr(last_message, 'contents') and last_message.contents:
-                            try:
-                                first_content = last_message.contents[0]
-                                if hasattr(first_content, 'text'):
-                                    response_text = first_content.text
-                                elif hasattr(first_content, '__getattribute__'):
-                                    try:
-                                        response_text = getattr(first_content, 'text')
-                                    except AttributeError:
-                                        pass
-                            except (IndexError, AttributeError, TypeError):
-                                pass
-                        
-                        # Fallback: Try 'text' attribute on message
-                        if not response_text and hasattr(last_message, 'text'):
-                            response_text = last_message.text
+                    if injector:
+                        tail = injector.close()
+                        if tail:
+                            response_parts.append(tail)
+                            yield tail
+                        gen_span.set_attribute("research.citations_added", injector.citations_added)
                     
-                    # Final fallback
-                    if not response_text:
-                        response_text = str(result.text if hasattr(result, 'text') else "No response")
+                    if not response_parts:
+                        response_parts.append("No response")
+                        yield "No response"
                     
-                    # Add citations automatically if RAG was used
-                    if self.search_client and search_results:
-                        response_text = self._add_citations_to_response(response_text, len(search_results))
-                        gen_span.set_attribute("research.citations_added", len(search_results))
+                    response_text = "".join(response_parts).strip()
                     
                     gen_span.set_attribute("gen_ai.completion", mask_content(response_text))
                     gen_span.set_attribute("gen_ai.response.length", len(response_text))
                 
+                # Only grounded answers are reused for paraphrases
+                if (self.answer_cache and self.search_available and search_results
+                        and embedding_task and embedding_task.done() and not embedding_task.cancelled()
+                        and embedding_task.result()):
+                    self.answer_cache.put(embedding_task.result(), response_text)
+                
                 span.set_attribute("research.status", "success")
                 span.set_attribute("research.response_length", len(response_text))
                 
-                return response_text
-                
             except Exception as e:
                 logger.error(f"Error running research agent: {e}")
                 span.set_attribute("research.status", "error")
                 span.set_attribute("error.message", str(e))
                 span.record_exception(e)
                 raise
+            finally:
+                if embedding_task and not embedding_task.done():
+                    embedding_task.cancel()
+                # The run's thread is not handed back to the caller - delete it
+                # (waits for a creation still in flight instead of leaking it)
+                self._release_thread(thread_task)
     
     def get_new_thread(self):
         """Create a new conversation thread."""
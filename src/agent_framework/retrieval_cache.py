@@ -0,0 +1,92 @@
+"""
+Retrieval result cache for the Research Agent.
+
+Sits in front of _search_knowledge_base. Entries are keyed by normalized query
+text + top_k + filters and tagged with the index version they were read from
+(Azure AI Search index ETag/document count, or the local index source hash).
+When the version changes - e.g. Lab 2 recreates the index - every entry is
+dropped, so results never outlive a reindex. Entries also expire after a TTL and
+the cache is bounded with LRU eviction.
+
+Configuration:
+    SEARCH_CACHE_SIZE          max entries (0 disables the cache)
+    SEARCH_CACHE_TTL_SECONDS   entry lifetime
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from embedding_cache import normalize_text
+
+
+class RetrievalCache:
+    """Bounded, TTL'd, version-tagged cache of search results."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version: Optional[str] = None
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["RetrievalCache"]:
+        """Build from SEARCH_CACHE_* variables; None when SEARCH_CACHE_SIZE=0."""
+        max_entries = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600")),
+        )
+
+    @staticmethod
+    def key(query: str, top_k: int, filters: Optional[Any] = None) -> str:
+        return json.dumps([normalize_text(query), top_k, filters], sort_keys=True, ensure_ascii=False)
+
+    def set_version(self, version: Optional[str]) -> bool:
+        """Record the current index version; clears the cache if it changed. Returns True on change."""
+        if version == self.version:
+            return False
+        if self.version is not None:
+            self.invalidations += 1
+        self._entries.clear()
+        self.version = version
+        return True
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, results = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return [dict(result) for result in results]
+
+    def put(self, key: str, results: List[Dict[str, Any]]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, [dict(result) for result in results])
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -8,8 +8,10 @@ import logging
 import os
 import json
 import re
+import time
+import weakref
 import httpx
-from typing import Optional, List, Dict, Any, Annotated
+from typing import Optional, List, Dict, Any, Annotated, AsyncIterator, Tuple
 
 from agent_framework import ChatAgent
 from agent_framework.azure import AzureAIAgentClient
@@ -27,6 +29,74 @@ from masking import mask_content
 
 logger = logging.getLogger(__name__)
 
+# Start of a JSON object or array that may hold one or more tool calls
+_JSON_START_RE = re.compile(r"[\[{]")
+
+
+def _tool_call_key(tool_call: Dict[str, Any]) -> str:
+    """Identity of a tool call, used to match speculative calls to the final plan."""
+    return json.dumps(
+        [tool_call["tool"], tool_call["arguments"]], sort_keys=True, ensure_ascii=False
+    )
+
+
+class _ToolCallStreamParser:
+    """
+    Incremental JSON scanner for streamed planning responses.
+
+    Tracks object nesting and string state across chunks and returns each
+    {"tool": ..., "arguments": {...}} object as soon as its closing brace
+    arrives, so the MCP call can start before the model finishes its output.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: List[int] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume a chunk of streamed text and return tool calls completed by it."""
+        self._text += chunk
+        completed: List[Dict[str, Any]] = []
+
+        for i in range(self._pos, len(self._text)):
+            char = self._text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == "{":
+                self._stack.append(i)
+            elif not self._stack:
+                # Prose outside any JSON object
+                continue
+            elif char == '"':
+                self._in_string = True
+            elif char == "}":
+                start = self._stack.pop()
+                candidate = self._text[start : i + 1]
+                if '"tool"' not in candidate:
+                    continue
+                try:
+                    value = json.loads(candidate)
+                except json.JSONDecodeError:
+                    continue
+                if (
+                    isinstance(value, dict)
+                    and "tool" in value
+                    and isinstance(value.get("arguments"), dict)
+                ):
+                    completed.append(value)
+
+        self._pos = len(self._text)
+        return completed
+
 
 class MCPClient:
     """Direct MCP client for calling MCP server tools."""
@@ -290,6 +360,8 @@ class ToolAgent:
         project_endpoint: Optional[str] = None,
         model_deployment_name: Optional[str] = None,
         mcp_endpoint: Optional[str] = None,
+        max_concurrent_tool_calls: Optional[int] = None,
+        speculative_tool_calls: Optional[bool] = None,
     ):
         """
         Initialize the Tool Agent.
@@ -298,6 +370,12 @@ class ToolAgent:
             project_endpoint: Azure AI Project endpoint
             model_deployment_name: Model deployment name
             mcp_endpoint: Optional MCP server endpoint
+            max_concurrent_tool_calls: Max MCP calls in flight for one turn,
+                prefetched, speculative and planned calls combined
+                (default: MCP_MAX_CONCURRENT_CALLS or 4)
+            speculative_tool_calls: Stream the planning response and start MCP
+                calls as soon as each tool-call JSON closes
+                (default: MCP_SPECULATIVE_CALLS or True)
         """
         self.project_endpoint = project_endpoint
         # Priority: Parameter > Environment variable > Default fallback
@@ -313,6 +391,26 @@ class ToolAgent:
                 self.model_deployment_name = "gpt-4o"
 
         self.mcp_endpoint = mcp_endpoint
+        # Priority: Parameter > Environment variable > Default fallback
+        self.max_concurrent_tool_calls = max(
+            1,
+            max_concurrent_tool_calls
+            or int(os.getenv("MCP_MAX_CONCURRENT_CALLS", "4")),
+        )
+        if speculative_tool_calls is not None:
+            self.speculative_tool_calls = speculative_tool_calls
+        else:
+            self.speculative_tool_calls = os.getenv(
+                "MCP_SPECULATIVE_CALLS", "true"
+            ).lower() in ["1", "true", "yes"]
+
+        # Per-turn MCP cap started by prefetch(), handed to the turn that claims its tasks
+        self._turn_semaphores: "weakref.WeakKeyDictionary[asyncio.Task, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+        # Speculative MCP call counters (started / used by final plan / cancelled)
+        self.speculation_stats: Dict[str, int] = {"started": 0, "used": 0, "wasted": 0}
 
         self.agent: Optional[ChatAgent] = None
         self.credential: Optional[ChainedTokenCredential] = None
@@ -334,14 +432,18 @@ TOOL: get_weather(location)
 
 RULES:
 1. ANY weather question → Return JSON: {"tool": "get_weather", "arguments": {"location": "CityName"}}
-2. Convert Korean city names to English (서울→Seoul, 부산→Busan, 제주→Jeju)
-3. Return ONLY JSON for weather questions (no other text)
-4. Non-weather questions → Answer normally
+2. Several cities in one question → Return a JSON array with one call per city
+3. Convert Korean city names to English (서울→Seoul, 부산→Busan, 제주→Jeju)
+4. Return ONLY JSON for weather questions (no other text)
+5. Non-weather questions → Answer normally
 
 EXAMPLES:
 Q: "서울 날씨"
 A: {"tool": "get_weather", "arguments": {"location": "Seoul"}}
 
+Q: "서울이랑 부산 날씨 알려줘"
+A: [{"tool": "get_weather", "arguments": {"location": "Seoul"}}, {"tool": "get_weather", "arguments": {"location": "Busan"}}]
+
 Q: "서울의 현재 날씨를 알려주세요. 온도와 체감온도, 날씨 상태, 습도, 바람 정보를 모두 포함해주세요."
 A: {"tool": "get_weather", "arguments": {"location": "Seoul"}}
 
@@ -414,13 +516,19 @@ A: 안녕하세요! 무엇을 도와드릴까요?"""
         # Give time for connections to close properly
         await asyncio.sleep(0.1)
 
-    async def run(self, message: str, thread=None) -> str:
+    async def run(
+        self,
+        message: str,
+        thread=None,
+        prefetched: Optional[Dict[str, asyncio.Task]] = None,
+    ) -> str:
         """
         Run the tool agent with a message.
 
         Args:
             message: User message
             thread: Optional thread for conversation continuity
+            prefetched: Optional MCP calls already started by prefetch()
 
         Returns:
             Agent response text
@@ -445,208 +553,523 @@ A: 안녕하세요! 무엇을 도와드릴까요?"""
                 if thread is None:
                     thread = self.agent.get_new_thread()
 
-                # Get LLM response with tracing
-                with tracer.start_as_current_span("tool_agent.llm_call") as llm_span:
-                    llm_span.set_attribute("gen_ai.system", "azure_ai_agent_framework")
-                    llm_span.set_attribute(
+                response_text, format_prompt, fallback_text = await self._plan(
+                    message, thread, prefetched
+                )
+
+                if format_prompt is None:
+                    span.set_attribute("tool.status", "success_no_tool_call")
+                    span.set_attribute("tool.response_length", len(response_text))
+
+                    return response_text
+
+                with tracer.start_as_current_span(
+                    "tool_agent.format_result"
+                ) as format_span:
+                    format_span.set_attribute(
+                        "gen_ai.system", "azure_ai_agent_framework"
+                    )
+                    format_span.set_attribute(
                         "gen_ai.request.model", self.model_deployment_name
                     )
-                    llm_span.set_attribute("gen_ai.prompt", mask_content(message))
+                    format_span.set_attribute(
+                        "gen_ai.prompt", mask_content(format_prompt)
+                    )
 
-                    result = await self.agent.run(message, thread=thread)
+                    # Run LLM again to format the result
+                    format_result = await self.agent.run(format_prompt, thread=thread)
 
-                    # Extract response using the same logic as research_agent
-                    response_text = None
+                    # Extract formatted response
+                    formatted_response = None
 
-                    if hasattr(result, "messages") and result.messages:
-                        last_message = result.messages[-1]
+                    if hasattr(format_result, "messages") and format_result.messages:
+                        last_message = format_result.messages[-1]
 
-                        # Try to get from 'contents' attribute
                         if hasattr(last_message, "contents") and last_message.contents:
                             try:
                                 first_content = last_message.contents[0]
                                 if hasattr(first_content, "text"):
-                                    response_text = first_content.text
-                                elif hasattr(first_content, "__getattribute__"):
-                                    try:
-                                        response_text = getattr(first_content, "text")
-                                    except AttributeError:
-                                        pass
+                                    formatted_response = first_content.text
                             except (IndexError, AttributeError, TypeError):
                                 pass
 
-                        # Fallback: Try 'text' attribute on message
-                        if not response_text and hasattr(last_message, "text"):
-                            response_text = last_message.text
+                        if not formatted_response and hasattr(last_message, "text"):
+                            formatted_response = last_message.text
 
-                    # Final fallback
-                    if not response_text:
-                        response_text = "No response"
-                        logger.warning("No response extracted from tool agent LLM call")
+                    if not formatted_response:
+                        formatted_response = fallback_text
+                        logger.warning("Failed to format tool result, using raw data")
 
-                    llm_span.set_attribute(
-                        "gen_ai.completion", mask_content(response_text)
+                    format_span.set_attribute(
+                        "gen_ai.completion", mask_content(formatted_response)
+                    )
+                    format_span.set_attribute(
+                        "gen_ai.response.length", len(formatted_response)
                     )
-                    llm_span.set_attribute("gen_ai.response.length", len(response_text))
-
-                # Check if LLM wants to call a tool
-                if self.mcp_client:
-                    tool_call = self._parse_tool_call(response_text)
-
-                    if tool_call:
-                        tool_name = tool_call["tool"]
-                        arguments = tool_call["arguments"]
-
-                        # Call the MCP tool with tracing
-                        with tracer.start_as_current_span(
-                            "tool_agent.mcp_call"
-                        ) as mcp_span:
-                            mcp_span.set_attribute("mcp.tool_name", tool_name)
-                            mcp_span.set_attribute(
-                                "mcp.arguments", json.dumps(arguments)
-                            )
 
-                            tool_result = await self.mcp_client.call_tool(
-                                tool_name, arguments
-                            )
+                span.set_attribute("tool.final_response_length", len(formatted_response))
+                span.set_attribute("tool.status", "success_with_tool_call")
 
-                            mcp_span.set_attribute("mcp.result", str(tool_result)[:500])
+                return formatted_response
 
-                        # Format result
-                        if isinstance(tool_result, dict):
-                            result_str = json.dumps(
-                                tool_result, ensure_ascii=False, indent=2
-                            )
-                        else:
-                            result_str = str(tool_result)
+            except Exception as e:
+                logger.error(f"Error running tool agent: {e}", exc_info=True)
+                span.set_attribute("tool.status", "error")
+                span.set_attribute("error.message", str(e))
+                span.record_exception(e)
+                raise
 
-                        # ====================================================================
-                        # IMPORTANT: Send tool result back to LLM for proper formatting
-                        # ====================================================================
+    async def run_stream(
+        self,
+        message: str,
+        thread=None,
+        prefetched: Optional[Dict[str, asyncio.Task]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Run the tool agent and stream the final answer as text deltas.
 
-                        format_prompt = f"""Tool '{tool_name}' returned the following result. Please present this ACTUAL data to the user in a clear, friendly format. DO NOT use placeholders:
+        Planning and MCP calls run exactly as in run(); the formatting LLM call
+        is streamed so the caller sees the first tokens while it is generated.
 
-{result_str}
+        Args:
+            message: User message
+            thread: Optional thread for conversation continuity
+            prefetched: Optional MCP calls already started by prefetch()
 
-Present the data clearly with all details."""
+        Yields:
+            Text deltas of the final answer
+        """
+        if not self.agent:
+            raise RuntimeError("Agent not initialized")
 
-                        with tracer.start_as_current_span(
-                            "tool_agent.format_result"
-                        ) as format_span:
-                            format_span.set_attribute(
-                                "gen_ai.system", "azure_ai_agent_framework"
-                            )
-                            format_span.set_attribute(
-                                "gen_ai.request.model", self.model_deployment_name
-                            )
-                            format_span.set_attribute(
-                                "gen_ai.prompt", mask_content(format_prompt)
-                            )
+        tracer = trace.get_tracer(__name__)
 
-                            # Run LLM again to format the result
-                            format_result = await self.agent.run(
-                                format_prompt, thread=thread
-                            )
+        with tracer.start_as_current_span("tool_agent.execute_stream") as span:
+            span.set_attribute("agent.type", "tool")
+            span.set_attribute("agent.message", mask_content(message))
+            span.set_attribute(
+                "tool.mcp_endpoint", self.mcp_endpoint or "not_configured"
+            )
+            started = time.perf_counter()
 
-                            # Extract formatted response
-                            formatted_response = None
-
-                            if (
-                                hasattr(format_result, "messages")
-                                and format_result.messages
-                            ):
-                                last_message = format_result.messages[-1]
-
-                                if (
-                                    hasattr(last_message, "contents")
-                                    and last_message.contents
-                                ):
-                                    try:
-                                        first_content = last_message.contents[0]
-                                        if hasattr(first_content, "text"):
-                                            formatted_response = first_content.text
-                                    except (IndexError, AttributeError, TypeError):
-                                        pass
-
-                                if not formatted_response and hasattr(
-                                    last_message, "text"
-                                ):
-                                    formatted_response = last_message.text
-
-                            if not formatted_response:
-                                formatted_response = f"날씨 정보:\n{result_str}"
-                                logger.warning(
-                                    "Failed to format tool result, using raw data"
-                                )
+            try:
+                if thread is None:
+                    thread = self.agent.get_new_thread()
 
-                            format_span.set_attribute(
-                                "gen_ai.completion", mask_content(formatted_response)
-                            )
-                            format_span.set_attribute(
-                                "gen_ai.response.length", len(formatted_response)
-                            )
+                response_text, format_prompt, fallback_text = await self._plan(
+                    message, thread, prefetched
+                )
+
+                if format_prompt is None:
+                    span.set_attribute(
+                        "gen_ai.response.time_to_first_token_ms",
+                        (time.perf_counter() - started) * 1000,
+                    )
+                    span.set_attribute("tool.status", "success_no_tool_call")
+                    span.set_attribute("tool.response_length", len(response_text))
+                    yield response_text
+                    return
+
+                with tracer.start_as_current_span(
+                    "tool_agent.format_result_stream"
+                ) as format_span:
+                    format_span.set_attribute(
+                        "gen_ai.system", "azure_ai_agent_framework"
+                    )
+                    format_span.set_attribute(
+                        "gen_ai.request.model", self.model_deployment_name
+                    )
+                    format_span.set_attribute(
+                        "gen_ai.prompt", mask_content(format_prompt)
+                    )
+
+                    response_length = 0
 
-                        span.set_attribute(
-                            "tool.final_response_length", len(formatted_response)
-                        )
-                        span.set_attribute("tool.status", "success_with_tool_call")
+                    async for update in self.agent.run_stream(
+                        format_prompt, thread=thread
+                    ):
+                        text = getattr(update, "text", None)
+                        if not text:
+                            continue
 
-                        return formatted_response
+                        if response_length == 0:
+                            span.set_attribute(
+                                "gen_ai.response.time_to_first_token_ms",
+                                (time.perf_counter() - started) * 1000,
+                            )
+                        response_length += len(text)
+                        yield text
+
+                    if response_length == 0:
+                        logger.warning("Failed to format tool result, using raw data")
+                        response_length = len(fallback_text)
+                        yield fallback_text
 
-                span.set_attribute("tool.status", "success_no_tool_call")
-                span.set_attribute("tool.response_length", len(response_text))
+                    format_span.set_attribute("gen_ai.response.length", response_length)
 
-                return response_text
+                span.set_attribute("tool.final_response_length", response_length)
+                span.set_attribute("tool.status", "success_with_tool_call")
 
             except Exception as e:
-                logger.error(f"Error running tool agent: {e}", exc_info=True)
+                logger.error(f"Error streaming tool agent: {e}", exc_info=True)
                 span.set_attribute("tool.status", "error")
                 span.set_attribute("error.message", str(e))
                 span.record_exception(e)
                 raise
 
-    def _parse_tool_call(self, response: str) -> Optional[Dict[str, Any]]:
-        """Parse tool call from LLM response."""
+    async def _plan(
+        self,
+        message: str,
+        thread,
+        prefetched: Optional[Dict[str, asyncio.Task]] = None,
+    ) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Run the planning LLM call and any MCP tools it requests.
+
+        Args:
+            message: User message
+            thread: Conversation thread
+            prefetched: MCP calls already running, claimed like speculative calls
+
+        Returns:
+            (response_text, format_prompt, fallback_text). format_prompt is None
+            when the model answered directly without a tool call; fallback_text
+            is the raw tool output to show if formatting fails.
+        """
+        tracer = trace.get_tracer(__name__)
+
+        # MCP calls shared by prefetched, speculative and final tool calls of this turn
+        speculative: Dict[str, asyncio.Task] = dict(prefetched or {})
+        semaphore = next(
+            (self._turn_semaphores[task] for task in speculative.values() if task in self._turn_semaphores),
+            None,
+        ) or asyncio.Semaphore(self.max_concurrent_tool_calls)
+
         try:
-            # Try parsing entire response as JSON
-            response_stripped = response.strip()
-            if response_stripped.startswith("{") and response_stripped.endswith("}"):
-                tool_call = json.loads(response_stripped)
-                if "tool" in tool_call and "arguments" in tool_call:
-                    logger.info(f"[parse] Found tool call: {tool_call}")
-                    return tool_call
-
-            # Try finding JSON pattern
-            json_match = re.search(
-                r'\{[^}]*"tool"[^}]*"arguments"[^}]*\}', response, re.DOTALL
-            )
-            if json_match:
-                json_str = json_match.group(0)
-                brace_count = 0
-                end_pos = 0
-                for i, char in enumerate(json_str):
-                    if char == "{":
-                        brace_count += 1
-                    elif char == "}":
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end_pos = i + 1
-                            break
+            # Get LLM response with tracing
+            with tracer.start_as_current_span("tool_agent.llm_call") as llm_span:
+                llm_span.set_attribute("gen_ai.system", "azure_ai_agent_framework")
+                llm_span.set_attribute("gen_ai.request.model", self.model_deployment_name)
+                llm_span.set_attribute("gen_ai.prompt", mask_content(message))
+                llm_span.set_attribute(
+                    "tool.speculative_enabled",
+                    bool(self.speculative_tool_calls and self.mcp_client),
+                )
+
+                response_text = None
+                result = None
+
+                if self.speculative_tool_calls and self.mcp_client:
+                    # Stream the plan; MCP calls start as each tool-call JSON closes
+                    response_text = await self._stream_plan(
+                        message, thread, semaphore, speculative
+                    )
+                    llm_span.set_attribute("tool.speculative_started", len(speculative))
+                else:
+                    result = await self.agent.run(message, thread=thread)
+
+                # Extract response using the same logic as research_agent
+                if result is not None and hasattr(result, "messages") and result.messages:
+                    last_message = result.messages[-1]
+
+                    # Try to get from 'contents' attribute
+                    if hasattr(last_message, "contents") and last_message.contents:
+                        try:
+                            first_content = last_message.contents[0]
+                            if hasattr(first_content, "text"):
+                                response_text = first_content.text
+                            elif hasattr(first_content, "__getattribute__"):
+                                try:
+                                    response_text = getattr(first_content, "text")
+                                except AttributeError:
+                                    pass
+                        except (IndexError, AttributeError, TypeError):
+                            pass
+
+                    # Fallback: Try 'text' attribute on message
+                    if not response_text and hasattr(last_message, "text"):
+                        response_text = last_message.text
+
+                # Final fallback
+                if not response_text:
+                    response_text = "No response"
+                    logger.warning("No response extracted from tool agent LLM call")
+
+                llm_span.set_attribute("gen_ai.completion", mask_content(response_text))
+                llm_span.set_attribute("gen_ai.response.length", len(response_text))
+
+            # Check if LLM wants to call one or more tools
+            tool_calls = self._parse_tool_calls(response_text) if self.mcp_client else []
+            if not tool_calls:
+                return response_text, None, None
+
+            # Call all requested MCP tools concurrently with tracing
+            with tracer.start_as_current_span("tool_agent.mcp_calls") as mcp_span:
+                mcp_span.set_attribute("mcp.call_count", len(tool_calls))
+                mcp_span.set_attribute("mcp.max_concurrency", self.max_concurrent_tool_calls)
+
+                # Unclaimed speculative calls are cancelled before the planned ones
+                # start, so they do not hold semaphore slots the real calls wait for
+                planned_keys = {_tool_call_key(tool_call) for tool_call in tool_calls}
+                unclaimed = {key: task for key, task in speculative.items() if key not in planned_keys}
+                for key in unclaimed:
+                    del speculative[key]
+                mcp_span.set_attribute(
+                    "mcp.speculative_wasted", self._cancel_speculative(unclaimed)
+                )
+
+                tool_results = await self._call_tools(tool_calls, semaphore, speculative)
+
+            result_str = self._format_tool_results(tool_results)
+            tool_name = ", ".join(dict.fromkeys(name for name, _, _ in tool_results))
+
+            # ====================================================================
+            # IMPORTANT: Send tool result back to LLM for proper formatting
+            # ====================================================================
+
+            if len(tool_results) == 1:
+                format_prompt = f"""Tool '{tool_name}' returned the following result. Please present this ACTUAL data to the user in a clear, friendly format. DO NOT use placeholders:
+
+{result_str}
+
+Present the data clearly with all details."""
+            else:
+                format_prompt = f"""Tools '{tool_name}' were called {len(tool_results)} times and returned the following results. Please present ALL of this ACTUAL data to the user in a clear, friendly format. DO NOT use placeholders:
+
+{result_str}
 
-                if end_pos > 0:
-                    json_str = json_str[:end_pos]
+Present the data clearly with all details for every result."""
+
+            return response_text, format_prompt, f"날씨 정보:\n{result_str}"
+        finally:
+            # Speculative calls the final plan did not use are cancelled
+            wasted = self._cancel_speculative(speculative)
+            if wasted:
+                trace.get_current_span().set_attribute("tool.speculative_wasted", wasted)
+
+    def prefetch(self, tool_calls: List[Dict[str, Any]]) -> Dict[str, asyncio.Task]:
+        """
+        Start MCP calls before planning, e.g. while the router is still deciding.
 
-                tool_call = json.loads(json_str)
+        Pass the returned tasks to run()/run_stream() as `prefetched`; calls the
+        plan also requests are awaited instead of re-issued, the rest are
+        cancelled and counted as wasted.
+
+        Args:
+            tool_calls: Tool calls to start ({"tool": ..., "arguments": {...}})
+
+        Returns:
+            Running tasks keyed by tool call identity
+        """
+        if not self.mcp_client:
+            return {}
 
-                if "tool" in tool_call and "arguments" in tool_call:
-                    logger.info(f"[parse] Found tool call: {tool_call}")
-                    return tool_call
+        # The turn's cap starts here - run()/run_stream() reuse it for the rest of the turn
+        semaphore = asyncio.Semaphore(self.max_concurrent_tool_calls)
+        tasks: Dict[str, asyncio.Task] = {}
 
-            return None
+        for tool_call in tool_calls:
+            key = _tool_call_key(tool_call)
+            if key not in tasks:
+                logger.info(f"[prefetch] Starting {tool_call['tool']} {tool_call['arguments']}")
+                tasks[key] = asyncio.create_task(self._call_tool(tool_call, semaphore))
+                self._turn_semaphores[tasks[key]] = semaphore
+                self.speculation_stats["started"] += 1
+
+        return tasks
+
+    async def _stream_plan(
+        self,
+        message: str,
+        thread,
+        semaphore: asyncio.Semaphore,
+        speculative: Dict[str, asyncio.Task],
+    ) -> str:
+        """
+        Stream the planning response and start MCP calls speculatively.
+
+        Each tool call is started as soon as its JSON object closes in the
+        token stream, overlapping the MCP round trip with the model's
+        trailing output. Started tasks are registered in `speculative`.
+
+        Returns:
+            Full planning response text
+        """
+        parser = _ToolCallStreamParser()
+        chunks: List[str] = []
+
+        async for update in self.agent.run_stream(message, thread=thread):
+            text = getattr(update, "text", None)
+            if not text:
+                continue
 
+            chunks.append(text)
+
+            for tool_call in parser.feed(text):
+                key = _tool_call_key(tool_call)
+                if key not in speculative:
+                    logger.info(f"[speculative] Starting {tool_call['tool']} early")
+                    speculative[key] = asyncio.create_task(
+                        self._call_tool(tool_call, semaphore)
+                    )
+                    self.speculation_stats["started"] += 1
+
+        return "".join(chunks)
+
+    def _cancel_speculative(self, speculative: Dict[str, asyncio.Task]) -> int:
+        """Cancel speculative calls not claimed by the final plan and count them."""
+        wasted = len(speculative)
+
+        for task in speculative.values():
+            task.cancel()
+        speculative.clear()
+
+        if wasted:
+            self.speculation_stats["wasted"] += wasted
+            logger.info(f"[speculative] Cancelled {wasted} unused MCP call(s)")
+
+        return wasted
+
+    async def _call_tool(
+        self, tool_call: Dict[str, Any], semaphore: asyncio.Semaphore
+    ) -> Tuple[str, Dict[str, Any], Any]:
+        """Call one MCP tool under the concurrency cap; errors become {"error": ...}."""
+        tracer = trace.get_tracer(__name__)
+        tool_name = tool_call["tool"]
+        arguments = tool_call["arguments"]
+
+        async with semaphore:
+            with tracer.start_as_current_span("tool_agent.mcp_call") as mcp_span:
+                mcp_span.set_attribute("mcp.tool_name", tool_name)
+                mcp_span.set_attribute("mcp.arguments", json.dumps(arguments))
+
+                try:
+                    tool_result = await self.mcp_client.call_tool(tool_name, arguments)
+                except Exception as e:
+                    logger.error(f"MCP tool {tool_name} failed: {e}")
+                    mcp_span.record_exception(e)
+                    tool_result = {"error": str(e)}
+
+                mcp_span.set_attribute("mcp.result", str(tool_result)[:500])
+
+        return tool_name, arguments, tool_result
+
+    async def _call_tools(
+        self,
+        tool_calls: List[Dict[str, Any]],
+        semaphore: Optional[asyncio.Semaphore] = None,
+        speculative: Optional[Dict[str, asyncio.Task]] = None,
+    ) -> List[Tuple[str, Dict[str, Any], Any]]:
+        """
+        Call several MCP tools concurrently, bounded by max_concurrent_tool_calls.
+
+        Args:
+            tool_calls: Parsed tool calls ({"tool": ..., "arguments": {...}})
+            semaphore: Concurrency cap shared with speculative calls
+            speculative: Already-running calls keyed by _tool_call_key; matching
+                entries are awaited instead of re-issued and removed from the dict
+
+        Returns:
+            List of (tool_name, arguments, result) in the same order as tool_calls.
+            A failed call yields {"error": ...} instead of failing the whole batch.
+        """
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrent_tool_calls)
+        if speculative is None:
+            speculative = {}
+
+        pending = []
+        for tool_call in tool_calls:
+            task = speculative.pop(_tool_call_key(tool_call), None)
+            if task is not None:
+                self.speculation_stats["used"] += 1
+                pending.append(task)
+            else:
+                pending.append(self._call_tool(tool_call, semaphore))
+
+        return list(await asyncio.gather(*pending))
+
+    def _format_tool_results(
+        self, tool_results: List[Tuple[str, Dict[str, Any], Any]]
+    ) -> str:
+        """Format one or more tool results for the formatting LLM call."""
+        formatted = []
+
+        for tool_name, arguments, tool_result in tool_results:
+            if isinstance(tool_result, dict):
+                result_str = json.dumps(tool_result, ensure_ascii=False, indent=2)
+            else:
+                result_str = str(tool_result)
+
+            if len(tool_results) > 1:
+                args_str = json.dumps(arguments, ensure_ascii=False)
+                result_str = f"[{tool_name} {args_str}]\n{result_str}"
+
+            formatted.append(result_str)
+
+        return "\n\n".join(formatted)
+
+    def _parse_tool_calls(self, response: str) -> List[Dict[str, Any]]:
+        """
+        Parse all tool calls from LLM response.
+
+        Accepts a single {"tool": ..., "arguments": {...}} object, a JSON array
+        of such objects, or several objects embedded in the response text.
+        """
+        tool_calls: List[Dict[str, Any]] = []
+        decoder = json.JSONDecoder()
+        pos = 0
+
+        while True:
+            match = _JSON_START_RE.search(response, pos)
+            if not match:
+                break
+
+            try:
+                value, end_pos = decoder.raw_decode(response, match.start())
+            except json.JSONDecodeError:
+                pos = match.start() + 1
+                continue
+
+            candidates = value if isinstance(value, list) else [value]
+            for candidate in candidates:
+                if (
+                    isinstance(candidate, dict)
+                    and "tool" in candidate
+                    and isinstance(candidate.get("arguments"), dict)
+                ):
+                    tool_calls.append(candidate)
+
+            pos = end_pos
+
+        if tool_calls:
+            logger.info(f"[parse] Found {len(tool_calls)} tool call(s): {tool_calls}")
+
+        return tool_calls
+
+    async def warm_up(self) -> Dict[str, Any]:
+        """
+        Initialize (MCP handshake + tools/list is the canary) and pre-fetch the agent token.
+
+        Returns:
+            {"<stage>_ms": duration, ..., "errors": {stage: message}}
+        """
+        report: Dict[str, Any] = {"errors": {}}
+
+        if not self.agent:
+            started = time.perf_counter()
+            await self.initialize()
+            report["initialize_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        started = time.perf_counter()
+        try:
+            await self.credential.get_token("https://ai.azure.com/.default")
         except Exception as e:
-            logger.debug(f"[parse] No tool call found: {e}")
-            return None
+            logger.warning(f"{self.name} warm-up token prefetch failed: {e}")
+            report["errors"]["agent_token"] = str(e)
+        report["agent_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["mcp_tools"] = len(self.mcp_client.available_tools) if self.mcp_client else 0
+        return report
 
     def get_new_thread(self):
         """Create a new conversation thread."""
@@ -0,0 +1,279 @@
+"""
+Persistent agent registry for the Foundry agents.
+
+api_server used to create the Tool, Research and Main agents on every container
+start and delete them on shutdown: cold start paid three creation round trips
+and a crashed replica leaked its agents.
+
+AgentRegistry reuses agents across restarts and replicas instead:
+- Every agent is created with metadata holding a hash of its name, model,
+  instructions, tools and tool resources
+- get_or_create() looks up an existing agent with the same name and hash (one
+  list_agents call shared by all agents) and only creates one when the
+  definition drifted
+- Registry-managed agents with a managed name that are no longer in use
+  (older definitions, duplicates from replicas racing at startup) are marked
+  superseded in their metadata the first time a replica sees them, and deleted
+  by a background task once they have been superseded - and not used - for
+  longer than a grace period. Every replica records a heartbeat on the agents it
+  uses, so replicas still running the previous definition are not broken
+  during a rollout, however old their agents are
+
+With persistent=False the registry behaves as before: every boot creates new
+agents and release() deletes them.
+
+Usage:
+    registry = AgentRegistry.from_env(project_client)
+    agent_id = await registry.get_or_create(name="Tool Agent", model="gpt-4o", instructions="...")
+    registry.start_gc()  # heartbeat + orphan collection loop
+    ...
+    await registry.release(agent_id)  # deletes only when not persistent
+    await registry.close()
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from azure.ai.projects.aio import AIProjectClient
+
+logger = logging.getLogger(__name__)
+
+# Metadata keys on registry-managed agents
+REGISTRY_KEY = "registry"
+REGISTRY_VALUE = "agentic-ai-labs"
+HASH_KEY = "config_hash"
+SUPERSEDED_KEY = "superseded_at"  # epoch seconds a replica first found the agent unused
+HEARTBEAT_KEY = "last_seen"  # epoch seconds a replica last used the agent
+
+
+def _plain(value: Any) -> Any:
+    """SDK models (tool definitions/resources) to JSON-serializable values."""
+    if hasattr(value, "as_dict"):
+        return _plain(value.as_dict())
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def config_hash(name: str, model: str, instructions: str, tools: Any = None, tool_resources: Any = None) -> str:
+    """Stable hash of everything that defines an agent."""
+    payload = json.dumps(
+        {
+            "name": name,
+            "model": model,
+            "instructions": instructions,
+            "tools": _plain(tools or []),
+            "tool_resources": _plain(tool_resources or {}),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _metadata_time(agent: Any, key: str) -> Optional[float]:
+    """Epoch seconds stored under a metadata key (None if missing or malformed)."""
+    value = (agent.metadata or {}).get(key)
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class AgentRegistry:
+    """Looks up agents by name + definition hash; creates only on drift."""
+
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        persistent: bool = True,
+        orphan_grace_seconds: float = 3600.0,
+        heartbeat_seconds: float = 600.0,
+    ):
+        """
+        Initialize the agent registry.
+
+        Args:
+            project_client: Async AIProjectClient instance
+            persistent: Reuse agents across restarts (False = create on boot, delete on release)
+            orphan_grace_seconds: Unused managed agents are deleted once they have been
+                superseded, and without a heartbeat, for this long
+            heartbeat_seconds: How often in-use agents get a heartbeat and orphans are
+                collected (keep well below orphan_grace_seconds)
+        """
+        self.project_client = project_client
+        self.persistent = persistent
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.heartbeat_seconds = max(1.0, heartbeat_seconds)
+
+        self._existing: Optional[List[Any]] = None
+        self._list_lock = asyncio.Lock()
+        self._managed_names: Set[str] = set()
+        self._in_use: Dict[str, Dict[str, str]] = {}  # agent id -> metadata
+        self._gc_task: Optional[asyncio.Task] = None
+        self.report: Dict[str, str] = {}  # agent name -> "reused" / "created"
+
+    @classmethod
+    def from_env(cls, project_client: AIProjectClient) -> "AgentRegistry":
+        """
+        Create a registry configured from environment variables.
+
+        Priority: Environment variable > Default fallback
+        """
+        return cls(
+            project_client,
+            persistent=os.getenv("AGENT_REGISTRY_ENABLED", "true").lower() in ["1", "true", "yes"],
+            orphan_grace_seconds=float(os.getenv("AGENT_REGISTRY_ORPHAN_GRACE_SECONDS", "3600")),
+            heartbeat_seconds=float(os.getenv("AGENT_REGISTRY_HEARTBEAT_SECONDS", "600")),
+        )
+
+    async def _list_managed(self) -> List[Any]:
+        """Registry-managed agents in the project, oldest first."""
+        return [
+            agent
+            async for agent in self.project_client.agents.list_agents(limit=100, order="asc")
+            if (agent.metadata or {}).get(REGISTRY_KEY) == REGISTRY_VALUE
+        ]
+
+    async def _managed_agents(self) -> List[Any]:
+        """Registry-managed agents at startup (listed once, shared by concurrent callers)."""
+        async with self._list_lock:
+            if self._existing is None:
+                self._existing = await self._list_managed()
+                logger.info(f"Agent registry: {len(self._existing)} managed agent(s) in project")
+            return self._existing
+
+    async def get_or_create(
+        self,
+        name: str,
+        model: str,
+        instructions: str,
+        tools: Any = None,
+        tool_resources: Any = None,
+    ) -> str:
+        """
+        Return the id of an agent matching this definition, creating it if needed.
+
+        Args:
+            name: Agent name
+            model: Model deployment name
+            instructions: System instructions
+            tools: Tool definitions (optional)
+            tool_resources: Tool resources (optional)
+
+        Returns:
+            Agent id
+        """
+        digest = config_hash(name, model, instructions, tools, tool_resources)
+
+        if self.persistent:
+            self._managed_names.add(name)
+            # Oldest first - replicas racing at startup all settle on the same agent
+            for agent in await self._managed_agents():
+                if agent.name == name and agent.metadata.get(HASH_KEY) == digest:
+                    logger.info(f"Reusing {name}: {agent.id}")
+                    metadata = {key: value for key, value in agent.metadata.items() if key != SUPERSEDED_KEY}
+                    if SUPERSEDED_KEY in agent.metadata:
+                        # Current again (e.g. rollback) - stop its grace period
+                        await self._update_metadata(agent.id, metadata)
+                    self._in_use[agent.id] = metadata
+                    self.report[name] = "reused"
+                    return agent.id
+
+        kwargs: Dict[str, Any] = {"model": model, "name": name, "instructions": instructions}
+        if tools:
+            kwargs["tools"] = tools
+        if tool_resources:
+            kwargs["tool_resources"] = tool_resources
+        if self.persistent:
+            kwargs["metadata"] = {REGISTRY_KEY: REGISTRY_VALUE, HASH_KEY: digest}
+
+        agent = await self.project_client.agents.create_agent(**kwargs)
+        logger.info(f"Created {name}: {agent.id}" + (" (definition changed)" if self.persistent else ""))
+        self._in_use[agent.id] = dict(kwargs.get("metadata") or {})
+        self.report[name] = "created"
+        return agent.id
+
+    async def release(self, agent_id: Optional[str]):
+        """Give an agent back on shutdown (deleted only when the registry is not persistent)."""
+        if not agent_id:
+            return
+        self._in_use.pop(agent_id, None)
+        if not self.persistent:
+            await self.project_client.agents.delete_agent(agent_id)
+
+    def start_gc(self):
+        """Start heartbeats and orphan collection in the background (after all agents are resolved)."""
+        if self.persistent and self._in_use and not self._gc_task:
+            self._gc_task = asyncio.create_task(self._gc_loop())
+
+    async def _gc_loop(self):
+        while True:
+            try:
+                await self._heartbeat()
+                await self._collect_orphans()
+            except Exception as e:
+                logger.warning(f"Agent registry maintenance failed: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def _update_metadata(self, agent_id: str, metadata: Dict[str, str]) -> bool:
+        try:
+            await self.project_client.agents.update_agent(agent_id, metadata=metadata)
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to update metadata of agent {agent_id}: {e}")
+            return False
+
+    async def _heartbeat(self):
+        """Record that this replica still uses its agents."""
+        now = str(int(time.time()))
+        for agent_id, metadata in list(self._in_use.items()):
+            metadata[HEARTBEAT_KEY] = now
+            await self._update_metadata(agent_id, metadata)
+
+    async def _collect_orphans(self):
+        """
+        Mark unused managed agents as superseded; delete those superseded (and
+        without a heartbeat) for longer than the grace period.
+
+        Creation time is deliberately ignored - an old agent can still be the
+        current definition of a replica that has not been rolled out yet.
+        """
+        now = time.time()
+        for agent in await self._list_managed():
+            if agent.name not in self._managed_names or agent.id in self._in_use:
+                continue
+
+            superseded_at = _metadata_time(agent, SUPERSEDED_KEY)
+            if superseded_at is None:
+                # First time unused - the grace period starts now
+                if await self._update_metadata(agent.id, {**agent.metadata, SUPERSEDED_KEY: str(int(now))}):
+                    logger.info(f"Marked {agent.name} {agent.id} as superseded")
+                continue
+
+            last_seen = max(superseded_at, _metadata_time(agent, HEARTBEAT_KEY) or 0.0)
+            if now - last_seen < self.orphan_grace_seconds:
+                continue
+            try:
+                await self.project_client.agents.delete_agent(agent.id)
+                logger.info(f"Deleted orphaned {agent.name}: {agent.id}")
+            except Exception as e:
+                logger.warning(f"Failed to delete orphaned agent {agent.id}: {e}")
+
+    async def close(self):
+        """Stop the background heartbeat and garbage collection."""
+        if self._gc_task:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._gc_task = None
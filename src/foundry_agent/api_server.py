@@ -3,20 +3,28 @@ API Server for Main Agent - HTTP interface for agent interactions
 """
 
 import os
+import json
 import logging
 import asyncio
-from typing import Optional
+from typing import AsyncIterator, Callable, Optional
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential, ManagedIdentityCredential, ChainedTokenCredential
+from azure.ai.projects.aio import AIProjectClient
+from azure.identity.aio import DefaultAzureCredential, ManagedIdentityCredential, ChainedTokenCredential
 
 from main_agent import MainAgent
 from tool_agent import ToolAgent
 from research_agent import ResearchAgent
 from masking import mask_text, get_mode
+from streaming import StreamEvent
+from thread_manager import ThreadManager
+from agent_registry import AgentRegistry
+from startup_graph import StartupGraph
+from fanout import FanOutOrchestrator
 
 # Load environment variables
 import pathlib
@@ -49,28 +57,118 @@ credential: Optional[ChainedTokenCredential] = None
 main_agent: Optional[MainAgent] = None
 tool_agent: Optional[ToolAgent] = None
 research_agent: Optional[ResearchAgent] = None
+thread_manager: Optional[ThreadManager] = None
+agent_registry: Optional[AgentRegistry] = None
+startup_report: Optional[dict] = None
+fanout: Optional[FanOutOrchestrator] = None
+
+# Default orchestration for /chat: "connected" (Main Agent with ConnectedAgentTools)
+# or "direct" (local routing + concurrent sub-agents + one synthesis call)
+ORCHESTRATION_MODES = ("connected", "direct")
+DEFAULT_ORCHESTRATION_MODE = os.getenv("ORCHESTRATION_MODE", "connected").lower()
 
 # Request/Response models
 class AgentRequest(BaseModel):
     message: str
     thread_id: Optional[str] = None
+    mode: Optional[str] = None  # /chat only: "connected" or "direct" (default: ORCHESTRATION_MODE)
 
 class AgentResponse(BaseModel):
     response: str
     thread_id: str
+    mode: Optional[str] = None
+
+
+def _orchestration_mode(request: AgentRequest) -> str:
+    """Orchestration mode for a /chat request (400 on an unknown mode)."""
+    mode = (request.mode or DEFAULT_ORCHESTRATION_MODE).lower()
+    if mode not in ORCHESTRATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}' (use one of: {', '.join(ORCHESTRATION_MODES)})")
+    if mode == "direct" and not fanout:
+        raise HTTPException(status_code=503, detail="Direct orchestration not initialized")
+    return mode
+
+def _streaming_response(events: AsyncIterator[StreamEvent], as_events: bool, thread_id: str) -> StreamingResponse:
+    """
+    Stream an agent's events to the client.
+    
+    Args:
+        events: Agent run_events() iterator
+        as_events: True = NDJSON StreamEvents (text + tool_call), False = plain-text deltas
+        thread_id: Conversation thread pinned by the caller (thread_manager.pin), returned
+            in the X-Thread-Id header for the next turn and unpinned when the response ends
+    """
+    unpin = _unpin_once(thread_id)
+    
+    async def body():
+        try:
+            async for event in events:
+                if as_events:
+                    yield json.dumps(event.to_dict(), ensure_ascii=False) + "\n"
+                elif event.type == "text":
+                    yield event.text
+        except Exception as e:
+            # Headers are already sent - report the error in-band
+            logger.error(f"Error: {e}")
+            if as_events:
+                yield json.dumps({"type": "error", "text": str(e)}, ensure_ascii=False) + "\n"
+            else:
+                yield f"\nError: {str(e)}"
+        finally:
+            unpin()
+    
+    media_type = "application/x-ndjson" if as_events else "text/plain; charset=utf-8"
+    # The background task also unpins if the body never started (client gone before streaming)
+    return StreamingResponse(
+        body(), media_type=media_type, headers={"X-Thread-Id": thread_id}, background=BackgroundTask(unpin)
+    )
+
+def _unpin_once(thread_id: str) -> Callable[[], None]:
+    """Unpin callback that is safe to call from several places."""
+    unpinned = False
+    
+    def unpin():
+        nonlocal unpinned
+        if not unpinned:
+            unpinned = True
+            thread_manager.unpin(thread_id)
+    return unpin
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup agents on shutdown"""
-    global main_agent, tool_agent, research_agent, project_client, credential
+    global main_agent, tool_agent, research_agent, project_client, credential, thread_manager, agent_registry, fanout
     
     logger.info("Shutting down agents...")
     
+    # Finish recording fan-out turns before threads are deleted
+    if fanout:
+        try:
+            await fanout.close()
+        except Exception as e:
+            logger.error(f"Error closing fan-out orchestrator: {e}")
+        finally:
+            fanout = None
+    
+    # Stop orphan cleanup; agents are only deleted below when the registry is not persistent
+    if agent_registry:
+        await agent_registry.close()
+    
+    # Delete threads already queued for deletion; tracked conversations are kept
+    # (not deleted by any replica later - see ThreadManager.close)
+    if thread_manager:
+        try:
+            await thread_manager.close()
+        except Exception as e:
+            logger.error(f"Error closing thread manager: {e}")
+        finally:
+            thread_manager = None
+    
     # Delete agents
     for agent, name in [(main_agent, "Main"), (research_agent, "Research")]:
         if agent:
             try:
-                agent.delete()
+                await agent.delete()
             except Exception as e:
                 logger.error(f"Error deleting {name} Agent: {e}")
             finally:
@@ -110,7 +208,8 @@ async def shutdown_event():
 @app.on_event("startup")
 async def startup_event():
     """Initialize agents on startup"""
-    global project_client, credential, main_agent, tool_agent, research_agent
+    global project_client, credential, main_agent, tool_agent, research_agent, thread_manager, agent_registry
+    global startup_report, fanout
     
     try:
         logger.info("Initializing Agent Service...")
@@ -164,7 +263,7 @@ async def startup_event():
             except Exception as ag_err:
                 logger.warning(f"Failed to enable AIAgentsInstrumentor: {ag_err}")
         
-        # Initialize Azure AI Project Client
+        # Initialize Azure AI Project Client (async - agent runs must not block the event loop)
         credential = ChainedTokenCredential(
             ManagedIdentityCredential(),
             DefaultAzureCredential()
@@ -181,6 +280,17 @@ async def startup_event():
         if content_recording_flag:
             logger.info("Expecting gen_ai.prompt/completion in traces")
         
+        # Conversation threads shared by all agents (reuse + background cleanup)
+        thread_manager = ThreadManager.from_env(project_client)
+        logger.info(
+            f"Thread manager: up to {thread_manager.max_threads} threads, "
+            f"idle expiry {thread_manager.idle_seconds:.0f}s"
+        )
+        
+        # Reuse agents from earlier boots/replicas when their definition is unchanged
+        agent_registry = AgentRegistry.from_env(project_client)
+        logger.info(f"Agent registry: {'persistent' if agent_registry.persistent else 'disabled (create/delete per boot)'}")
+        
         # ========================================================================
         # 🔍 Azure AI Inference Tracing
         # ========================================================================
@@ -209,47 +319,79 @@ async def startup_event():
         else:
             logger.warning("Application Insights not configured - Analytics disabled")
         
-        # Create sub-agents
+        # Create agents as a dependency graph: the Tool Agent (MCP handshake) and the
+        # Research Agent (connection discovery) are independent and start together,
+        # the Main Agent waits for both ids
         mcp_endpoint = os.getenv("MCP_ENDPOINT")
+        search_endpoint = os.getenv("SEARCH_ENDPOINT")
+        search_key = os.getenv("SEARCH_KEY")
+        search_index = os.getenv("SEARCH_INDEX")
         
         # 1. Tool Agent (MCP)
         logger.info(f"Creating Tool Agent (MCP: {mcp_endpoint})...")
-        tool_agent = ToolAgent(project_client=project_client, mcp_endpoint=mcp_endpoint)
-        tool_agent_id = await tool_agent.create()
-        logger.info(f"Tool Agent created: {tool_agent_id}")
+        tool_agent = ToolAgent(
+            project_client=project_client,
+            mcp_endpoint=mcp_endpoint,
+            thread_manager=thread_manager,
+            registry=agent_registry
+        )
         
         # 2. Research Agent (RAG)
-        search_endpoint = os.getenv("SEARCH_ENDPOINT")
-        search_key = os.getenv("SEARCH_KEY")
-        search_index = os.getenv("SEARCH_INDEX")
-        
         logger.info(f"Creating Research Agent (Index: {search_index})...")
         research_agent = ResearchAgent(
             project_client=project_client,
             search_endpoint=search_endpoint,
             search_key=search_key,
-            search_index=search_index
+            search_index=search_index,
+            thread_manager=thread_manager,
+            registry=agent_registry
         )
-        research_agent_id = research_agent.create()
-        logger.info(f"Research Agent created: {research_agent_id}")
         
-        # 3. Get connected tools from sub-agents
-        connected_tools = []
+        # 3. Main Agent with connected agents (needs both sub-agent ids)
+        async def create_main_agent() -> str:
+            global main_agent
+            connected_tools = []
+            
+            if hasattr(tool_agent, 'get_connected_tool'):
+                connected_tools.append(tool_agent.get_connected_tool())
+            
+            if hasattr(research_agent, 'get_connected_tool'):
+                connected_tools.append(research_agent.get_connected_tool())
+            
+            main_agent = MainAgent(
+                project_client=project_client,
+                connected_tools=connected_tools,
+                thread_manager=thread_manager,
+                registry=agent_registry
+            )
+            return await main_agent.create()
         
-        if hasattr(tool_agent, 'get_connected_tool'):
-            connected_tools.append(tool_agent.get_connected_tool())
+        startup = StartupGraph()
+        startup.add_step("tool_agent", tool_agent.create)
+        startup.add_step("research_agent", research_agent.create)
+        startup.add_step("main_agent", create_main_agent, depends_on=["tool_agent", "research_agent"])
+        try:
+            await startup.run()
+        finally:
+            startup_report = startup.report
         
-        if hasattr(research_agent, 'get_connected_tool'):
-            connected_tools.append(research_agent.get_connected_tool())
+        logger.info(f"Tool Agent ready: {startup.results['tool_agent']}")
+        logger.info(f"Research Agent ready: {startup.results['research_agent']}")
+        logger.info(f"Main Agent ready: {startup.results['main_agent']}")
+        logger.info(f"Agent registry: {agent_registry.report}")
         
-        # 4. Main Agent with connected agents
-        logger.info("Creating Main Agent...")
-        main_agent = MainAgent(
+        # Direct fan-out mode (selectable per request with "mode": "direct")
+        fanout = FanOutOrchestrator(
             project_client=project_client,
-            connected_tools=connected_tools
+            main_agent=main_agent,
+            tool_agent=tool_agent,
+            research_agent=research_agent,
+            thread_manager=thread_manager
         )
-        agent_id = main_agent.create()
-        logger.info(f"Main Agent ready: {agent_id}")
+        logger.info(f"Orchestration mode default: {DEFAULT_ORCHESTRATION_MODE}")
+        
+        # Delete agents left behind by older definitions (off the startup path)
+        agent_registry.start_gc()
         
     except Exception as e:
         logger.error(f"Startup failed: {e}", exc_info=True)
@@ -273,7 +415,11 @@ async def health():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "service": "Agent API Server"
+        "service": "Agent API Server",
+        "threads": thread_manager.stats() if thread_manager else None,
+        "agents": agent_registry.report if agent_registry else None,
+        "direct_synthesis": fanout.synthesis_available if fanout else None,
+        "startup": startup_report
     }
 
 @app.post("/chat", response_model=AgentResponse)
@@ -281,6 +427,7 @@ async def chat_with_main_agent(request: AgentRequest):
     """Chat with the main agent"""
     if not main_agent:
         raise HTTPException(status_code=503, detail="Main agent not initialized")
+    mode = _orchestration_mode(request)
     
     try:
         # ========================================================================
@@ -295,23 +442,40 @@ async def chat_with_main_agent(request: AgentRequest):
             span.set_attribute("gen_ai.system", "azure_ai_agent")
             model_name = os.getenv("AZURE_AI_MODEL_DEPLOYMENT_NAME", "gpt-4o")
             span.set_attribute("gen_ai.request.model", model_name)
+            span.set_attribute("orchestration.mode", mode)
             
-            logger.info(f"Request: {request.message[:100]}...")
+            logger.info(f"Request ({mode}): {request.message[:100]}...")
             
-            response_text = await main_agent.run(
-                message=request.message,
-                thread_id=request.thread_id
-            )
+            # Pinned until the run is done - the returned thread_id is the one the run used
+            async with thread_manager.pinned(request.thread_id) as thread_id:
+                span.set_attribute("thread.id", thread_id)
+                orchestrator = fanout if mode == "direct" else main_agent
+                response_text = await orchestrator.run(
+                    message=request.message,
+                    thread_id=thread_id
+                )
             
             span.set_attribute("gen_ai.completion", mask_text(response_text))
             span.set_attribute("gen_ai.response.finish_reason", "stop")
             
-            return AgentResponse(response=response_text, thread_id="main-thread")
+            return AgentResponse(response=response_text, thread_id=thread_id, mode=mode)
         
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def stream_main_agent(request: AgentRequest, events: bool = False):
+    """Chat with the main agent, streaming the answer (?events=true adds connected-agent tool calls as NDJSON)"""
+    if not main_agent:
+        raise HTTPException(status_code=503, detail="Main agent not initialized")
+    mode = _orchestration_mode(request)
+    
+    logger.info(f"Request (stream, {mode}): {request.message[:100]}...")
+    thread_id = await thread_manager.pin(request.thread_id)
+    orchestrator = fanout if mode == "direct" else main_agent
+    return _streaming_response(orchestrator.run_events(request.message, thread_id), events, thread_id)
+
 @app.post("/tool-agent/chat", response_model=AgentResponse)
 async def chat_with_tool_agent(request: AgentRequest):
     """Chat with the tool agent directly"""
@@ -321,17 +485,25 @@ async def chat_with_tool_agent(request: AgentRequest):
     try:
         logger.info(f"Tool Agent: {request.message[:100]}...")
         
-        response_text = await tool_agent.run(
-            message=request.message,
-            thread_id=request.thread_id
-        )
+        async with thread_manager.pinned(request.thread_id) as thread_id:
+            response_text = await tool_agent.run(request.message, thread_id=thread_id)
         
-        return AgentResponse(response=response_text, thread_id="tool-thread")
+        return AgentResponse(response=response_text, thread_id=thread_id)
         
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/tool-agent/chat/stream")
+async def stream_tool_agent(request: AgentRequest, events: bool = False):
+    """Chat with the tool agent directly, streaming the answer (?events=true adds MCP tool calls as NDJSON)"""
+    if not tool_agent:
+        raise HTTPException(status_code=503, detail="Tool agent not initialized")
+    
+    logger.info(f"Tool Agent (stream): {request.message[:100]}...")
+    thread_id = await thread_manager.pin(request.thread_id)
+    return _streaming_response(tool_agent.run_events(request.message, thread_id), events, thread_id)
+
 @app.post("/research-agent/chat", response_model=AgentResponse)
 async def chat_with_research_agent(request: AgentRequest):
     """Chat with the research agent directly"""
@@ -341,17 +513,28 @@ async def chat_with_research_agent(request: AgentRequest):
     try:
         logger.info(f"Research Agent: {request.message[:100]}...")
         
-        response_text = await research_agent.run(
-            message=request.message,
-            thread_id=request.thread_id
-        )
+        async with thread_manager.pinned(request.thread_id) as thread_id:
+            response_text = await research_agent.run(
+                message=request.message,
+                thread_id=thread_id
+            )
         
-        return AgentResponse(response=response_text, thread_id="research-thread")
+        return AgentResponse(response=response_text, thread_id=thread_id)
         
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/research-agent/chat/stream")
+async def stream_research_agent(request: AgentRequest, events: bool = False):
+    """Chat with the research agent directly, streaming the answer (?events=true adds search tool calls as NDJSON)"""
+    if not research_agent:
+        raise HTTPException(status_code=503, detail="Research agent not initialized")
+    
+    logger.info(f"Research Agent (stream): {request.message[:100]}...")
+    thread_id = await thread_manager.pin(request.thread_id)
+    return _streaming_response(research_agent.run_events(request.message, thread_id), events, thread_id)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
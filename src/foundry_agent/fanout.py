@@ -0,0 +1,276 @@
+"""
+Direct fan-out orchestration for the Foundry agents.
+
+The Main Agent delegates through ConnectedAgentTools: a "weather + attractions"
+question becomes nested agent runs inside the service, one after the other,
+followed by a synthesis turn. FanOutOrchestrator is the alternative used by
+api_server when a request asks for mode="direct":
+- The request is classified locally with the intent keyword matcher
+- Weather only / travel only: that sub-agent answers on the conversation thread
+- Weather and travel (joined by "and", "also", ...): ToolAgent.run and
+  ResearchAgent.run run concurrently (each on a throwaway thread) and their
+  answers are merged by one streamed chat completion - no extra thread,
+  message or run for the synthesis
+- Anything else goes to the Main Agent (model-based routing)
+
+Usage:
+    orchestrator = FanOutOrchestrator(project_client, main_agent, tool_agent, research_agent, thread_manager)
+    async for event in orchestrator.run_events("Seoul weather and attractions", thread_id):
+        ...
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Optional, Set
+
+from azure.ai.projects.aio import AIProjectClient
+
+from intent_matcher import match_intent
+from main_agent import MainAgent
+from research_agent import ResearchAgent
+from streaming import StreamEvent
+from thread_manager import ThreadManager
+from tool_agent import ToolAgent
+
+logger = logging.getLogger(__name__)
+
+ROUTE_TOOL = "tool"
+ROUTE_RESEARCH = "research"
+ROUTE_BOTH = "both"
+ROUTE_MAIN = "main"
+
+SYNTHESIS_INSTRUCTIONS = """You merge the answers of two specialized agents into one response for the user.
+
+- The Tool Agent answer contains real-time weather data - keep every number as given
+- The Research Agent answer contains travel recommendations from a knowledge base - keep its citations (【N:0†source】) and its leading indicator (📚 [RAG-based Answer] or 💭 [General Knowledge])
+- Connect the two where it helps (e.g. which recommendations suit the current weather)
+- Do not add facts that are in neither answer
+- If an agent reported an error, say briefly that this part is unavailable"""
+
+
+class FanOutOrchestrator:
+    """Local routing + concurrent sub-agent calls + one synthesis completion."""
+
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        main_agent: MainAgent,
+        tool_agent: Optional[ToolAgent],
+        research_agent: Optional[ResearchAgent],
+        thread_manager: ThreadManager,
+        model: Optional[str] = None,
+        api_version: Optional[str] = None
+    ):
+        """
+        Initialize the fan-out orchestrator.
+
+        Priority: Parameter > Environment variable > Default fallback
+
+        Args:
+            project_client: Async AIProjectClient instance
+            main_agent: Connected-agents Main Agent (fallback for unclear requests)
+            tool_agent: Tool Agent (weather via MCP)
+            research_agent: Research Agent (RAG)
+            thread_manager: Shared ThreadManager
+            model: Synthesis model deployment (default: AZURE_AI_MODEL_DEPLOYMENT_NAME or gpt-4o)
+            api_version: Azure OpenAI API version (default: AZURE_OPENAI_API_VERSION or 2024-10-21)
+        """
+        self.project_client = project_client
+        self.main_agent = main_agent
+        self.tool_agent = tool_agent
+        self.research_agent = research_agent
+        self.thread_manager = thread_manager
+        self.model = model or os.getenv("AZURE_AI_MODEL_DEPLOYMENT_NAME", "gpt-4o")
+        self.api_version = api_version or os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+
+        self._openai_client: Optional[Any] = None
+        self._openai_lock = asyncio.Lock()
+        self._background: Set[asyncio.Task] = set()
+
+        # AIProjectClient.get_openai_client was added in azure-ai-projects 1.0.0 (not in the betas)
+        self.synthesis_available = hasattr(project_client, "get_openai_client")
+        if not self.synthesis_available:
+            logger.warning(
+                "AIProjectClient has no get_openai_client (azure-ai-projects >= 1.0.0 required) - "
+                "direct mode returns the combined sub-agent answers without synthesis"
+            )
+
+    def classify(self, message: str) -> str:
+        """
+        Route a request with the keyword matcher (no model call).
+
+        Returns:
+            "tool", "research", "both" or "main" (not clear from keywords - model-based routing)
+        """
+        intent = match_intent(message)
+        wants_tool = intent.has("weather") and self.tool_agent is not None
+        wants_research = intent.has("travel") and self.research_agent is not None
+        # Same rule as the Agent Framework router: both intents plus a connecting word
+        # ("Busan weather" names a travel city but is a weather question)
+        if wants_tool and wants_research:
+            return ROUTE_BOTH if intent.has("connector") else ROUTE_MAIN
+        if wants_tool:
+            return ROUTE_TOOL
+        if wants_research:
+            return ROUTE_RESEARCH
+        return ROUTE_MAIN
+
+    async def run(self, message: str, thread_id: Optional[str] = None) -> str:
+        """
+        Answer a request in direct fan-out mode.
+
+        Args:
+            message: User message
+            thread_id: Conversation thread (reused across turns)
+
+        Returns:
+            Agent response
+        """
+        parts = [event.text async for event in self.run_events(message, thread_id) if event.type == "text"]
+        return "".join(parts) or "No response generated"
+
+    async def run_events(self, message: str, thread_id: Optional[str] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Answer a request in direct fan-out mode as a stream.
+
+        Args:
+            message: User message
+            thread_id: Conversation thread (reused across turns)
+
+        Yields:
+            Sub-agent tool-call events and text deltas
+        """
+        from opentelemetry import trace
+        tracer = trace.get_tracer(__name__)
+
+        with tracer.start_as_current_span("fanout_run") as span:
+            route = self.classify(message)
+            span.set_attribute("orchestration.mode", "direct")
+            span.set_attribute("orchestration.route", route)
+            logger.info(f"Direct mode route: {route}")
+
+            if route == ROUTE_BOTH:
+                async for event in self._fan_out(message, thread_id, span):
+                    yield event
+                return
+
+            # A single sub-agent answers on the conversation thread itself (no synthesis needed)
+            agent = {ROUTE_TOOL: self.tool_agent, ROUTE_RESEARCH: self.research_agent}.get(route, self.main_agent)
+            async for event in agent.run_events(message, thread_id):
+                yield event
+
+    async def _fan_out(self, message: str, thread_id: Optional[str], span) -> AsyncIterator[StreamEvent]:
+        """Run Tool and Research agents concurrently, then stream the synthesis."""
+        started = time.perf_counter()
+
+        async def call(name: str, agent: Any) -> str:
+            call_started = time.perf_counter()
+            try:
+                # Throwaway thread per sub-agent - both run at once, a shared thread would serialize them
+                async with self.thread_manager.ephemeral() as sub_thread_id:
+                    return await agent.run(message, thread_id=sub_thread_id)
+            finally:
+                span.set_attribute(f"orchestration.{name}.duration_ms", (time.perf_counter() - call_started) * 1000)
+
+        for name in ("tool_agent", "research_agent"):
+            yield StreamEvent(type="tool_call", tool=name, status="in_progress")
+
+        tool_result, research_result = await asyncio.gather(
+            call("tool_agent", self.tool_agent),
+            call("research_agent", self.research_agent),
+            return_exceptions=True
+        )
+
+        answers = {}
+        for name, result in (("tool_agent", tool_result), ("research_agent", research_result)):
+            failed = isinstance(result, Exception)
+            if failed:
+                logger.error(f"{name} error: {result}")
+            answers[name] = f"⚠️ {name} error: {result}" if failed else result
+            yield StreamEvent(type="tool_call", tool=name, status="failed" if failed else "completed")
+        span.set_attribute("orchestration.fan_out_ms", (time.perf_counter() - started) * 1000)
+
+        # One synthesis completion, streamed
+        response_parts = []
+        span.set_attribute("orchestration.synthesis_available", self.synthesis_available)
+        try:
+            if self.synthesis_available:
+                async for text in self._synthesize(message, answers["tool_agent"], answers["research_agent"]):
+                    if not response_parts:
+                        span.set_attribute(
+                            "gen_ai.response.time_to_first_token_ms",
+                            (time.perf_counter() - started) * 1000
+                        )
+                    response_parts.append(text)
+                    yield StreamEvent(type="text", text=text)
+        except Exception as e:
+            logger.error(f"Synthesis failed: {e}")
+            span.set_attribute("orchestration.synthesis_error", str(e))
+
+        if not response_parts:
+            # Same combined output as the Agent Framework orchestrator
+            combined = f"{answers['tool_agent']}\n\n{answers['research_agent']}"
+            response_parts.append(combined)
+            yield StreamEvent(type="text", text=combined)
+
+        response_text = "".join(response_parts)
+        span.set_attribute("gen_ai.completion", response_text)
+        span.set_attribute("gen_ai.response.finish_reason", "stop")
+
+        if thread_id:
+            self._record_turn(thread_id, message, response_text)
+
+    async def _openai(self) -> Any:
+        """Async Azure OpenAI client of the project (created on first use)."""
+        async with self._openai_lock:
+            if self._openai_client is None:
+                self._openai_client = await self.project_client.get_openai_client(api_version=self.api_version)
+            return self._openai_client
+
+    async def _synthesize(self, message: str, tool_answer: str, research_answer: str) -> AsyncIterator[str]:
+        """Merge both answers with a single streamed chat completion."""
+        client = await self._openai()
+        stream = await client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYNTHESIS_INSTRUCTIONS},
+                {
+                    "role": "user",
+                    "content": f"Question: {message}\n\n"
+                               f"[Tool Agent answer]\n{tool_answer}\n\n"
+                               f"[Research Agent answer]\n{research_answer}"
+                },
+            ],
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _record_turn(self, thread_id: str, message: str, response_text: str):
+        """Append the turn to the conversation thread in the background (keeps multi-turn context)."""
+        async def record():
+            try:
+                async with self.thread_manager.lease(thread_id) as leased_thread_id:
+                    await self.project_client.agents.messages.create(
+                        thread_id=leased_thread_id, role="user", content=message
+                    )
+                    await self.project_client.agents.messages.create(
+                        thread_id=leased_thread_id, role="assistant", content=response_text
+                    )
+            except Exception as e:
+                logger.warning(f"Failed to record fan-out turn on thread {thread_id}: {e}")
+
+        task = asyncio.create_task(record())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self):
+        """Wait for pending turn recordings and close the OpenAI client."""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self._openai_client is not None:
+            await self._openai_client.close()
+            self._openai_client = None
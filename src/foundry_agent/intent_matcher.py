@@ -0,0 +1,118 @@
+"""Precompiled keyword + city gazetteer matcher shared by routers and agents.
+
+All keywords and city aliases from intent_keywords.json are compiled once at
+import into a single word-boundary-aware regex, so one pass over the text
+returns every matched intent category and city entity.
+
+- English terms match whole words (plus a plural "s"/"es"), so "sun" no
+  longer matches "Sunday"
+- Korean terms must end the word, be followed by a particle or verb ending,
+  or run straight into another known term, so "서울의 날씨는", "서울날씨" and
+  "추천해줘" match but "부산물" does not. Other suffixes ("여행지", "서울시청")
+  are not matched; add them to the lists below if needed
+
+Usage:
+    from intent_matcher import match_intent
+    intent = match_intent("Weather in Seoul and Busan?")
+    intent.has("weather")   # True
+    intent.cities           # ("Seoul", "Busan")
+
+Environment Variable:
+    INTENT_KEYWORDS_PATH = path to an alternative keyword file (optional)
+"""
+from __future__ import annotations
+import json, os, re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Tuple
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_keywords.json")
+
+_HANGUL = "가-힣"
+# Particles and place suffixes that may close a Korean term ("서울의", "부산에서", "제주도")
+_KOREAN_PARTICLES = (
+    "이", "가", "은", "는", "을", "를", "의", "에", "에서", "에는", "엔", "로", "으로",
+    "도", "만", "과", "와", "랑", "이랑", "하고", "까지", "부터", "보다", "처럼",
+    "요", "이요", "은요", "는요", "시", "역", "항", "공항",
+)
+# Verb stems that may continue a Korean term with any ending ("추천해줘", "여행하는")
+_KOREAN_VERB_STEMS = ("하", "해", "했", "할", "한", "합")
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    """Result of a single matcher pass over a text."""
+    categories: FrozenSet[str]
+    cities: Tuple[str, ...]  # canonical names, in order of first appearance
+
+    def has(self, category: str) -> bool:
+        return category in self.categories
+
+
+class IntentMatcher:
+    """Single compiled regex over all keywords; term → categories/city lookup."""
+
+    def __init__(self, categories: Dict[str, List[str]], cities: Dict[str, List[str]]):
+        self._term_categories: Dict[str, set] = {}
+        self._term_city: Dict[str, str] = {}
+
+        for category, terms in categories.items():
+            for term in terms:
+                self._term_categories.setdefault(term.lower(), set()).add(category)
+        for city, aliases in cities.items():
+            for alias in aliases:
+                self._term_city[alias.lower()] = city
+
+        # Longest first so alternation prefers "temperature" over "temp"
+        terms = sorted(set(self._term_categories) | set(self._term_city), key=len, reverse=True)
+        alternation = "|".join(re.escape(term) for term in terms)
+        self._pattern = re.compile(
+            rf"(?<![a-z0-9])({alternation})(?:e?s)?(?![a-z0-9])"
+            rf"(?:(?<![{_HANGUL}])|(?={self._hangul_tail(terms)}))"
+        )
+
+    @staticmethod
+    def _hangul_tail(terms: List[str]) -> str:
+        """Lookahead body for what may follow a term ending in Hangul.
+
+        Without it "부산" would match inside "부산물" (by-product).
+        """
+        particles = "|".join(re.escape(p) for p in sorted(_KOREAN_PARTICLES, key=len, reverse=True))
+        stems = "|".join(re.escape(s) for s in _KOREAN_VERB_STEMS)
+        korean_terms = [re.escape(term) for term in terms if re.search(f"[{_HANGUL}]", term)]
+        tail = [f"[^{_HANGUL}]", "$", f"(?:{particles})(?![{_HANGUL}])", f"(?:{stems})"]
+        if korean_terms:
+            tail.append(f"(?:{'|'.join(korean_terms)})")
+        return "|".join(tail)
+
+    @classmethod
+    def from_file(cls, path: str) -> "IntentMatcher":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("categories", {}), data.get("cities", {}))
+
+    def match(self, text: str | None) -> IntentMatch:
+        categories: set = set()
+        cities: Dict[str, None] = {}
+
+        for m in self._pattern.finditer((text or "").lower()):
+            term = m.group(1)
+            categories.update(self._term_categories.get(term, ()))
+            city = self._term_city.get(term)
+            if city:
+                cities.setdefault(city, None)
+
+        return IntentMatch(categories=frozenset(categories), cities=tuple(cities))
+
+
+# Built once at import and shared by all call sites
+_MATCHER = IntentMatcher.from_file(os.getenv("INTENT_KEYWORDS_PATH", _DEFAULT_PATH))
+
+
+def match_intent(text: str | None) -> IntentMatch:
+    """Return matched intent categories and city entities in one pass."""
+    return _MATCHER.match(text)
+
+
+if __name__ == "__main__":  # quick manual test
+    for sample in ("서울 날씨 어때?", "부산물 처리", "제주도 맛집 추천해줘", "Weather in Seoul and Busan", "Sunday brunch in Jeju", "Sunny beaches to surf"):
+        print(sample, "=>", match_intent(sample))
@@ -4,9 +4,14 @@ Main Agent - Coordinates between specialized agents
 
 import logging
 import os
-from typing import Optional
+import time
+from typing import AsyncIterator, Optional
 
-from azure.ai.projects import AIProjectClient
+from azure.ai.projects.aio import AIProjectClient
+
+from streaming import RunEventHandler, StreamEvent, final_text, run_error_text, stream_run
+from agent_registry import AgentRegistry
+from thread_manager import ThreadManager
 
 logger = logging.getLogger(__name__)
 
@@ -17,15 +22,26 @@ class MainAgent:
     Uses Connected Agents to delegate to Tool Agent and Research Agent.
     """
     
-    def __init__(self, project_client: AIProjectClient, connected_tools: list = None):
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        connected_tools: list = None,
+        thread_manager: Optional[ThreadManager] = None,
+        registry: Optional[AgentRegistry] = None
+    ):
         """
         Initialize the Main Agent.
         
         Args:
-            project_client: AIProjectClient instance
+            project_client: Async AIProjectClient instance
             connected_tools: List of ConnectedAgentTool instances (Tool Agent, Research Agent)
+            thread_manager: Shared ThreadManager (default: a private one configured from env)
+            registry: AgentRegistry to reuse an existing agent (default: create a new one, delete on shutdown)
         """
         self.project_client = project_client
+        self.registry = registry or AgentRegistry(project_client, persistent=False)
+        self._owns_thread_manager = thread_manager is None
+        self.thread_manager = thread_manager or ThreadManager.from_env(project_client)
         self.agent_id: Optional[str] = None
         self.connected_tools = connected_tools or []
         
@@ -60,7 +76,7 @@ Always choose the right agent(s) based on the user's question and provide well-s
         self.name = "Main Agent"
         self.instructions = instructions
     
-    def create(self) -> str:
+    async def create(self) -> str:
         """Create the agent in Azure AI Foundry with Connected Agents."""
         logger.info(f"Creating {self.name}")
         
@@ -69,30 +85,26 @@ Always choose the right agent(s) based on the user's question and provide well-s
         for connected_tool in self.connected_tools:
             tools_definitions.extend(connected_tool.definitions)
         
-        # Create agent with connected tools
+        # Create agent with connected tools (or reuse one with the same definition)
+        self.agent_id = await self.registry.get_or_create(
+            name=self.name,
+            model=self.model,
+            instructions=self.instructions,
+            tools=tools_definitions or None
+        )
         if tools_definitions:
-            agent = self.project_client.agents.create_agent(
-                model=self.model,
-                name=self.name,
-                instructions=self.instructions,
-                tools=tools_definitions
-            )
-            logger.info(f"Created {self.name} with {len(self.connected_tools)} connected agents")
+            logger.info(f"{self.name} ready with {len(self.connected_tools)} connected agents")
         else:
-            agent = self.project_client.agents.create_agent(
-                model=self.model,
-                name=self.name,
-                instructions=self.instructions
-            )
-            logger.info(f"Created {self.name} (no connected agents)")
+            logger.info(f"{self.name} ready (no connected agents)")
         
-        self.agent_id = agent.id
         return self.agent_id
     
-    def delete(self):
-        """Delete the agent."""
+    async def delete(self):
+        """Release the agent (kept for reuse by a persistent registry) and close a private thread manager."""
+        if self._owns_thread_manager:
+            await self.thread_manager.close()
         if self.agent_id:
-            self.project_client.agents.delete_agent(self.agent_id)
+            await self.registry.release(self.agent_id)
             self.agent_id = None
     
     def get_id(self) -> Optional[str]:
@@ -105,12 +117,43 @@ Always choose the right agent(s) based on the user's question and provide well-s
         
         Args:
             message: User message
-            thread_id: Optional thread ID for conversation continuity
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
             
         Returns:
             Agent response
         """
-        thread = None
+        parts = [event.text async for event in self.run_events(message, thread_id) if event.type == "text"]
+        if not parts:
+            logger.warning("No assistant response found")
+            return "No response generated"
+        return "".join(parts)
+    
+    async def run_stream(self, message: str, thread_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Run the main orchestrator agent and stream the answer as text deltas.
+        
+        Args:
+            message: User message
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
+            
+        Yields:
+            Text deltas of the agent's response
+        """
+        async for event in self.run_events(message, thread_id):
+            if event.type == "text":
+                yield event.text
+    
+    async def run_events(self, message: str, thread_id: Optional[str] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Run the main orchestrator agent as a streamed run.
+        
+        Args:
+            message: User message
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
+            
+        Yields:
+            Text deltas and connected-agent tool-call events as they arrive
+        """
         try:
             # ========================================================================
             # 🔍 OpenTelemetry Span for Agent Execution Tracing
@@ -125,57 +168,53 @@ Always choose the right agent(s) based on the user's question and provide well-s
                 span.set_attribute("gen_ai.prompt", message)
                 span.set_attribute("agent.id", self.agent_id)
                 span.set_attribute("agent.name", self.name)
+                started = time.perf_counter()
                 
-                # Create thread
-                thread = self.project_client.agents.threads.create()
-                span.set_attribute("thread.id", thread.id)
-                
-                # Add message to thread
-                self.project_client.agents.messages.create(
-                    thread_id=thread.id,
-                    role="user",
-                    content=message
-                )
-                
-                # Run the agent
-                run = self.project_client.agents.runs.create_and_process(
-                    thread_id=thread.id,
-                    agent_id=self.agent_id
-                )
-                span.set_attribute("run.id", run.id)
-                span.set_attribute("run.status", run.status)
-                
-                # Get the response
-                messages = self.project_client.agents.messages.list(thread_id=thread.id)
-            
-                messages_list = list(messages)
-                span.set_attribute("messages.count", len(messages_list))
-                
-                # Messages are returned in reverse chronological order (newest first)
-                for msg in messages_list:
-                    if msg.role == "assistant":
-                        if hasattr(msg, 'content') and msg.content:
-                            for content_part in msg.content:
-                                if hasattr(content_part, 'text'):
-                                    response_text = content_part.text.value
-                                    
-                                    # Log output to span for Tracing UI (Gen AI conventions)
-                                    span.set_attribute("gen_ai.completion", response_text)
-                                    span.set_attribute("gen_ai.response.finish_reason", "stop")
-                                    span.set_attribute("gen_ai.usage.output_tokens", len(response_text.split()))
-                                    
-                                    return response_text
-                
-                logger.warning("No assistant response found")
-                return "No response generated"
+                # Reuse the caller's thread (or a new one); cleanup happens in the background
+                async with self.thread_manager.lease(thread_id) as thread_id:
+                    span.set_attribute("thread.id", thread_id)
+                    
+                    # Add message to thread
+                    await self.project_client.agents.messages.create(
+                        thread_id=thread_id,
+                        role="user",
+                        content=message
+                    )
+                    
+                    # Stream the run - deltas are forwarded as they arrive (no status polling)
+                    handler = RunEventHandler()
+                    response_parts = []
+                    async for event in stream_run(self.project_client, thread_id, self.agent_id, handler):
+                        if event.type == "text":
+                            if not response_parts:
+                                span.set_attribute(
+                                    "gen_ai.response.time_to_first_token_ms",
+                                    (time.perf_counter() - started) * 1000
+                                )
+                            response_parts.append(event.text)
+                        yield event
+                    
+                    if not response_parts:
+                        text = await final_text(self.project_client, thread_id, handler)
+                        if not text:
+                            # Failed/cancelled run - surface its error instead of an empty answer
+                            text = run_error_text(handler)
+                            if text:
+                                span.set_attribute("error.message", text)
+                        if text:
+                            response_parts.append(text)
+                            yield StreamEvent(type="text", text=text)
+                    
+                    if handler.run:
+                        span.set_attribute("run.id", handler.run.id)
+                        span.set_attribute("run.status", handler.run.status)
+                    
+                    # Log output to span for Tracing UI (Gen AI conventions)
+                    response_text = "".join(response_parts)
+                    span.set_attribute("gen_ai.completion", response_text)
+                    span.set_attribute("gen_ai.response.finish_reason", "stop")
+                    span.set_attribute("gen_ai.usage.output_tokens", len(response_text.split()))
             
         except Exception as e:
             logger.error(f"Error: {e}")
             raise
-        finally:
-            # Clean up thread
-            if thread:
-                try:
-                    self.project_client.agents.threads.delete(thread.id)
-                except Exception as cleanup_error:
-                    logger.warning(f"Thread cleanup failed: {cleanup_error}")
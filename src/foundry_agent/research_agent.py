@@ -4,12 +4,17 @@ Research Agent - Searches knowledge base using Azure AI Search with RAG
 
 import logging
 import os
-from typing import Optional
+import time
+from typing import AsyncIterator, Optional
 
-from azure.ai.projects import AIProjectClient
+from azure.ai.projects.aio import AIProjectClient
 from azure.ai.projects.models import ConnectionType
 from azure.ai.agents.models import AzureAISearchTool
 
+from streaming import RunEventHandler, StreamEvent, final_text, run_error_text, stream_run
+from agent_registry import AgentRegistry
+from thread_manager import ThreadManager
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,51 +29,31 @@ class ResearchAgent:
         project_client: AIProjectClient,
         search_endpoint: str,
         search_key: str,
-        search_index: str
+        search_index: str,
+        thread_manager: Optional[ThreadManager] = None,
+        registry: Optional[AgentRegistry] = None
     ):
         """
         Initialize the Research Agent.
         
         Args:
-            project_client: AIProjectClient instance
+            project_client: Async AIProjectClient instance
             search_endpoint: Azure AI Search endpoint (not used with AzureAISearchTool)
             search_key: Azure AI Search admin key (not used with AzureAISearchTool)
             search_index: Name of the search index
+            thread_manager: Shared ThreadManager (default: a private one configured from env)
+            registry: AgentRegistry to reuse an existing agent (default: create a new one, delete on shutdown)
         """
         self.project_client = project_client
+        self.registry = registry or AgentRegistry(project_client, persistent=False)
+        self._owns_thread_manager = thread_manager is None
+        self.thread_manager = thread_manager or ThreadManager.from_env(project_client)
         self.search_index = search_index
         self.search_endpoint = search_endpoint
         self.search_key = search_key
         self.agent_id: Optional[str] = None
-        
-        # Try to get Azure AI Search connection from project (preferred)
-        connection_id = None
-        try:
-            search_connection = project_client.connections.get_default(ConnectionType.AZURE_AI_SEARCH)
-            connection_id = search_connection.id
-            logger.info(f"Found Azure AI Search connection: {connection_id}")
-        except Exception as e:
-            logger.warning(f"No default Azure AI Search connection: {e}")
-            # Fallback: try to find any Azure AI Search connection
-            try:
-                connections = list(project_client.connections.list(connection_type=ConnectionType.AZURE_AI_SEARCH))
-                if connections:
-                    connection_id = connections[0].id
-                    logger.info(f"Using first available connection: {connection_id}")
-            except Exception:
-                pass
-        
-        # Configure AzureAISearchTool
-        if connection_id:
-            self.ai_search_tool = AzureAISearchTool(
-                index_connection_id=connection_id,
-                index_name=search_index,
-                top_k=5
-            )
-            logger.info(f"AzureAISearchTool configured: {connection_id}")
-        else:
-            logger.warning("No Azure AI Search connection - Research Agent will have limited functionality")
-            self.ai_search_tool = None
+        # Resolved from the project's Azure AI Search connection in create()
+        self.ai_search_tool: Optional[AzureAISearchTool] = None
         
         self.name = "Research Agent"
         self.model = os.getenv("AZURE_AI_MODEL_DEPLOYMENT_NAME", "gpt-4o")
@@ -109,37 +94,71 @@ IMPORTANT: Always start your response with one of these indicators:
 
 Always ground your responses in retrieved information and cite your sources (place names and categories)."""
     
-    def create(self) -> str:
+    async def _configure_search_tool(self):
+        """Configure AzureAISearchTool from the project's Azure AI Search connection."""
+        # Try to get Azure AI Search connection from project (preferred)
+        connection_id = None
+        try:
+            search_connection = await self.project_client.connections.get_default(ConnectionType.AZURE_AI_SEARCH)
+            connection_id = search_connection.id
+            logger.info(f"Found Azure AI Search connection: {connection_id}")
+        except Exception as e:
+            logger.warning(f"No default Azure AI Search connection: {e}")
+            # Fallback: try to find any Azure AI Search connection
+            try:
+                async for connection in self.project_client.connections.list(connection_type=ConnectionType.AZURE_AI_SEARCH):
+                    connection_id = connection.id
+                    logger.info(f"Using first available connection: {connection_id}")
+                    break
+            except Exception:
+                pass
+        
+        # Configure AzureAISearchTool
+        if connection_id:
+            self.ai_search_tool = AzureAISearchTool(
+                index_connection_id=connection_id,
+                index_name=self.search_index,
+                top_k=5
+            )
+            logger.info(f"AzureAISearchTool configured: {connection_id}")
+        else:
+            logger.warning("No Azure AI Search connection - Research Agent will have limited functionality")
+            self.ai_search_tool = None
+    
+    async def create(self) -> str:
         """Create the agent in Azure AI Foundry."""
         logger.info(f"Creating {self.name}")
         
-        # Create agent with or without Azure AI Search tool
+        await self._configure_search_tool()
+        
+        # Create agent with or without Azure AI Search tool (or reuse one with the same definition)
         if self.ai_search_tool:
-            agent = self.project_client.agents.create_agent(
-                model=self.model,
+            self.agent_id = await self.registry.get_or_create(
                 name=self.name,
+                model=self.model,
                 instructions=self.instructions,
                 tools=self.ai_search_tool.definitions,
                 tool_resources=self.ai_search_tool.resources
             )
-            logger.info(f"Created {self.name} with Azure AI Search tool")
+            logger.info(f"{self.name} ready with Azure AI Search tool")
         else:
             # Create agent without tools - will use general knowledge only
             logger.warning(f"Creating {self.name} without Azure AI Search tool")
-            agent = self.project_client.agents.create_agent(
-                model=self.model,
+            self.agent_id = await self.registry.get_or_create(
                 name=self.name,
+                model=self.model,
                 instructions=self.instructions + "\n\nNote: Azure AI Search is not available. Use your general knowledge to answer questions."
             )
-            logger.info(f"Created {self.name} (no tools)")
+            logger.info(f"{self.name} ready (no tools)")
         
-        self.agent_id = agent.id
         return self.agent_id
     
-    def delete(self):
-        """Delete the agent."""
+    async def delete(self):
+        """Release the agent (kept for reuse by a persistent registry) and close a private thread manager."""
+        if self._owns_thread_manager:
+            await self.thread_manager.close()
         if self.agent_id:
-            self.project_client.agents.delete_agent(self.agent_id)
+            await self.registry.release(self.agent_id)
             self.agent_id = None
     
     def get_connected_tool(self):
@@ -174,12 +193,43 @@ Use this agent whenever users ask about travel destinations, attractions, recomm
         
         Args:
             message: User message
-            thread_id: Optional thread ID for conversation continuity
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
             
         Returns:
             Agent response
         """
-        thread = None
+        parts = [event.text async for event in self.run_events(message, thread_id) if event.type == "text"]
+        if not parts:
+            logger.warning("No assistant response found")
+            return "No response generated"
+        return "".join(parts)
+    
+    async def run_stream(self, message: str, thread_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Run the research agent and stream the answer as text deltas.
+        
+        Args:
+            message: User message
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
+            
+        Yields:
+            Text deltas of the agent's response
+        """
+        async for event in self.run_events(message, thread_id):
+            if event.type == "text":
+                yield event.text
+    
+    async def run_events(self, message: str, thread_id: Optional[str] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Run the research agent as a streamed run.
+        
+        Args:
+            message: User message
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
+            
+        Yields:
+            Text deltas and Azure AI Search tool-call events as they arrive
+        """
         try:
             # ========================================================================
             # 🔍 OpenTelemetry Span for Research Agent Execution Tracing
@@ -195,57 +245,53 @@ Use this agent whenever users ask about travel destinations, attractions, recomm
                 span.set_attribute("agent.id", self.agent_id)
                 span.set_attribute("agent.name", self.name)
                 span.set_attribute("agent.type", "research_agent")
+                started = time.perf_counter()
                 
-                # Create thread
-                thread = self.project_client.agents.threads.create()
-                span.set_attribute("thread.id", thread.id)
-                
-                # Add message to thread
-                self.project_client.agents.messages.create(
-                    thread_id=thread.id,
-                    role="user",
-                    content=message
-                )
-                
-                # Run the agent
-                run = self.project_client.agents.runs.create_and_process(
-                    thread_id=thread.id,
-                    agent_id=self.agent_id
-                )
-                span.set_attribute("run.id", run.id)
-                span.set_attribute("run.status", run.status)
-                
-                # Get the response
-                messages = self.project_client.agents.messages.list(thread_id=thread.id)
-                
-                messages_list = list(messages)
-                span.set_attribute("messages.count", len(messages_list))
-                
-                # Messages are returned in reverse chronological order (newest first)
-                for msg in messages_list:
-                    if msg.role == "assistant":
-                        if hasattr(msg, 'content') and msg.content:
-                            for content_part in msg.content:
-                                if hasattr(content_part, 'text'):
-                                    response_text = content_part.text.value
-                                    
-                                    # Log output to span for Tracing UI
-                                    span.set_attribute("gen_ai.completion", response_text)
-                                    span.set_attribute("gen_ai.response.finish_reason", "stop")
-                                    span.set_attribute("gen_ai.usage.output_tokens", len(response_text.split()))
-                                    
-                                    return response_text
-                
-                logger.warning("No assistant response found")
-                return "No response generated"
+                # Reuse the caller's thread (or a new one); cleanup happens in the background
+                async with self.thread_manager.lease(thread_id) as thread_id:
+                    span.set_attribute("thread.id", thread_id)
+                    
+                    # Add message to thread
+                    await self.project_client.agents.messages.create(
+                        thread_id=thread_id,
+                        role="user",
+                        content=message
+                    )
+                    
+                    # Stream the run - deltas are forwarded as they arrive (no status polling)
+                    handler = RunEventHandler()
+                    response_parts = []
+                    async for event in stream_run(self.project_client, thread_id, self.agent_id, handler):
+                        if event.type == "text":
+                            if not response_parts:
+                                span.set_attribute(
+                                    "gen_ai.response.time_to_first_token_ms",
+                                    (time.perf_counter() - started) * 1000
+                                )
+                            response_parts.append(event.text)
+                        yield event
+                    
+                    if not response_parts:
+                        text = await final_text(self.project_client, thread_id, handler)
+                        if not text:
+                            # Failed/cancelled run - surface its error instead of an empty answer
+                            text = run_error_text(handler)
+                            if text:
+                                span.set_attribute("error.message", text)
+                        if text:
+                            response_parts.append(text)
+                            yield StreamEvent(type="text", text=text)
+                    
+                    if handler.run:
+                        span.set_attribute("run.id", handler.run.id)
+                        span.set_attribute("run.status", handler.run.status)
+                    
+                    # Log output to span for Tracing UI
+                    response_text = "".join(response_parts)
+                    span.set_attribute("gen_ai.completion", response_text)
+                    span.set_attribute("gen_ai.response.finish_reason", "stop")
+                    span.set_attribute("gen_ai.usage.output_tokens", len(response_text.split()))
             
         except Exception as e:
             logger.error(f"Error: {e}")
             raise
-        finally:
-            # Clean up thread
-            if thread:
-                try:
-                    self.project_client.agents.threads.delete(thread.id)
-                except Exception as cleanup_error:
-                    logger.warning(f"Thread cleanup failed: {cleanup_error}")
@@ -0,0 +1,148 @@
+"""
+Startup as a small dependency graph.
+
+api_server created the Tool Agent (MCP handshake) and the Research Agent
+(search connection discovery) one after the other although neither needs the
+other; only the Main Agent needs both ids. StartupGraph runs every step as soon
+as its dependencies finished, so independent steps overlap, and records
+per-step timings in a startup report (logged, traced and returned by /health).
+
+Usage:
+    graph = StartupGraph()
+    graph.add_step("tool_agent", tool_agent.create)
+    graph.add_step("research_agent", research_agent.create)
+    graph.add_step("main_agent", create_main_agent, depends_on=["tool_agent", "research_agent"])
+    report = await graph.run()
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupStepSkipped(Exception):
+    """A dependency of the step failed."""
+
+
+class StartupGraph:
+    """Runs async startup steps concurrently, respecting dependencies."""
+
+    def __init__(self):
+        self._steps: Dict[str, Tuple[Callable[[], Awaitable[Any]], Tuple[str, ...]]] = {}
+        self.results: Dict[str, Any] = {}
+        self.report: Optional[Dict[str, Any]] = None
+
+    def add_step(self, name: str, step: Callable[[], Awaitable[Any]], depends_on: Iterable[str] = ()):
+        """
+        Register a startup step.
+
+        Args:
+            name: Step name (report key)
+            step: Async callable run once its dependencies succeeded
+            depends_on: Names of steps that must finish first (registered earlier)
+        """
+        depends_on = tuple(depends_on)
+        unknown = [dep for dep in depends_on if dep not in self._steps]
+        if unknown:
+            raise ValueError(f"Step {name} depends on unknown step(s): {', '.join(unknown)}")
+        self._steps[name] = (step, depends_on)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run all steps; each starts as soon as its dependencies are done.
+
+        Returns:
+            {"total_ms": ..., "critical_path": [...], "steps": {name: {"status",
+            "start_ms", "duration_ms", "depends_on", "error"?}}}
+
+        Raises:
+            The first step error, after every step has finished or been skipped
+            (the report is available as self.report)
+        """
+        from opentelemetry import trace
+
+        tracer = trace.get_tracer(__name__)
+        steps: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        with tracer.start_as_current_span("foundry.startup") as span:
+            started = time.perf_counter()
+
+            async def run_step(name: str) -> Any:
+                step, depends_on = self._steps[name]
+                entry = {"status": "pending", "depends_on": list(depends_on)}
+                steps[name] = entry
+                # Dependencies were registered (and their tasks created) before this step
+                outcomes = await asyncio.gather(*(tasks[dep] for dep in depends_on), return_exceptions=True)
+                failed = [dep for dep, outcome in zip(depends_on, outcomes) if isinstance(outcome, Exception)]
+                if failed:
+                    entry["status"] = "skipped"
+                    entry["error"] = f"dependency failed: {', '.join(failed)}"
+                    raise StartupStepSkipped(entry["error"])
+
+                step_started = time.perf_counter()
+                entry["start_ms"] = round((step_started - started) * 1000, 1)
+                with tracer.start_as_current_span(f"foundry.startup.{name}"):
+                    try:
+                        result = await step()
+                        entry["status"] = "ok"
+                        return result
+                    except Exception as e:
+                        logger.error(f"Startup step {name} failed: {e}")
+                        entry["status"] = "error"
+                        entry["error"] = str(e)
+                        raise
+                    finally:
+                        entry["duration_ms"] = round((time.perf_counter() - step_started) * 1000, 1)
+
+            for name in self._steps:
+                tasks[name] = asyncio.create_task(run_step(name))
+            outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+            self.results = {
+                name: outcome for name, outcome in zip(tasks, outcomes) if not isinstance(outcome, Exception)
+            }
+            self.report = {
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                "critical_path": self._critical_path(steps),
+                "steps": steps,
+            }
+
+            span.set_attribute("startup.total_ms", self.report["total_ms"])
+            for name, entry in steps.items():
+                span.set_attribute(f"startup.{name}.status", entry["status"])
+                if "duration_ms" in entry:
+                    span.set_attribute(f"startup.{name}.duration_ms", entry["duration_ms"])
+                logger.info(
+                    f"Startup {name}: {entry['status']} "
+                    f"(start {entry.get('start_ms', '-')}ms, took {entry.get('duration_ms', '-')}ms)"
+                )
+            logger.info(
+                f"Startup completed in {self.report['total_ms']}ms "
+                f"(critical path: {' -> '.join(self.report['critical_path'])})"
+            )
+
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        root_errors = [error for error in errors if not isinstance(error, StartupStepSkipped)]
+        if errors:
+            raise (root_errors or errors)[0]
+        return self.report
+
+    def _critical_path(self, steps: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Chain of steps that determined the total startup time."""
+        def finish(name: str) -> float:
+            entry = steps.get(name, {})
+            return entry.get("start_ms", 0.0) + entry.get("duration_ms", 0.0)
+
+        if not steps:
+            return []
+        path = [max(steps, key=finish)]
+        while True:
+            _, depends_on = self._steps[path[-1]]
+            if not depends_on:
+                break
+            path.append(max(depends_on, key=finish))
+        return list(reversed(path))
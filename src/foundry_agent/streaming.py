@@ -0,0 +1,198 @@
+"""
+Streamed Foundry agent runs.
+
+runs.create_and_process polls the run status on a fixed interval and the answer
+is only read (messages.list) after the run finished. stream_run() opens a
+streamed run instead: text deltas and run-step (tool call) events arrive as the
+service produces them and are turned into StreamEvents by RunEventHandler.
+
+If a run produced no text deltas, final_text() reads the answer with one typed
+routine (message_text) from the completed message event, or as a last resort
+from the newest message of the run - messages.list with order=desc, limit=1 and
+run_id, so the fetch does not grow with the length of a reused thread. A run
+that failed or was cancelled is reported by run_error_text() ("Run failed: ...")
+as before streaming.
+
+Usage:
+    async for event in stream_run(project_client, thread.id, agent_id):
+        if event.type == "text":
+            print(event.text, end="")
+        elif event.type == "tool_call":
+            print(f"[{event.tool}: {event.status}]")
+"""
+
+import logging
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from azure.ai.agents.models import (
+    AsyncAgentEventHandler,
+    ListSortOrder,
+    MessageDeltaChunk,
+    MessageRole,
+    MessageStatus,
+    RunStep,
+    ThreadMessage,
+    ThreadRun,
+)
+from azure.ai.projects.aio import AIProjectClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamEvent:
+    """One event pushed to streaming callers."""
+    type: str  # "text" or "tool_call"
+    text: str = ""
+    tool: Optional[str] = None
+    status: Optional[str] = None
+    arguments: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if value not in (None, "")}
+
+
+def message_text(message: Optional[ThreadMessage]) -> str:
+    """Text of a thread message (all text parts, in order)."""
+    if message is None:
+        return ""
+    return "".join(part.text.value for part in message.text_messages if part.text and part.text.value)
+
+
+def _tool_name(tool_call: Any) -> str:
+    """Readable name of a run-step tool call (connected agent name, function name or tool type)."""
+    for attribute in ("connected_agent", "function"):
+        details = getattr(tool_call, attribute, None)
+        name = getattr(details, "name", None)
+        if name:
+            return name
+    return getattr(tool_call, "type", "tool")
+
+
+class RunEventHandler(AsyncAgentEventHandler[Optional[StreamEvent]]):
+    """Maps Foundry run events to StreamEvents and keeps the final run state."""
+
+    def __init__(self):
+        super().__init__()
+        self.run: Optional[ThreadRun] = None
+        self.message: Optional[ThreadMessage] = None  # last completed assistant message
+        self.error: Optional[str] = None
+        self._seen_steps: Set[Tuple[str, str]] = set()
+
+    async def on_message_delta(self, delta: MessageDeltaChunk) -> Optional[StreamEvent]:
+        text = delta.text
+        return StreamEvent(type="text", text=text) if text else None
+
+    async def on_thread_message(self, message: ThreadMessage) -> Optional[StreamEvent]:
+        if message.role == MessageRole.AGENT and message.status == MessageStatus.COMPLETED:
+            self.message = message
+        return None
+
+    async def on_thread_run(self, run: ThreadRun) -> Optional[StreamEvent]:
+        self.run = run
+        if run.status == "failed":
+            logger.error(f"Run failed: {run.last_error}")
+        return None
+
+    async def on_run_step(self, step: RunStep) -> Optional[StreamEvent]:
+        if step.type != "tool_calls" or (step.id, step.status) in self._seen_steps:
+            return None
+        # created and in_progress both report "in_progress" - emit each status once
+        self._seen_steps.add((step.id, step.status))
+        tool_calls = getattr(step.step_details, "tool_calls", None) or []
+        names = ", ".join(dict.fromkeys(_tool_name(tool_call) for tool_call in tool_calls)) or "tool"
+        return StreamEvent(type="tool_call", tool=names, status=step.status)
+
+    async def on_error(self, data: str) -> Optional[StreamEvent]:
+        self.error = data
+        logger.error(f"Run stream error: {data}")
+        return None
+
+
+async def stream_run(
+    project_client: AIProjectClient,
+    thread_id: str,
+    agent_id: str,
+    handler: Optional[RunEventHandler] = None
+) -> AsyncIterator[StreamEvent]:
+    """
+    Run an agent on a thread as a streamed run.
+
+    Args:
+        project_client: Async AIProjectClient
+        thread_id: Thread holding the user message
+        agent_id: Agent to run
+        handler: Optional handler to inspect run/error afterwards
+
+    Yields:
+        Text deltas and tool-call events, in arrival order
+    """
+    handler = handler or RunEventHandler()
+    async with await project_client.agents.runs.stream(
+        thread_id=thread_id, agent_id=agent_id, event_handler=handler
+    ) as stream:
+        async for _event_type, _event_data, event in stream:
+            if event is not None:
+                yield event
+
+
+async def latest_assistant_text(
+    project_client: AIProjectClient,
+    thread_id: str,
+    run_id: Optional[str] = None
+) -> str:
+    """
+    Text of the newest assistant message, fetching a single message.
+
+    Args:
+        project_client: Async AIProjectClient
+        thread_id: Thread the run executed on
+        run_id: Restrict to messages produced by this run
+
+    Returns:
+        Message text ("" if the newest message is not an assistant message)
+    """
+    messages = project_client.agents.messages.list(
+        thread_id=thread_id, run_id=run_id, order=ListSortOrder.DESCENDING, limit=1
+    )
+    # limit is the page size - stop after the first message instead of paging on
+    async for message in messages:
+        return message_text(message) if message.role == MessageRole.AGENT else ""
+    return ""
+
+
+async def final_text(project_client: AIProjectClient, thread_id: str, handler: RunEventHandler) -> str:
+    """
+    Answer of a finished run that streamed no text deltas.
+
+    Uses the completed message event, then the newest message of the run.
+    """
+    text = message_text(handler.message)
+    if text or handler.run is None or handler.run.status != "completed":
+        return text
+    logger.warning("Run streamed no text - reading the latest assistant message")
+    return await latest_assistant_text(project_client, thread_id, handler.run.id)
+
+
+def run_error_text(handler: RunEventHandler) -> str:
+    """
+    Error message for a run that ended without an answer.
+
+    Returns:
+        "Run failed: <last_error>" for a failed run ("Run cancelled"/"Run expired"/...
+        for other terminal states, the stream error if the run never reported a
+        state), "" if the run completed
+    """
+    run = handler.run
+    if run is None:
+        return f"Run failed: {handler.error}" if handler.error else ""
+    if run.status == "failed":
+        error_msg = "Run failed"
+        if getattr(run, "last_error", None):
+            error_msg = f"Run failed: {run.last_error}"
+        return error_msg
+    if run.status in ("cancelled", "expired", "incomplete"):
+        return f"Run {run.status}"
+    return ""
+
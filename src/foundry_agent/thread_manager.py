@@ -0,0 +1,361 @@
+"""
+Conversation thread reuse for the Foundry agents.
+
+Before, every run created a thread, added one message, ran and deleted the
+thread again in `finally` - two extra service round trips per request, and
+AgentRequest.thread_id was ignored so multi-turn context was lost.
+
+ThreadManager keeps the threads instead:
+- A caller-supplied thread_id is reused (verified once with threads.get, a
+  thread that no longer exists is replaced by a new one). Such adopted threads
+  belong to the caller (or another replica) and are never deleted here
+- Active threads are kept in a bounded LRU; the least recently used thread is
+  evicted when the cache is full, and threads idle for longer than
+  idle_seconds expire
+- Evicted/expired threads this service created are deleted by a background
+  task in batches, off the request path
+- Runs on the same thread are serialized (a thread allows one active run)
+- A request pins its thread from resolution until the response is sent, so the
+  thread id returned to the client is the one the run used
+
+Usage:
+    threads = ThreadManager.from_env(project_client)
+    async with threads.pinned(request.thread_id) as thread_id:
+        async with threads.lease(thread_id):  # inside the agent run
+            ...  # add message, run
+    await threads.close()  # on shutdown: live conversations are kept
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.core.exceptions import HttpResponseError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _ThreadEntry:
+    last_used: float
+    owned: bool  # created by this service (deleted on eviction) vs adopted from a caller
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    leases: int = 0
+    pins: int = 0
+
+    @property
+    def held(self) -> bool:
+        return bool(self.leases or self.pins)
+
+
+class ThreadManager:
+    """Bounded LRU of Foundry threads with idle expiry and background deletion."""
+
+    def __init__(
+        self,
+        project_client: AIProjectClient,
+        max_threads: int = 256,
+        idle_seconds: float = 900.0,
+        cleanup_interval_seconds: float = 60.0,
+        delete_concurrency: int = 8,
+    ):
+        """
+        Initialize the thread manager.
+
+        Args:
+            project_client: Async AIProjectClient instance
+            max_threads: Threads kept for reuse (0 = delete every created thread after its run)
+            idle_seconds: Threads unused for this long are forgotten (deleted if created here)
+            cleanup_interval_seconds: How often the background task sweeps idle threads
+            delete_concurrency: Thread deletions in flight per batch
+        """
+        self.project_client = project_client
+        self.max_threads = max(0, max_threads)
+        self.idle_seconds = idle_seconds
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self.delete_concurrency = max(1, delete_concurrency)
+
+        self._threads: "OrderedDict[str, _ThreadEntry]" = OrderedDict()
+        self._pending_delete: Set[str] = set()
+        self._deleted = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @classmethod
+    def from_env(cls, project_client: AIProjectClient) -> "ThreadManager":
+        """
+        Create a thread manager configured from environment variables.
+
+        Priority: Environment variable > Default fallback
+        """
+        return cls(
+            project_client,
+            max_threads=int(os.getenv("FOUNDRY_THREAD_CACHE_SIZE", "256")),
+            idle_seconds=float(os.getenv("FOUNDRY_THREAD_IDLE_SECONDS", "900")),
+            cleanup_interval_seconds=float(os.getenv("FOUNDRY_THREAD_CLEANUP_INTERVAL_SECONDS", "60")),
+            delete_concurrency=int(os.getenv("FOUNDRY_THREAD_DELETE_CONCURRENCY", "8")),
+        )
+
+    # ------------------------------------------------------------------
+    # Request path
+    # ------------------------------------------------------------------
+
+    async def resolve(self, thread_id: Optional[str] = None) -> str:
+        """
+        Return a usable thread id for a request.
+
+        Args:
+            thread_id: Caller-supplied thread id (None creates a new thread)
+
+        Returns:
+            The same thread id if it is tracked or still exists, otherwise a new one.
+            Not protected from eviction once the caller awaits again - use pin()
+            to hold it until the run starts
+        """
+        if thread_id and thread_id in self._threads:
+            self._touch(thread_id)
+            return thread_id
+
+        if thread_id and thread_id not in self._pending_delete:
+            # Not created by this replica (restart, other replica, caller) - verify once
+            try:
+                await self.project_client.agents.threads.get(thread_id)
+                self._track(thread_id, owned=False)
+                return thread_id
+            except HttpResponseError as e:
+                if e.status_code not in (400, 404):
+                    raise
+                logger.info(f"Thread {thread_id} not found - starting a new thread")
+
+        thread = await self.project_client.agents.threads.create()
+        self._track(thread.id, owned=True)
+        return thread.id
+
+    async def pin(self, thread_id: Optional[str] = None) -> str:
+        """
+        Resolve a thread and protect it from eviction until unpin().
+
+        Used by api_server between resolving the request's thread and the agent
+        run (which leases it again), e.g. for the whole lifetime of a streamed
+        response whose X-Thread-Id header is sent first.
+
+        Args:
+            thread_id: Caller-supplied thread id (None creates a new thread)
+
+        Returns:
+            Thread id (stays tracked until unpinned)
+        """
+        thread_id = await self.resolve(thread_id)
+        # No await between tracking in resolve() and here - the entry is still tracked
+        self._threads[thread_id].pins += 1
+        return thread_id
+
+    def unpin(self, thread_id: str):
+        """Release a pin taken by pin()."""
+        entry = self._threads.get(thread_id)
+        if entry is None:
+            return
+        entry.pins -= 1
+        self._release(thread_id, entry)
+
+    @asynccontextmanager
+    async def pinned(self, thread_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        pin() for the duration of a block.
+
+        Yields:
+            Thread id to pass to an agent run
+        """
+        thread_id = await self.pin(thread_id)
+        try:
+            yield thread_id
+        finally:
+            self.unpin(thread_id)
+
+    @asynccontextmanager
+    async def lease(self, thread_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Resolve a thread and hold it for one run.
+
+        Runs on the same thread wait for each other; a leased thread is never
+        evicted. Pass a pinned thread id to run on exactly that thread. With
+        max_threads=0 a created thread is deleted after the run (in the
+        background).
+
+        Args:
+            thread_id: Caller-supplied thread id (None creates a new thread)
+
+        Yields:
+            Thread id to add messages to and run on
+        """
+        thread_id = await self.resolve(thread_id)
+        # No await between tracking in resolve() and here - the entry is still tracked
+        entry = self._threads[thread_id]
+        entry.leases += 1
+        try:
+            async with entry.lock:
+                yield thread_id
+        finally:
+            entry.leases -= 1
+            self._release(thread_id, entry)
+
+    @asynccontextmanager
+    async def ephemeral(self) -> AsyncIterator[str]:
+        """
+        A new thread for one internal run (e.g. a sub-agent call), deleted in the
+        background afterwards. Pinned, not locked - the run itself takes the lease.
+
+        Yields:
+            Thread id to pass to an agent run
+        """
+        thread_id = await self.pin(None)
+        try:
+            yield thread_id
+        finally:
+            entry = self._threads[thread_id]
+            entry.pins -= 1
+            if not entry.held:
+                self._evict(thread_id)
+
+    def _release(self, thread_id: str, entry: _ThreadEntry):
+        """A lease or pin ended - apply max_threads now that the thread may be evictable."""
+        entry.last_used = time.monotonic()
+        if self.max_threads == 0 and not entry.held:
+            self._evict(thread_id)
+        else:
+            self._enforce_capacity()
+
+    def _track(self, thread_id: str, owned: bool) -> _ThreadEntry:
+        entry = self._threads.get(thread_id)
+        if entry is None:
+            entry = _ThreadEntry(last_used=time.monotonic(), owned=owned)
+            self._threads[thread_id] = entry
+            self._pending_delete.discard(thread_id)
+            self._ensure_cleanup_task()
+        self._touch(thread_id)
+        self._enforce_capacity(keep=thread_id)
+        return entry
+
+    def _touch(self, thread_id: str):
+        self._threads[thread_id].last_used = time.monotonic()
+        self._threads.move_to_end(thread_id)
+
+    def _enforce_capacity(self, keep: Optional[str] = None):
+        """Evict least recently used threads that are not leased or pinned (nor about to be)."""
+        excess = len(self._threads) - max(self.max_threads, 1)
+        if excess <= 0:
+            return
+        idle = [tid for tid, entry in self._threads.items() if not entry.held and tid != keep]
+        for thread_id in idle[:excess]:
+            self._evict(thread_id)
+
+    def _evict(self, thread_id: str):
+        """Forget a thread; threads created here are queued for background deletion."""
+        entry = self._threads.pop(thread_id, None)
+        if entry is None or not entry.owned:
+            # Adopted threads belong to the caller (or another replica) - never deleted here
+            return
+        self._pending_delete.add(thread_id)
+        self._ensure_cleanup_task()
+        self._wake.set()
+
+    # ------------------------------------------------------------------
+    # Background cleanup
+    # ------------------------------------------------------------------
+
+    def _ensure_cleanup_task(self):
+        # Started lazily - the manager may be created before the event loop runs
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        if self._closed or (self._cleanup_task and not self._cleanup_task.done()):
+            return
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    def _expire_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        expired = [tid for tid, entry in self._threads.items() if not entry.held and entry.last_used < cutoff]
+        for thread_id in expired:
+            if self._threads.pop(thread_id).owned:
+                self._pending_delete.add(thread_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} idle thread(s)")
+
+    async def _cleanup_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.cleanup_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                self._expire_idle()
+                await self._delete_pending()
+            except Exception as e:
+                logger.warning(f"Thread cleanup failed: {e}")
+
+    async def _delete_pending(self):
+        """Delete all queued threads as one concurrent batch."""
+        if not self._pending_delete:
+            return
+        batch: List[str] = list(self._pending_delete)
+        self._pending_delete.difference_update(batch)
+        semaphore = asyncio.Semaphore(self.delete_concurrency)
+
+        async def delete_one(thread_id: str):
+            async with semaphore:
+                try:
+                    await self.project_client.agents.threads.delete(thread_id)
+                    return True
+                except HttpResponseError as e:
+                    if e.status_code == 404:
+                        return True
+                    logger.warning(f"Failed to delete thread {thread_id}: {e}")
+                except Exception as e:
+                    logger.warning(f"Failed to delete thread {thread_id}: {e}")
+                return False
+
+        results = await asyncio.gather(*(delete_one(tid) for tid in batch))
+        self._deleted += sum(results)
+        logger.info(f"Deleted {sum(results)}/{len(batch)} thread(s)")
+
+    async def close(self):
+        """
+        Stop the background task and delete the threads already queued.
+
+        Tracked threads are live conversations that clients may resume with
+        thread_id after a restart or on another replica - they are not deleted
+        on shutdown. This is an accepted leak: no replica deletes them later
+        either (a replica that sees such a thread_id adopts it, and adopted
+        threads are never deleted), and idle expiry does not survive the
+        restart. At most max_threads threads are left per shutdown.
+        """
+        self._closed = True
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._cleanup_task = None
+        self._threads.clear()
+        await self._delete_pending()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thread cache counters (for /health)."""
+        return {
+            "active": len(self._threads),
+            "adopted": sum(1 for entry in self._threads.values() if not entry.owned),
+            "leased": sum(1 for entry in self._threads.values() if entry.leases),
+            "pinned": sum(1 for entry in self._threads.values() if entry.pins),
+            "pending_delete": len(self._pending_delete),
+            "deleted": self._deleted,
+            "max_threads": self.max_threads,
+            "idle_seconds": self.idle_seconds,
+        }
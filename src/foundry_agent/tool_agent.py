@@ -2,17 +2,27 @@
 Tool Agent - Uses MCP Server for various utility functions via Direct Client
 """
 
+import asyncio
 import logging
 import os
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 import json
 import httpx
 import re
 
-from azure.ai.projects import AIProjectClient
+from azure.ai.projects.aio import AIProjectClient
+
+from intent_matcher import match_intent
+from streaming import RunEventHandler, StreamEvent, final_text, run_error_text, stream_run
+from agent_registry import AgentRegistry
+from thread_manager import ThreadManager
 
 logger = logging.getLogger(__name__)
 
+# Start of a JSON object or array that may hold one or more tool calls
+_JSON_START_RE = re.compile(r"[\[{]")
+
 
 class MCPClient:
     """Direct MCP client for calling MCP server tools."""
@@ -257,17 +267,35 @@ class ToolAgent:
     """
 
     def __init__(
-        self, project_client: AIProjectClient, mcp_endpoint: Optional[str] = None
+        self,
+        project_client: AIProjectClient,
+        mcp_endpoint: Optional[str] = None,
+        max_concurrent_tool_calls: Optional[int] = None,
+        thread_manager: Optional[ThreadManager] = None,
+        registry: Optional[AgentRegistry] = None,
     ):
         """
         Initialize the Tool Agent.
 
         Args:
-            project_client: AIProjectClient instance
+            project_client: Async AIProjectClient instance
             mcp_endpoint: Optional MCP server endpoint (e.g., http://localhost:8000)
+            max_concurrent_tool_calls: Max MCP calls in flight for one turn
+                (default: MCP_MAX_CONCURRENT_CALLS or 4)
+            thread_manager: Shared ThreadManager (default: a private one configured from env)
+            registry: AgentRegistry to reuse an existing agent
+                (default: create a new one, delete on shutdown)
         """
         self.project_client = project_client
+        self.registry = registry or AgentRegistry(project_client, persistent=False)
+        self._owns_thread_manager = thread_manager is None
+        self.thread_manager = thread_manager or ThreadManager.from_env(project_client)
         self.mcp_endpoint = mcp_endpoint
+        self.max_concurrent_tool_calls = max(
+            1,
+            max_concurrent_tool_calls
+            or int(os.getenv("MCP_MAX_CONCURRENT_CALLS", "4")),
+        )
         self.agent_id: Optional[str] = None
         self.mcp_client: Optional[MCPClient] = None
 
@@ -288,14 +316,18 @@ TOOL: get_weather(location)
 
 RULES:
 1. ANY weather question → Return JSON: {"tool": "get_weather", "arguments": {"location": "CityName"}}
-2. Convert Korean city names to English (Seoul, Busan, Jeju)
-3. Return ONLY JSON for weather questions (no other text)
-4. Non-weather questions → Answer normally
+2. Several cities in one question → Return a JSON array with one call per city
+3. Convert Korean city names to English (Seoul, Busan, Jeju)
+4. Return ONLY JSON for weather questions (no other text)
+5. Non-weather questions → Answer normally
 
 EXAMPLES:
 Q: "Seoul weather"
 A: {"tool": "get_weather", "arguments": {"location": "Seoul"}}
 
+Q: "Weather in Seoul and Busan"
+A: [{"tool": "get_weather", "arguments": {"location": "Seoul"}}, {"tool": "get_weather", "arguments": {"location": "Busan"}}]
+
 Q: "Tell me Seoul's current weather. Include temperature, feels-like temperature, weather status, humidity, and wind information."
 A: {"tool": "get_weather", "arguments": {"location": "Seoul"}}
 
@@ -323,12 +355,11 @@ A: Hello! How can I help you?"""
                     raise Exception("MCP client initialization failed")
 
             # Create agent (no tools registered with Azure, we handle them directly)
-            agent = self.project_client.agents.create_agent(
-                model=self.model, name=self.name, instructions=self.instructions
+            # or reuse one with the same definition
+            self.agent_id = await self.registry.get_or_create(
+                name=self.name, model=self.model, instructions=self.instructions
             )
-
-            self.agent_id = agent.id
-            logger.info(f"Created {self.name}: {self.agent_id}")
+            logger.info(f"{self.name} ready: {self.agent_id}")
             return self.agent_id
 
         except Exception as e:
@@ -336,7 +367,7 @@ A: Hello! How can I help you?"""
             raise
 
     async def delete(self):
-        """Delete the agent from Azure AI Foundry and clean up resources."""
+        """Release the agent (deleted unless the registry is persistent) and clean up resources."""
         logger.info(f"Cleaning up {self.name}...")
 
         # Clean up MCP client first
@@ -347,10 +378,13 @@ A: Hello! How can I help you?"""
             except Exception as e:
                 logger.warning(f"Error cleaning up MCP client: {e}")
 
-        # Delete agent from Azure
+        if self._owns_thread_manager:
+            await self.thread_manager.close()
+
+        # Delete agent from Azure (a persistent registry keeps it for the next boot)
         if self.agent_id:
             try:
-                self.project_client.agents.delete_agent(self.agent_id)
+                await self.registry.release(self.agent_id)
                 self.agent_id = None
             except Exception as e:
                 logger.warning(f"Error deleting agent: {e}")
@@ -379,25 +413,65 @@ Use this agent whenever users ask about weather conditions in specific locations
         """Get the agent ID."""
         return self.agent_id
 
-    async def run(self, user_query: str) -> str:
+    async def run(self, user_query: str, thread_id: Optional[str] = None) -> str:
         """
         Run agent to execute user query.
 
         Args:
             user_query: User's input query
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
 
         Returns:
             Agent's response
         """
-        thread = None
+        parts = [
+            event.text
+            async for event in self.run_events(user_query, thread_id)
+            if event.type == "text"
+        ]
+        return "".join(parts)
+
+    async def run_stream(
+        self, user_query: str, thread_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run agent and stream the final answer as text deltas.
+
+        Args:
+            user_query: User's input query
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
+
+        Yields:
+            Text deltas of the agent's response
+        """
+        async for event in self.run_events(user_query, thread_id):
+            if event.type == "text":
+                yield event.text
+
+    async def run_events(
+        self, user_query: str, thread_id: Optional[str] = None
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Run agent as streamed Foundry runs.
+
+        The planning run is streamed but collected (its output is the tool-call
+        JSON), MCP calls are reported as tool_call events, and the formatting
+        run's text is forwarded as it is generated.
+
+        Args:
+            user_query: User's input query
+            thread_id: Optional thread ID for conversation continuity (reused across turns)
+
+        Yields:
+            Tool-call events and text deltas of the agent's response
+        """
+        from opentelemetry import trace
+
+        tracer = trace.get_tracer(__name__)
         try:
             # ========================================================================
             # 🔍 OpenTelemetry Span for Tool Agent Execution Tracing
             # ========================================================================
-            from opentelemetry import trace
-
-            tracer = trace.get_tracer(__name__)
-
             with tracer.start_as_current_span("tool_agent_run") as span:
                 # Gen AI semantic conventions
                 span.set_attribute("gen_ai.system", "azure_ai_agent")
@@ -406,257 +480,283 @@ Use this agent whenever users ask about weather conditions in specific locations
                 span.set_attribute("agent.id", self.agent_id)
                 span.set_attribute("agent.name", self.name)
                 span.set_attribute("agent.type", "tool_agent")
+                started = time.perf_counter()
 
-                # Create thread
-                thread = self.project_client.agents.threads.create()
-                span.set_attribute("thread.id", thread.id)
-
-                # Check if this is a weather-related query
-                weather_keywords = [
-                    "weather",
-                    "temperature",
-                    "temp",
-                    "forecast",
-                    "climate",
-                    "humidity",
-                    "wind",
-                    "rain",
-                    "snow",
-                ]
-                is_weather_query = any(
-                    keyword in user_query.lower() for keyword in weather_keywords
-                )
+                # Reuse the caller's thread (or a new one); cleanup happens in the background
+                async with self.thread_manager.lease(thread_id) as thread_id:
+                    span.set_attribute("thread.id", thread_id)
 
-                # If weather query, add explicit JSON instruction to the message
-                if is_weather_query and self.mcp_client:
-                    enhanced_message = f"""{user_query}
+                    response_text, tool_calls = await self._plan(thread_id, user_query, span)
 
-[IMPORTANT: Return tool call in JSON format: {{"tool": "get_weather", "arguments": {{"location": "CityName"}}}}]"""
-                else:
-                    enhanced_message = user_query
+                    # No tool call, return LLM response directly
+                    if not tool_calls:
+                        span.set_attribute(
+                            "gen_ai.response.time_to_first_token_ms",
+                            (time.perf_counter() - started) * 1000,
+                        )
+                        yield StreamEvent(type="text", text=response_text)
+                        return
+
+                    for tool_call in tool_calls:
+                        yield StreamEvent(
+                            type="tool_call",
+                            tool=tool_call["tool"],
+                            status="in_progress",
+                            arguments=tool_call["arguments"],
+                        )
 
-                # Add user message
-                self.project_client.agents.messages.create(
-                    thread_id=thread.id, role="user", content=enhanced_message
-                )
+                    # Call all requested MCP tools concurrently
+                    tool_results = await self._call_tools(tool_calls)
 
-                # Create and process run
-                run = self.project_client.agents.runs.create_and_process(
-                    thread_id=thread.id, agent_id=self.agent_id
-                )
-                span.set_attribute("run.id", run.id)
-                span.set_attribute("run.status", run.status)
-
-            # Check for errors
-            if run.status == "failed":
-                error_msg = "Run failed"
-                if hasattr(run, "last_error") and run.last_error:
-                    logger.error(f"Run failed: {run.last_error}")
-                    error_msg = f"Run failed: {run.last_error}"
-                return error_msg
-
-            # Get the LLM's response
-            messages = self.project_client.agents.messages.list(thread_id=thread.id)
-
-            response_text = None
-            for m in messages:
-                role = (
-                    m.get("role")
-                    if isinstance(m, dict)
-                    else getattr(m, "role", "unknown")
-                )
+                    for tool_name, arguments, tool_result in tool_results:
+                        failed = isinstance(tool_result, dict) and "error" in tool_result
+                        yield StreamEvent(
+                            type="tool_call",
+                            tool=tool_name,
+                            status="failed" if failed else "completed",
+                            arguments=arguments,
+                        )
+
+                    format_prompt, fallback_text = self._format_prompt(tool_results)
 
-                if role == "assistant":
-                    content_items = (
-                        m.get("content", [])
-                        if isinstance(m, dict)
-                        else getattr(m, "content", [])
+                    # Add tool result as a user message
+                    await self.project_client.agents.messages.create(
+                        thread_id=thread_id, role="user", content=format_prompt
                     )
 
-                    for item in content_items:
-                        if isinstance(item, dict) and "text" in item:
-                            text_value = item["text"]
-                            if isinstance(text_value, dict) and "value" in text_value:
-                                response_text = text_value["value"]
-                            else:
-                                response_text = str(text_value)
-                            break
-                        elif hasattr(item, "text"):
-                            text_obj = item.text
-                            if hasattr(text_obj, "value"):
-                                response_text = text_obj.value
-                            else:
-                                response_text = str(text_obj)
-                            break
+                    # Stream the formatting run instead of polling it to completion
+                    handler = RunEventHandler()
+                    response_length = 0
+                    async for event in stream_run(
+                        self.project_client, thread_id, self.agent_id, handler
+                    ):
+                        if event.type != "text":
+                            continue
+
+                        if response_length == 0:
+                            span.set_attribute(
+                                "gen_ai.response.time_to_first_token_ms",
+                                (time.perf_counter() - started) * 1000,
+                            )
+                        response_length += len(event.text)
+                        yield event
 
-                if response_text:
-                    # Log output to span for Tracing UI
-                    span.set_attribute("gen_ai.completion", response_text)
-                    span.set_attribute("gen_ai.response.finish_reason", "stop")
-                    break
+                    if response_length == 0:
+                        text = await final_text(self.project_client, thread_id, handler)
+                        if text:
+                            response_length = len(text)
+                            yield StreamEvent(type="text", text=text)
 
-            if not response_text:
-                logger.warning("No assistant response found")
-                return "No response generated"
+                    # Fallback: return raw tool result if formatting failed
+                    if response_length == 0:
+                        logger.warning(
+                            "Failed to get formatted response - returning raw tool result"
+                        )
+                        response_length = len(fallback_text)
+                        yield StreamEvent(type="text", text=fallback_text)
 
-            # Check if LLM wants to call a tool
-            if self.mcp_client:
-                tool_call = self._parse_tool_call(response_text)
+                    span.set_attribute("gen_ai.response.length", response_length)
 
-                if tool_call:
-                    tool_name = tool_call["tool"]
-                    arguments = tool_call["arguments"]
+        except Exception as e:
+            logger.error(f"Error: {e}", exc_info=True)
+            raise
 
-                    logger.info(f"LLM requested tool: {tool_name}")
+    async def _plan(
+        self, thread_id: str, user_query: str, span
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Run the planning step (streamed run, collected).
 
-                    # Call the MCP tool directly
-                    tool_result = await self.mcp_client.call_tool(tool_name, arguments)
+        Args:
+            thread_id: Thread to run in
+            user_query: User's input query
+            span: Current run span for Gen AI attributes
 
-                    # Parse tool result (handle both dict and string)
-                    if isinstance(tool_result, dict):
-                        result_str = json.dumps(
-                            tool_result, ensure_ascii=False, indent=2
-                        )
-                    else:
-                        result_str = str(tool_result)
+        Returns:
+            (response_text, tool_calls). tool_calls is empty when the model
+            answered directly (or the run failed) - response_text is the answer.
+        """
+        # Check if this is a weather-related query
+        is_weather_query = match_intent(user_query).has("weather")
 
-                    # ====================================================================
-                    # IMPORTANT: Send tool result back to LLM for proper formatting
-                    # ====================================================================
+        # If weather query, add explicit JSON instruction to the message
+        if is_weather_query and self.mcp_client:
+            enhanced_message = f"""{user_query}
 
-                    # Create formatting prompt (same as Agent Framework)
-                    format_prompt = f"""Tool '{tool_name}' returned the following result. Please present this ACTUAL data to the user in a clear, friendly format. DO NOT use placeholders:
+[IMPORTANT: Return tool call in JSON format: {{"tool": "get_weather", "arguments": {{"location": "CityName"}}}} (use a JSON array of these for several cities)]"""
+        else:
+            enhanced_message = user_query
+
+        # Add user message
+        await self.project_client.agents.messages.create(
+            thread_id=thread_id, role="user", content=enhanced_message
+        )
+
+        # Streamed run: the answer is complete as soon as the run ends (no poll interval)
+        handler = RunEventHandler()
+        parts = [
+            event.text
+            async for event in stream_run(self.project_client, thread_id, self.agent_id, handler)
+            if event.type == "text"
+        ]
+        response_text = "".join(parts) or await final_text(self.project_client, thread_id, handler)
+        if handler.run:
+            span.set_attribute("run.id", handler.run.id)
+            span.set_attribute("run.status", handler.run.status)
+
+        # Failed/cancelled/expired run - report its error instead of a partial or empty answer
+        if not response_text or (handler.run and handler.run.status != "completed"):
+            error_msg = run_error_text(handler)
+            if error_msg:
+                span.set_attribute("error.message", error_msg)
+                return error_msg, []
+
+        if not response_text:
+            logger.warning("No assistant response found")
+            return "No response generated", []
+
+        # Log output to span for Tracing UI
+        span.set_attribute("gen_ai.completion", response_text)
+        span.set_attribute("gen_ai.response.finish_reason", "stop")
+
+        # Check if LLM wants to call one or more tools
+        tool_calls = self._parse_tool_calls(response_text) if self.mcp_client else []
+        if tool_calls:
+            logger.info(
+                f"LLM requested {len(tool_calls)} tool call(s): "
+                f"{[tc['tool'] for tc in tool_calls]}"
+            )
+        return response_text, tool_calls
+
+    def _format_prompt(
+        self, tool_results: List[Tuple[str, Dict[str, Any], Any]]
+    ) -> Tuple[str, str]:
+        """
+        Build the formatting prompt for tool results.
+
+        Returns:
+            (format_prompt, fallback_text) - fallback_text is the raw tool
+            output to return if formatting fails
+        """
+        # Parse tool results (handle both dict and string)
+        result_str = self._format_tool_results(tool_results)
+        tool_name = ", ".join(dict.fromkeys(name for name, _, _ in tool_results))
+
+        # ====================================================================
+        # IMPORTANT: Send tool result back to LLM for proper formatting
+        # ====================================================================
+
+        # Create formatting prompt (same as Agent Framework)
+        if len(tool_results) == 1:
+            format_prompt = f"""Tool '{tool_name}' returned the following result. Please present this ACTUAL data to the user in a clear, friendly format. DO NOT use placeholders:
 
 {result_str}
 
 Present the data clearly with all details."""
+        else:
+            format_prompt = f"""Tools '{tool_name}' were called {len(tool_results)} times and returned the following results. Please present ALL of this ACTUAL data to the user in a clear, friendly format. DO NOT use placeholders:
 
-                    # Add tool result as a user message
-                    self.project_client.agents.messages.create(
-                        thread_id=thread.id, role="user", content=format_prompt
-                    )
-
-                    # Run LLM again to format the tool result
-                    run2 = self.project_client.agents.runs.create_and_process(
-                        thread_id=thread.id, agent_id=self.agent_id
-                    )
+{result_str}
 
-                    # Get the formatted response
-                    messages2 = self.project_client.agents.messages.list(
-                        thread_id=thread.id
-                    )
+Present the data clearly with all details for every result."""
 
-                    messages_list = list(messages2)
+        if tool_name == "get_weather":
+            fallback_text = f"Weather Information:\n{result_str}"
+        else:
+            fallback_text = result_str
 
-                    formatted_response = None
-                    # Get the FIRST (most recent) assistant message
-                    for m in messages_list:
-                        role = (
-                            m.get("role")
-                            if isinstance(m, dict)
-                            else getattr(m, "role", "unknown")
-                        )
+        return format_prompt, fallback_text
 
-                        if role == "assistant":
-                            content_items = (
-                                m.get("content", [])
-                                if isinstance(m, dict)
-                                else getattr(m, "content", [])
-                            )
+    async def _call_tools(
+        self, tool_calls: List[Dict[str, Any]]
+    ) -> List[Tuple[str, Dict[str, Any], Any]]:
+        """
+        Call several MCP tools concurrently, bounded by max_concurrent_tool_calls.
 
-                            for item in content_items:
-                                if isinstance(item, dict) and "text" in item:
-                                    text_value = item["text"]
-                                    if (
-                                        isinstance(text_value, dict)
-                                        and "value" in text_value
-                                    ):
-                                        formatted_response = text_value["value"]
-                                    else:
-                                        formatted_response = str(text_value)
-                                    break
-                                elif hasattr(item, "text"):
-                                    text_obj = item.text
-                                    if hasattr(text_obj, "value"):
-                                        formatted_response = text_obj.value
-                                    else:
-                                        formatted_response = str(text_obj)
-                                    break
-
-                            if formatted_response:
-                                return formatted_response
+        Args:
+            tool_calls: Parsed tool calls ({"tool": ..., "arguments": {...}})
 
-                    # Fallback: return raw tool result if formatting failed
-                    logger.warning(
-                        "Failed to get formatted response - returning raw tool result"
-                    )
-                    if tool_name == "get_weather":
-                        return f"Weather Information:\n{result_str}"
-                    return result_str
+        Returns:
+            List of (tool_name, arguments, result) in the same order as tool_calls.
+            A failed call yields {"error": ...} instead of failing the whole batch.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_tool_calls)
 
-            # No tool call, return LLM response directly
-            return response_text
+        async def call_one(tool_call: Dict[str, Any]):
+            tool_name = tool_call["tool"]
+            arguments = tool_call["arguments"]
 
-        except Exception as e:
-            logger.error(f"Error: {e}", exc_info=True)
-            raise
-        finally:
-            # Clean up thread
-            if thread:
+            async with semaphore:
                 try:
-                    self.project_client.agents.threads.delete(thread.id)
-                except Exception as cleanup_error:
-                    logger.warning(f"Thread cleanup failed: {cleanup_error}")
+                    tool_result = await self.mcp_client.call_tool(tool_name, arguments)
+                except Exception as e:
+                    logger.error(f"MCP tool {tool_name} failed: {e}")
+                    tool_result = {"error": str(e)}
+
+            return tool_name, arguments, tool_result
+
+        return list(await asyncio.gather(*(call_one(tc) for tc in tool_calls)))
+
+    def _format_tool_results(
+        self, tool_results: List[Tuple[str, Dict[str, Any], Any]]
+    ) -> str:
+        """Format one or more tool results for the formatting LLM call."""
+        formatted = []
 
-    def _parse_tool_call(self, response: str) -> Optional[Dict[str, Any]]:
+        for tool_name, arguments, tool_result in tool_results:
+            if isinstance(tool_result, dict):
+                result_str = json.dumps(tool_result, ensure_ascii=False, indent=2)
+            else:
+                result_str = str(tool_result)
+
+            if len(tool_results) > 1:
+                args_str = json.dumps(arguments, ensure_ascii=False)
+                result_str = f"[{tool_name} {args_str}]\n{result_str}"
+
+            formatted.append(result_str)
+
+        return "\n\n".join(formatted)
+
+    def _parse_tool_calls(self, response: str) -> List[Dict[str, Any]]:
         """
-        Parse tool call from LLM response.
+        Parse all tool calls from LLM response.
+
+        Accepts a single {"tool": ..., "arguments": {...}} object, a JSON array
+        of such objects, or several objects embedded in the response text.
 
         Args:
             response: LLM response text
 
         Returns:
-            Dict with 'tool' and 'arguments' keys, or None if no tool call
+            List of dicts with 'tool' and 'arguments' keys (empty if no tool call)
         """
-        try:
-            # First try: parse entire response as JSON
-            response_stripped = response.strip()
-            if response_stripped.startswith("{") and response_stripped.endswith("}"):
-                tool_call = json.loads(response_stripped)
-                if "tool" in tool_call and "arguments" in tool_call:
-                    logger.info(f"[parse] Found tool call: {tool_call}")
-                    return tool_call
-
-            # Second try: find JSON pattern in response
-            # Look for {"tool": "...", "arguments": {...}}
-            json_match = re.search(
-                r'\{[^}]*"tool"[^}]*"arguments"[^}]*\}', response, re.DOTALL
-            )
-            if json_match:
-                json_str = json_match.group(0)
-                # Try to balance braces for nested objects
-                brace_count = 0
-                end_pos = 0
-                for i, char in enumerate(json_str):
-                    if char == "{":
-                        brace_count += 1
-                    elif char == "}":
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end_pos = i + 1
-                            break
+        tool_calls: List[Dict[str, Any]] = []
+        decoder = json.JSONDecoder()
+        pos = 0
+
+        while True:
+            match = _JSON_START_RE.search(response, pos)
+            if not match:
+                break
 
-                if end_pos > 0:
-                    json_str = json_str[:end_pos]
+            try:
+                value, end_pos = decoder.raw_decode(response, match.start())
+            except json.JSONDecodeError:
+                pos = match.start() + 1
+                continue
 
-                tool_call = json.loads(json_str)
+            candidates = value if isinstance(value, list) else [value]
+            for candidate in candidates:
+                if (
+                    isinstance(candidate, dict)
+                    and "tool" in candidate
+                    and isinstance(candidate.get("arguments"), dict)
+                ):
+                    tool_calls.append(candidate)
 
-                if "tool" in tool_call and "arguments" in tool_call:
-                    logger.info(f"[parse] Found tool call: {tool_call}")
-                    return tool_call
+            pos = end_pos
 
-            return None
+        if tool_calls:
+            logger.info(f"[parse] Found {len(tool_calls)} tool call(s): {tool_calls}")
 
-        except Exception as e:
-            logger.debug(f"[parse] No tool call found in response: {e}")
-            return None
+        return tool_calls